@@ -1,25 +1,38 @@
-from flask import Flask, jsonify, request, redirect
+import os
+from flask import Flask, jsonify, request, redirect, Response
 from flask_cors import CORS
 from config import Config
 from auth.microsoft_oauth import iniciar_login, manejar_callback
 from auth.jwt_handler import generar_jwt, verificar_jwt
 from database.supabase_client import supabase
+from database.supabase_pool import pool_stats
+from pedidos.cache import get_lecturas_cache
 from usuarios.usuarios import usuarios_bp
 from pedidos.pedidos import pedidos_bp
 from productos.productos import productos_bp
 from utils.error_handler import register_error_handlers, respuesta_error
 from ocr.src.ocr import get_ocr_runtime_info
+from ocr.src.jobs import OCR_QUEUE_EMBEDDED, get_job_queue
+from ocr.src.metrics import render_prometheus
+
+# Si se define, /metrics exige `Authorization: Bearer <METRICS_TOKEN>`
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
 
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max (firmas + PDFs)
 register_error_handlers(app)
-CORS(app, origins=[Config.FRONTEND_URL])
+CORS(app, origins=[Config.FRONTEND_URL], expose_headers=['X-Next-Cursor'])
 
 app.register_blueprint(usuarios_bp)
 app.register_blueprint(pedidos_bp)
 app.register_blueprint(productos_bp)
 
+# El OCR lo hace `python -m ocr.worker`; en desarrollo se puede consumir la cola aquí mismo
+if OCR_QUEUE_EMBEDDED:
+    from ocr.worker import start_embedded
+    start_embedded()
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "ok"}),200
@@ -30,6 +43,36 @@ def health_ocr():
     status_code = 200 if info.get('tesseract_found') and not info.get('missing_langs') else 500
     return jsonify(info), status_code
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Tramos y contadores del OCR de todos los procesos (web, worker y pool), formato Prometheus
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return respuesta_error("No autenticado", 401)
+
+    gauges = {}
+    try:
+        for estado, n in get_job_queue().stats().items():
+            gauges[('ocr_jobs', (('estado', estado),))] = n
+    except Exception as e:
+        print(f"[METRICS][ERROR] leyendo la cola de OCR: {e}")
+
+    # Pool HTTP de Supabase de este proceso (las conexiones no se suman entre procesos)
+    pool = pool_stats()
+    gauges[('supabase_http_conexiones', (('estado', 'abiertas'),))] = pool['conexiones']
+    gauges[('supabase_http_conexiones', (('estado', 'ociosas'),))] = pool['ociosas']
+    gauges[('supabase_http_conexiones', (('estado', 'http2'),))] = pool['http2']
+    gauges[('supabase_http_peticiones', (('resultado', 'total'),))] = pool['peticiones']
+    gauges[('supabase_http_peticiones', (('resultado', 'error'),))] = pool['errores']
+
+    # Caché de lecturas de pedidos de este proceso
+    cache = get_lecturas_cache().stats()
+    gauges[('pedidos_cache_consultas', (('resultado', 'hit'),))] = cache['hits']
+    gauges[('pedidos_cache_consultas', (('resultado', 'miss'),))] = cache['misses']
+    gauges[('pedidos_cache_entradas', ())] = cache['entries']
+    gauges[('pedidos_cache_invalidaciones', ())] = cache['invalidations']
+
+    return Response(render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/login', methods=['GET'])
 def login():
     return iniciar_login()
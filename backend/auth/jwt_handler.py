@@ -27,9 +27,38 @@ def verificar_jwt(token):
     """Verifica si un JWT es válido y devuelve los datos"""
     try:
         payload = jwt.decode(token, Config.JWT_SECRET, algorithms=[Config.JWT_ALGORITHM])
-        return payload
     except JWTError:
         return None
+    # Los tokens de un solo uso (ver generar_token_stream) no valen como sesión
+    if payload.get('proposito'):
+        return None
+    return payload
+
+
+def generar_token_stream(pedido_id, user_id):
+    """
+    Token corto para el stream de progreso del OCR de un pedido. EventSource no
+    permite cabeceras y va en la URL (queda en los logs de acceso): solo sirve
+    para ese pedido, para ese stream y durante OCR_STREAM_TOKEN_SEC.
+    """
+    payload = {
+        'proposito': 'ocr_stream',
+        'pedido_id': str(pedido_id),
+        'user_id': user_id,
+        'exp': datetime.utcnow() + timedelta(seconds=Config.OCR_STREAM_TOKEN_SEC)
+    }
+    return jwt.encode(payload, Config.JWT_SECRET, algorithm=Config.JWT_ALGORITHM)
+
+
+def verificar_token_stream(token, pedido_id):
+    """Verifica un token de generar_token_stream para ese pedido; devuelve los datos o None"""
+    try:
+        payload = jwt.decode(token, Config.JWT_SECRET, algorithms=[Config.JWT_ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get('proposito') != 'ocr_stream' or payload.get('pedido_id') != str(pedido_id):
+        return None
+    return payload
     
 def requiere_admin(funcion):
     @wraps(funcion)
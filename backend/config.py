@@ -15,6 +15,8 @@ class Config:
     JWT_SECRET = os.getenv('JWT_SECRET')
     JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
     JWT_EXPIRATION_HOURS = int(os.getenv('JWT_EXPIRATION_HOURS', 24))
+    # Validez del token del stream de progreso del OCR (el navegador lo reutiliza al reconectar)
+    OCR_STREAM_TOKEN_SEC = int(os.getenv('OCR_STREAM_TOKEN_SEC', 600))
     
     # Supabase
     SUPABASE_URL = os.getenv('SUPABASE_URL')
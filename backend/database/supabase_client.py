@@ -1,4 +1,5 @@
-from supabase import create_client, Client
-from config import Config
+from supabase import Client
+from database.supabase_pool import get_client
 
-supabase: Client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
\ No newline at end of file
+# Cliente con la clave anónima, sobre el pool HTTP compartido (ver supabase_pool.py)
+supabase: Client = get_client()
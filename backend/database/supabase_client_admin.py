@@ -1,11 +1,8 @@
 # supabase_admin_client.py
 # Este cliente de Supabase utiliza la clave de servicio (service role key) para tener permisos de administrador.
 # Se usa para operaciones que requieren permisos elevados, como subir archivos a Storage o modificar datos sensibles.
+# Comparte el pool HTTP del proceso con el cliente anónimo (ver supabase_pool.py).
 
-from supabase import create_client
-from config import Config
+from database.supabase_pool import get_client
 
-supabase_admin = create_client(
-    Config.SUPABASE_URL,
-    Config.SUPABASE_SERVICE_ROLE_KEY
-)
\ No newline at end of file
+supabase_admin = get_client(admin=True)
@@ -0,0 +1,127 @@
+# supabase_pool.py
+# Fábrica de clientes de Supabase que comparten un único pool HTTP (httpx, HTTP/2 y
+# keep-alive) por proceso. Antes cada módulo creaba su cliente con su propio pool y
+# cada consulta con el token del usuario levantaba un cliente nuevo (y una conexión
+# TLS nueva); ahora todos reutilizan las mismas conexiones.
+
+import os
+import threading
+
+import httpx
+from postgrest import SyncPostgrestClient
+from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
+
+from config import Config
+
+# HTTP/2 multiplexa las consultas concurrentes sobre pocas conexiones (requiere el paquete h2)
+SUPABASE_HTTP2 = os.getenv('SUPABASE_HTTP2', '1').strip().lower() in ('1', 'true', 'yes', 'on')
+# Conexiones máximas del pool y cuántas se mantienen abiertas en reposo
+SUPABASE_POOL_MAX = int(os.getenv('SUPABASE_POOL_MAX', '20'))
+SUPABASE_POOL_KEEPALIVE = int(os.getenv('SUPABASE_POOL_KEEPALIVE', '10'))
+# Segundos que una conexión ociosa sigue abierta
+SUPABASE_POOL_KEEPALIVE_SEC = float(os.getenv('SUPABASE_POOL_KEEPALIVE_SEC', '60'))
+# Timeout de cada petición (subidas de PDF a Storage incluidas)
+SUPABASE_TIMEOUT_SEC = float(os.getenv('SUPABASE_TIMEOUT_SEC', '60'))
+
+_lock = threading.Lock()
+_http = None
+_http_pid = None
+_clientes = {}
+_peticiones = {'total': 0, 'errores': 0}
+
+
+def _contar_peticion(request):
+    _peticiones['total'] += 1
+
+
+def _contar_respuesta(response):
+    if response.status_code >= 500:
+        _peticiones['errores'] += 1
+
+
+def get_http_client():
+    """
+    Cliente httpx compartido del proceso. Se crea la primera vez que se pide y
+    de nuevo tras un fork (gunicorn, worker de OCR): las conexiones abiertas no
+    se pueden compartir entre procesos.
+    """
+    global _http, _http_pid
+    with _lock:
+        if _http is None or _http_pid != os.getpid():
+            _http = httpx.Client(
+                http2=SUPABASE_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=SUPABASE_POOL_MAX,
+                    max_keepalive_connections=SUPABASE_POOL_KEEPALIVE,
+                    keepalive_expiry=SUPABASE_POOL_KEEPALIVE_SEC,
+                ),
+                timeout=SUPABASE_TIMEOUT_SEC,
+                follow_redirects=True,
+                event_hooks={'request': [_contar_peticion], 'response': [_contar_respuesta]},
+            )
+            _http_pid = os.getpid()
+            _clientes.clear()
+        return _http
+
+
+def get_client(admin=False) -> Client:
+    """
+    Cliente de Supabase del proceso sobre el pool compartido: con la clave anónima
+    o, con admin=True, con la service role key (salta RLS).
+    """
+    http = get_http_client()
+    clave = 'admin' if admin else 'anon'
+    with _lock:
+        if clave not in _clientes:
+            key = Config.SUPABASE_SERVICE_ROLE_KEY if admin else Config.SUPABASE_KEY
+            _clientes[clave] = create_client(
+                Config.SUPABASE_URL, key, options=SyncClientOptions(httpx_client=http)
+            )
+        return _clientes[clave]
+
+
+def cliente_usuario(token) -> SyncPostgrestClient:
+    """
+    Cliente de PostgREST con el JWT del usuario, para que se apliquen las políticas
+    de Row Level Security. Es un objeto ligero que solo lleva las cabeceras: las
+    peticiones van por el pool compartido, sin cliente de Supabase ni conexión
+    nueva por petición. Se usa como `cliente_usuario(token).from_("pedidos")...`.
+    """
+    url = f"{Config.SUPABASE_URL.rstrip('/')}/rest/v1"
+    return SyncPostgrestClient(
+        url,
+        headers={
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'apiKey': Config.SUPABASE_KEY,
+            'Authorization': f"Bearer {token}",
+        },
+        http_client=get_http_client(),
+    )
+
+
+def pool_stats():
+    """
+    Estado del pool del proceso actual para /metrics.
+
+    Returns:
+        Dict con 'conexiones' (abiertas), 'ociosas', 'http2' (conexiones HTTP/2),
+        'peticiones' y 'errores' (respuestas 5xx) desde que arrancó el proceso
+    """
+    stats = {'conexiones': 0, 'ociosas': 0, 'http2': 0,
+             'peticiones': _peticiones['total'], 'errores': _peticiones['errores']}
+    if _http is None or _http_pid != os.getpid():
+        return stats
+    # httpx no expone el pool; se lee el de httpcore que hay debajo
+    pool = getattr(getattr(_http, '_transport', None), '_pool', None)
+    for conexion in list(getattr(pool, 'connections', [])):
+        stats['conexiones'] += 1
+        try:
+            if conexion.is_idle():
+                stats['ociosas'] += 1
+            if 'HTTP/2' in conexion.info():
+                stats['http2'] += 1
+        except Exception:
+            pass
+    return stats
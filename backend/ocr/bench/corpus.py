@@ -0,0 +1,318 @@
+"""
+Corpus sintético de albaranes con verdad de referencia, para ocr.bench.pipeline.
+
+Tres tipos de documento, los que distingue extract_albaran_data:
+    lonja      ticket de lonja portugués (Lote / Cxs / Especie / Peso / Preco / Val.Pesc.)
+    comercial  albarán comercial español (código de 6 dígitos, cantidad, precio, IVA)
+    packing    packing list inglés (bloques por producto con CTNS y KGS)
+
+y cuatro variantes de cada uno:
+    clean      PDF vectorial tal como lo genera reportlab
+    noisy      escaneado a 200 DPI con papel gris, ruido, motas y JPEG
+    rotated    escaneado girado 90/180/270° con una ligera inclinación
+    scan       escaneado de 1 a 10 páginas
+
+Todo sale de un random.Random(seed): la misma semilla produce el mismo corpus.
+
+Uso (desde backend/):
+    python -m ocr.bench.corpus --out /tmp/corpus
+"""
+import argparse
+import io
+import json
+import random
+from pathlib import Path
+
+import fitz
+import numpy as np
+from PIL import Image
+
+KINDS = ('lonja', 'comercial', 'packing')
+VARIANTS = ('clean', 'noisy', 'rotated', 'scan')
+SCAN_DPI = 200
+MANIFEST = 'manifest.json'
+
+_LONJA_SPECIES = (
+    'PESCADA', 'CARAPAU', 'SARDINHA', 'CAVALA', 'POLVO', 'LINGUADO', 'TAMBORIL',
+    'CONGRO', 'SALMONETE', 'FANECA', 'RAIA', 'CHOCO',
+)
+_COMERCIAL_ITEMS = (
+    'MERLUZA FRESCA', 'GAMBA ROJA', 'LUBINA RACION', 'DORADA RACION', 'PULPO COCIDO',
+    'CALAMAR LIMPIO', 'SEPIA GRANDE', 'BACALADILLA', 'JUREL', 'RAPE COLAS',
+)
+_PACKING_ITEMS = (
+    ('IQF LIGHT SALTED PACIFIC COD', 'GADUS MACROCEPHALUS'),
+    ('IQF LIGHT SALTED SAITHE', 'POLLACHIUS VIRENS'),
+    ('FROZEN GIGAS SQUID TUBE', 'DOSIDICUS GIGAS'),
+    ('IQF GIGAS SQUID RING', 'DOSIDICUS GIGAS'),
+)
+
+
+def generate_corpus(out_dir, seed=2024, docs_per_variant=1, max_pages=10, kinds=KINDS, variants=VARIANTS):
+    """
+    Genera el corpus en `out_dir` y escribe manifest.json con, por documento,
+    'file', 'kind', 'variant', 'pages' y 'productos' (lo que debería extraerse).
+
+    Returns:
+        El manifest como dict
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    docs = []
+
+    for kind in kinds:
+        for variant in variants:
+            for n in range(docs_per_variant):
+                pages = rng.randint(1, max(1, max_pages)) if variant == 'scan' else 1
+                productos = [_BUILDERS[kind][0](rng) for _ in range(pages * rng.randint(8, 14))]
+                name = f"{kind}_{variant}_{n + 1}.pdf"
+                vector = _BUILDERS[kind][1](productos, pages, rng)
+                if variant == 'clean':
+                    pdf_bytes = vector
+                else:
+                    pdf_bytes = _scan(vector, variant, rng)
+                (out_dir / name).write_bytes(pdf_bytes)
+                docs.append({
+                    'file': name,
+                    'kind': kind,
+                    'variant': variant,
+                    'pages': pages,
+                    'productos': [_truth(kind, p) for p in productos],
+                })
+
+    manifest = {'seed': seed, 'docs_per_variant': docs_per_variant, 'max_pages': max_pages, 'docs': docs}
+    (out_dir / MANIFEST).write_text(json.dumps(manifest, ensure_ascii=False, indent=1))
+    return manifest
+
+
+def load_or_generate(out_dir, seed=2024, docs_per_variant=1, max_pages=10, kinds=KINDS, variants=VARIANTS):
+    """Reutiliza el corpus de `out_dir` si se generó con los mismos parámetros."""
+    path = Path(out_dir) / MANIFEST
+    if path.exists():
+        manifest = json.loads(path.read_text())
+        if (
+            manifest.get('seed') == seed
+            and manifest.get('docs_per_variant') == docs_per_variant
+            and manifest.get('max_pages') == max_pages
+            and {(d['kind'], d['variant']) for d in manifest['docs']} == {(k, v) for k in kinds for v in variants}
+        ):
+            return manifest
+    return generate_corpus(out_dir, seed, docs_per_variant, max_pages, kinds, variants)
+
+
+# ============================================================
+#  PRODUCTOS Y VERDAD DE REFERENCIA
+# ============================================================
+
+
+def _lonja_product(rng):
+    peso = round(rng.uniform(3, 60), 1)
+    precio = round(rng.uniform(1.5, 14), 2)
+    return {
+        'lote': str(rng.randint(1000, 9999)),
+        'cajas': rng.randint(1, 12),
+        'especie': rng.choice(_LONJA_SPECIES),
+        'peso_kg': peso,
+        'precio': precio,
+        'valor': round(peso * precio, 2),
+    }
+
+
+def _comercial_product(rng):
+    return {
+        'lote': str(rng.randint(100000, 999999)),
+        'especie': rng.choice(_COMERCIAL_ITEMS),
+        'peso_kg': round(rng.uniform(1, 80), 2),
+        'precio': round(rng.uniform(2, 30), 2),
+        'iva': rng.choice((4, 10, 21)),
+    }
+
+
+def _packing_product(rng):
+    title, scientific = rng.choice(_PACKING_ITEMS)
+    ctns = rng.randint(20, 400)
+    unit = rng.choice((10, 12, 20))
+    net = float(ctns * unit)
+    return {
+        'title': title,
+        'especie': scientific,
+        'cajas': ctns,
+        'unit': unit,
+        'net': net,
+        'peso_kg': round(net * 1.1, 2),
+    }
+
+
+def _truth(kind, producto):
+    keep = {
+        'lonja': ('lote', 'cajas', 'especie', 'peso_kg', 'precio'),
+        'comercial': ('lote', 'especie', 'peso_kg', 'precio'),
+        'packing': ('cajas', 'especie', 'peso_kg'),
+    }[kind]
+    return {k: producto[k] for k in keep}
+
+
+def _es(value):
+    return f"{value:.2f}".replace('.', ',')
+
+
+# ============================================================
+#  MAQUETACIÓN (reportlab)
+# ============================================================
+
+
+def _canvas():
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    return canvas.Canvas(buf, pagesize=A4), buf
+
+
+def _chunks(items, pages):
+    size = -(-len(items) // pages)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _lonja_pdf(productos, pages, rng):
+    c, buf = _canvas()
+    for number, chunk in enumerate(_chunks(productos, pages), start=1):
+        c.setFont('Helvetica-Bold', 14)
+        c.drawString(50, 800, f"DOCAPESCA - LOTA DE MATOSINHOS   Talao N. {rng.randint(10000, 99999)}")
+        c.setFont('Helvetica', 9)
+        c.drawString(50, 780, "Comprador: TOSCAMARE LDA  NIF 500123456  Rua do Porto 123, Matosinhos")
+        c.drawString(50, 768, f"Data de venda: 2024-03-{rng.randint(1, 28):02d}   Pagina {number}/{pages}")
+        top = 735
+        c.setFont('Helvetica-Bold', 10)
+        for x, label in ((50, 'Lote'), (100, 'Cxs'), (150, 'Especie'), (330, 'Peso'), (400, 'Preco'), (470, 'Val.Pesc.')):
+            c.drawString(x, top, label)
+        c.setFont('Helvetica', 10)
+        for i, p in enumerate(chunk):
+            y = top - 22 - i * 20
+            for x, value in ((50, p['lote']), (100, str(p['cajas'])), (150, p['especie']),
+                             (330, f"{p['peso_kg']:.1f}".replace('.', ',')), (400, _es(p['precio'])),
+                             (470, _es(p['valor']))):
+                c.drawString(x, y, value)
+        c.setFont('Helvetica', 8)
+        c.drawString(50, 90, "Documento processado por programa certificado n. 1234/AT")
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _comercial_pdf(productos, pages, rng):
+    c, buf = _canvas()
+    for number, chunk in enumerate(_chunks(productos, pages), start=1):
+        c.setFont('Helvetica-Bold', 14)
+        c.drawString(50, 800, f"PESCADOS DEL NORTE S.L.   ALBARAN N. {rng.randint(100000, 999999)}")
+        c.setFont('Helvetica', 9)
+        c.drawString(50, 780, "Cliente: TOSCAMARE  CIF B12345678  Mercado Central, Puesto 14")
+        c.drawString(50, 768, f"Fecha: {rng.randint(1, 28):02d}/03/2024   Hoja {number} de {pages}")
+        top = 735
+        c.setFont('Helvetica-Bold', 10)
+        for x, label in ((50, 'Codigo'), (110, 'Descripcion'), (330, 'Cantidad'), (410, 'Precio'), (480, 'IVA')):
+            c.drawString(x, top, label)
+        c.setFont('Helvetica', 10)
+        for i, p in enumerate(chunk):
+            y = top - 22 - i * 20
+            for x, value in ((50, p['lote']), (110, p['especie']), (330, _es(p['peso_kg'])),
+                             (410, _es(p['precio'])), (480, str(p['iva']))):
+                c.drawString(x, y, value)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _packing_pdf(productos, pages, rng):
+    c, buf = _canvas()
+    chunks = _chunks(productos, pages)
+    for number, chunk in enumerate(chunks, start=1):
+        c.setFont('Helvetica-Bold', 16)
+        c.drawString(50, 800, "PACKING LIST")
+        c.setFont('Helvetica', 9)
+        c.drawString(50, 782, f"Invoice No. QD{rng.randint(10000, 99999)}   Consignee: TOSCAMARE LDA   Page {number}/{pages}")
+        c.drawString(50, 770, "DESCRIPTION OF GOODS                       QUANTITY     NET WEIGHT     GROSS WEIGHT")
+        y = 745
+        c.setFont('Helvetica', 10)
+        for p in chunk:
+            c.drawString(50, y, f"{p['title']} ({p['especie']})")
+            c.drawString(70, y - 13, f"PACKING: {p['unit']} X 1KG   SIZE: 200-400G")
+            c.drawString(70, y - 26, f"{p['cajas']} CTNS   {p['net']:.2f} KGS   {p['peso_kg']:.2f} KGS")
+            y -= 46
+        if number == len(chunks):
+            total = sum(p['peso_kg'] for p in productos)
+            c.setFont('Helvetica-Bold', 10)
+            c.drawString(50, max(y - 10, 60), f"TOTAL WITH GLAZE {total:.2f} KGS")
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+_BUILDERS = {
+    'lonja': (_lonja_product, _lonja_pdf),
+    'comercial': (_comercial_product, _comercial_pdf),
+    'packing': (_packing_product, _packing_pdf),
+}
+
+
+# ============================================================
+#  ESCANEADO SIMULADO
+# ============================================================
+
+
+def _scan(vector_pdf, variant, rng):
+    """Rasteriza cada página y la degrada según la variante; PDF solo imagen (sin capa de texto)."""
+    src = fitz.open(stream=vector_pdf, filetype='pdf')
+    out = fitz.open()
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    try:
+        for page in src:
+            zoom = SCAN_DPI / 72
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+            image = Image.frombytes('L', (pix.width, pix.height), pix.samples, 'raw', 'L', pix.stride)
+
+            if variant == 'rotated':
+                skew = rng.uniform(-1.5, 1.5)
+                image = image.rotate(skew, resample=Image.Resampling.BICUBIC, expand=False, fillcolor=255)
+                image = image.rotate(rng.choice((90, 180, 270)), expand=True)
+            image = _degrade(image, np_rng, strong=variant == 'noisy')
+
+            jpeg = io.BytesIO()
+            image.save(jpeg, 'JPEG', quality=60 if variant == 'noisy' else 80)
+            width, height = image.width * 72 / SCAN_DPI, image.height * 72 / SCAN_DPI
+            target = out.new_page(width=width, height=height)
+            target.insert_image(target.rect, stream=jpeg.getvalue())
+        return out.tobytes(garbage=3, deflate=True)
+    finally:
+        src.close()
+        out.close()
+
+
+def _degrade(image, np_rng, strong):
+    array = np.asarray(image, dtype=np.float32)
+    # Papel gris y tinta algo lavada
+    paper, ink = (225.0, 45.0) if strong else (240.0, 25.0)
+    array = ink + array * (paper - ink) / 255.0
+    array += np_rng.normal(0, 14.0 if strong else 5.0, array.shape)
+    if strong:
+        specks = np_rng.random(array.shape) < 0.002
+        array[specks] = np_rng.choice((0.0, 255.0), size=int(specks.sum()))
+    return Image.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='Directorio de salida')
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--docs', type=int, default=1, help='Documentos por tipo y variante')
+    parser.add_argument('--max-pages', type=int, default=10, help='Páginas máximas de la variante scan')
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.out, seed=args.seed, docs_per_variant=args.docs, max_pages=args.max_pages)
+    pages = sum(doc['pages'] for doc in manifest['docs'])
+    print(f"{len(manifest['docs'])} documentos, {pages} páginas en {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: latencia por página del OCR con subproceso (pytesseract) frente al
+pool de motores residentes (libtesseract vía ctypes).
+
+Uso (desde backend/):
+    python -m ocr.bench.engine_pool
+    python -m ocr.bench.engine_pool --pdf ocr/pdfs/albaran.pdf --lang spa+por --repeat 5
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import pytesseract
+
+from ocr.src.ocr import TesseractEnginePool, OCR_DPI
+from ocr.src.pdf_to_img import iter_pdf_pages
+
+CONFIG = r'--oem 3 --psm 6'
+
+
+def _sample_pdf(path, pages):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(str(path), pagesize=A4)
+    for page in range(pages):
+        c.setFont('Helvetica-Bold', 14)
+        c.drawString(50, 800, f"ALBARAN DE VENTA  N. {2024000 + page}")
+        c.setFont('Helvetica', 10)
+        c.drawString(50, 770, "Lote  Cxs  Especie              Peso     Preco    Val.Pesc.")
+        for i in range(30):
+            peso = 5 + (i * 1.7) % 40
+            preco = 2 + (i * 0.35) % 9
+            c.drawString(50, 750 - i * 20, f"{1200 + i:<5} {1 + i % 9:<4} PESCADA DO CABO      {peso:>6.1f}   {preco:>6.2f}   {peso * preco:>8.2f}")
+        c.showPage()
+    c.save()
+
+
+def _summary(label, samples):
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[min(len(samples_ms) - 1, int(round(0.95 * (len(samples_ms) - 1))))]
+    print(
+        f"{label:<12} n={len(samples_ms):<3} media={statistics.mean(samples_ms):8.1f} ms  "
+        f"p50={statistics.median(samples_ms):8.1f} ms  p95={p95:8.1f} ms"
+    )
+    return statistics.mean(samples_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', help='PDF a usar (por defecto se genera uno sintético)')
+    parser.add_argument('--pages', type=int, default=3, help='Páginas del PDF sintético')
+    parser.add_argument('--lang', default='spa', help='Idiomas de Tesseract (spa, spa+por, eng...)')
+    parser.add_argument('--dpi', type=int, default=OCR_DPI)
+    parser.add_argument('--repeat', type=int, default=3, help='Pasadas sobre todas las páginas')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(args.pdf) if args.pdf else Path(tmp) / 'sample.pdf'
+        if not args.pdf:
+            _sample_pdf(pdf, args.pages)
+        images = [p['image'] for p in iter_pdf_pages(pdf, dpi=args.dpi)]
+
+    print(f"PDF={pdf.name} páginas={len(images)} lang={args.lang} dpi={args.dpi} repeticiones={args.repeat}\n")
+
+    subprocess_samples = []
+    for _ in range(args.repeat):
+        for image in images:
+            start = time.perf_counter()
+            pytesseract.image_to_data(image, lang=args.lang, config=CONFIG, output_type=pytesseract.Output.DICT)
+            subprocess_samples.append(time.perf_counter() - start)
+
+    pool = TesseractEnginePool(mode='capi')
+    if not pool.enabled:
+        _summary('subprocess', subprocess_samples)
+        print("\nlibtesseract no disponible: no se puede medir el pool de motores")
+        return
+
+    start = time.perf_counter()
+    pool.warm([args.lang])
+    warm = time.perf_counter() - start
+
+    pool_samples = []
+    for _ in range(args.repeat):
+        for image in images:
+            start = time.perf_counter()
+            with pool.acquire(args.lang) as engine:
+                engine.image_to_data(image)
+            pool_samples.append(time.perf_counter() - start)
+    pool.close_all()
+
+    base = _summary('subprocess', subprocess_samples)
+    new = _summary('engine pool', pool_samples)
+    print(f"\ncarga inicial del motor (una vez por proceso): {warm * 1000:.1f} ms")
+    print(f"mejora por página: {base - new:.1f} ms ({(1 - new / base) * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
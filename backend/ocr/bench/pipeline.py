@@ -0,0 +1,381 @@
+"""
+Benchmark del pipeline completo de OCR sobre el corpus sintético de ocr.bench.corpus:
+detección de idioma -> render + preprocesado -> OCR -> extract_albaran_data.
+
+Por cada documento mide la latencia de cada etapa (con los tramos de
+ocr/src/metrics.py), las páginas/segundo, el pico de memoria y la exactitud
+de la extracción frente a la verdad de referencia del corpus. Se puede guardar
+el resultado como línea base y comparar ejecuciones posteriores con ella;
+las regresiones se marcan y el proceso sale con código 1.
+
+Uso (desde backend/):
+    python -m ocr.bench.pipeline
+    python -m ocr.bench.pipeline --save-baseline
+    python -m ocr.bench.pipeline --kinds packing --variants clean noisy --max-pages 3
+    OCR_DPI=300 OCR_ADAPTIVE_DPI=0 python -m ocr.bench.pipeline   # compara con la línea base
+
+Las páginas se procesan en línea, en este proceso (sin el pool), para que los
+tiempos por etapa sean comparables entre máquinas con distinto número de cores.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ocr.bench.corpus import KINDS, VARIANTS, load_or_generate
+from ocr.bench.preprocess import _vm_kb
+from ocr.src import metrics
+from ocr.src.classify import classify_document
+from ocr.src.extract import extract_albaran_data
+from ocr.src.ocr import get_engine_pool, warm_ocr_engines
+from ocr.src.parallel import _ocr_pdf_page
+from ocr.src.pdf_to_img import get_pdf_page_count
+from ocr.src.resolution import resolution_label
+
+_OCR_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CORPUS = _OCR_DIR / '.cache' / 'bench_corpus'
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+# Campos comparados por tipo de documento y tolerancia de cada uno
+_FIELDS = {
+    'lonja': ('especie', 'peso_kg', 'precio', 'cajas'),
+    'comercial': ('especie', 'peso_kg', 'precio'),
+    'packing': ('especie', 'peso_kg', 'cajas'),
+}
+_NUM_TOLERANCE = {'peso_kg': 0.051, 'precio': 0.006, 'cajas': 0}
+
+# Umbrales de regresión frente a la línea base
+SPEED_TOLERANCE = 0.10     # páginas/s o ms por etapa: empeorar más de un 10%
+STAGE_MIN_MS = 5.0         # ignorar etapas que cambian menos que esto por llamada
+MEMORY_TOLERANCE = 0.15    # pico de RSS: crecer más de un 15%
+ACCURACY_TOLERANCE = 0.02  # exactitud: bajar más de 2 puntos
+
+
+# ============================================================
+#  EXACTITUD
+# ============================================================
+
+
+def score_document(kind, expected, extracted):
+    """
+    Empareja productos extraídos con los esperados (por lote en lonja/comercial;
+    por especie y cajas, en orden, en packing lists) y cuenta los campos correctos.
+
+    Returns:
+        Dict con 'expected', 'extracted', 'matched' y 'fields_ok' / 'fields_total'
+    """
+    fields = _FIELDS[kind]
+    remaining = list(extracted)
+    matched = fields_ok = 0
+
+    for truth in expected:
+        found = None
+        for i, product in enumerate(remaining):
+            if kind == 'packing':
+                same = _same_species(product.get('especie'), truth['especie'])
+            else:
+                same = str(product.get('lote') or '') == truth['lote']
+            if same:
+                found = remaining.pop(i)
+                break
+        if found is None:
+            continue
+        matched += 1
+        fields_ok += sum(1 for field in fields if _field_ok(field, found.get(field), truth[field]))
+
+    return {
+        'expected': len(expected),
+        'extracted': len(extracted),
+        'matched': matched,
+        'fields_ok': fields_ok,
+        'fields_total': len(expected) * len(fields),
+    }
+
+
+def _same_species(value, truth):
+    # El extractor de lonja deja a veces el primer número pegado al nombre ("PESCADA 14")
+    return bool(value) and ' '.join(str(value).upper().split()).startswith(truth)
+
+
+def _field_ok(field, value, truth):
+    if field == 'especie':
+        return _same_species(value, truth)
+    if value is None:
+        return False
+    try:
+        return abs(float(value) - float(truth)) <= _NUM_TOLERANCE[field]
+    except (TypeError, ValueError):
+        return False
+
+
+def _ratios(score):
+    return {
+        'recall': score['matched'] / score['expected'] if score['expected'] else 1.0,
+        'precision': score['matched'] / score['extracted'] if score['extracted'] else 0.0,
+        'fields': score['fields_ok'] / score['fields_total'] if score['fields_total'] else 1.0,
+    }
+
+
+def _add_scores(a, b):
+    return {k: a.get(k, 0) + b[k] for k in b}
+
+
+# ============================================================
+#  EJECUCIÓN
+# ============================================================
+
+
+def run_document(pdf_path, kind, expected, dpi=None, lang=None):
+    """Pasa un documento por el pipeline y devuelve tiempos, memoria y exactitud."""
+    registry = metrics.get_registry()
+    registry.reset()
+    use_rss = sys.platform.startswith('linux')
+    if use_rss:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')  # reinicia VmHWM
+
+    start = time.perf_counter()
+    deteccion = classify_document(pdf_path)
+    ocr_lang = lang or deteccion['ocr_lang']
+    pages = [
+        _ocr_pdf_page(str(pdf_path), number, dpi, ocr_lang)
+        for number in range(1, get_pdf_page_count(pdf_path) + 1)
+    ]
+    with metrics.span('extract'):
+        albaran = extract_albaran_data(
+            '\n'.join(page['text'] for page in pages),
+            ocr_data_list=[page['data'] for page in pages if page['data']],
+            doc_type=deteccion['doc_type'],
+        )
+    elapsed = time.perf_counter() - start
+
+    # Tramos por etapa (sumando las etiquetas de idioma, origen...)
+    stages = {}
+    for (name, labels), hist in registry.histograms.items():
+        if name != 'ocr_stage_seconds':
+            continue
+        stage = dict(labels)['stage']
+        total = stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+        total['seconds'] += hist['sum']
+        total['calls'] += hist['count']
+
+    return {
+        'pages': len(pages),
+        'seconds': elapsed,
+        'page_seconds': [page['elapsed'] for page in pages],
+        'stages': stages,
+        'peak_rss_mb': _vm_kb('VmHWM') / 1024.0 if use_rss else None,
+        'doc_type': albaran.get('doc_type'),
+        'score': score_document(kind, expected, albaran.get('productos', [])),
+    }
+
+
+def run_corpus(manifest, corpus_dir, dpi=None, lang=None, verbose=True):
+    docs = []
+    for doc in manifest['docs']:
+        result = run_document(Path(corpus_dir) / doc['file'], doc['kind'], doc['productos'], dpi=dpi, lang=lang)
+        result.update(file=doc['file'], kind=doc['kind'], variant=doc['variant'])
+        docs.append(result)
+        if verbose:
+            ratios = _ratios(result['score'])
+            print(
+                f"  {doc['file']:<26} {result['pages']:>2} pág {result['seconds']:6.2f}s "
+                f"recall={ratios['recall']:.2f} campos={ratios['fields']:.2f} tipo={result['doc_type']}"
+            )
+    return docs
+
+
+def summarize(docs, dpi=None, lang=None):
+    """Agrega los resultados por documento en el formato de la línea base."""
+    groups = {}
+    stages = {}
+    page_seconds = []
+    total = {'docs': 0, 'pages': 0, 'seconds': 0.0, 'score': {}}
+    peak = None
+
+    for doc in docs:
+        for key in (f"{doc['kind']}/{doc['variant']}", None):
+            bucket = total if key is None else groups.setdefault(
+                key, {'docs': 0, 'pages': 0, 'seconds': 0.0, 'score': {}}
+            )
+            bucket['docs'] += 1
+            bucket['pages'] += doc['pages']
+            bucket['seconds'] += doc['seconds']
+            bucket['score'] = _add_scores(bucket['score'], doc['score'])
+        for stage, values in doc['stages'].items():
+            entry = stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += values['seconds']
+            entry['calls'] += values['calls']
+        page_seconds.extend(doc['page_seconds'])
+        if doc['peak_rss_mb'] is not None:
+            peak = max(peak or 0.0, doc['peak_rss_mb'])
+
+    def _finish(bucket):
+        out = {
+            'docs': bucket['docs'],
+            'pages': bucket['pages'],
+            'seconds': round(bucket['seconds'], 3),
+            'pages_per_sec': round(bucket['pages'] / bucket['seconds'], 4) if bucket['seconds'] else 0.0,
+        }
+        out.update({k: round(v, 4) for k, v in _ratios(bucket['score']).items()})
+        return out
+
+    page_ms = sorted(s * 1000 for s in page_seconds)
+    summary = _finish(total)
+    summary.update({
+        'page_ms_p50': round(statistics.median(page_ms), 1) if page_ms else None,
+        'page_ms_p95': round(page_ms[min(len(page_ms) - 1, int(round(0.95 * (len(page_ms) - 1))))], 1) if page_ms else None,
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+    })
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'dpi': str(dpi) if dpi else resolution_label(),
+            'lang': lang or 'auto',
+            'engine': 'capi' if get_engine_pool().enabled else 'subprocess',
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'totals': summary,
+        'groups': {key: _finish(bucket) for key, bucket in sorted(groups.items())},
+        'stages': {
+            stage: {
+                'calls': values['calls'],
+                'mean_ms': round(values['seconds'] * 1000 / values['calls'], 2) if values['calls'] else 0.0,
+                'ms_per_page': round(values['seconds'] * 1000 / total['pages'], 2) if total['pages'] else 0.0,
+            }
+            for stage, values in sorted(stages.items())
+        },
+    }
+
+
+# ============================================================
+#  INFORME Y LÍNEA BASE
+# ============================================================
+
+
+def print_report(summary):
+    env = summary['environment']
+    print(f"\nentorno: dpi={env['dpi']} lang={env['lang']} motor={env['engine']} cpus={env['cpus']}")
+
+    print(f"\n{'grupo':<20} {'docs':>4} {'pág':>4} {'pág/s':>7} {'recall':>7} {'precisión':>9} {'campos':>7}")
+    for key, group in summary['groups'].items():
+        print(
+            f"{key:<20} {group['docs']:>4} {group['pages']:>4} {group['pages_per_sec']:>7.2f} "
+            f"{group['recall']:>7.2f} {group['precision']:>9.2f} {group['fields']:>7.2f}"
+        )
+
+    print(f"\n{'etapa':<14} {'llamadas':>8} {'ms/llamada':>11} {'ms/página':>10}")
+    for stage, values in summary['stages'].items():
+        print(f"{stage:<14} {values['calls']:>8} {values['mean_ms']:>11.1f} {values['ms_per_page']:>10.1f}")
+
+    t = summary['totals']
+    peak = f"{t['peak_rss_mb']:.0f} MB" if t['peak_rss_mb'] is not None else 'n/d'
+    print(
+        f"\nTOTAL {t['docs']} docs, {t['pages']} páginas en {t['seconds']:.1f}s: {t['pages_per_sec']:.2f} pág/s, "
+        f"p50={t['page_ms_p50']} ms/pág p95={t['page_ms_p95']} ms/pág, pico RSS={peak}\n"
+        f"      recall={t['recall']:.3f} precisión={t['precision']:.3f} campos={t['fields']:.3f}"
+    )
+
+
+def compare(summary, baseline):
+    """
+    Compara con la línea base.
+
+    Returns:
+        Lista de regresiones (texto); vacía si no hay ninguna
+    """
+    regressions = []
+    base_t, new_t = baseline['totals'], summary['totals']
+
+    if base_t.get('pages_per_sec') and new_t['pages_per_sec'] < base_t['pages_per_sec'] * (1 - SPEED_TOLERANCE):
+        regressions.append(f"pág/s {base_t['pages_per_sec']:.2f} -> {new_t['pages_per_sec']:.2f}")
+    if base_t.get('peak_rss_mb') and new_t.get('peak_rss_mb') and \
+            new_t['peak_rss_mb'] > base_t['peak_rss_mb'] * (1 + MEMORY_TOLERANCE):
+        regressions.append(f"pico RSS {base_t['peak_rss_mb']:.0f} -> {new_t['peak_rss_mb']:.0f} MB")
+
+    for key in ('recall', 'precision', 'fields'):
+        if key in base_t and new_t[key] < base_t[key] - ACCURACY_TOLERANCE:
+            regressions.append(f"{key} total {base_t[key]:.3f} -> {new_t[key]:.3f}")
+    for group, base_g in baseline.get('groups', {}).items():
+        new_g = summary['groups'].get(group)
+        if new_g is None:
+            continue
+        for key in ('recall', 'fields'):
+            if new_g[key] < base_g[key] - ACCURACY_TOLERANCE:
+                regressions.append(f"{key} {group} {base_g[key]:.2f} -> {new_g[key]:.2f}")
+
+    for stage, base_s in baseline.get('stages', {}).items():
+        new_s = summary['stages'].get(stage)
+        if new_s is None:
+            continue
+        if new_s['ms_per_page'] > base_s['ms_per_page'] * (1 + SPEED_TOLERANCE) and \
+                new_s['ms_per_page'] - base_s['ms_per_page'] > STAGE_MIN_MS:
+            regressions.append(f"etapa {stage} {base_s['ms_per_page']:.1f} -> {new_s['ms_per_page']:.1f} ms/pág")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='Directorio del corpus (se genera si falta)')
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--docs', type=int, default=1, help='Documentos por tipo y variante')
+    parser.add_argument('--max-pages', type=int, default=10, help='Páginas máximas de la variante scan')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument('--dpi', type=int, help='DPI fijo (por defecto la configuración: OCR_ADAPTIVE_DPI / OCR_DPI)')
+    parser.add_argument('--lang', help='Forzar el idioma de OCR en vez del detectado (p. ej. eng)')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Línea base con la que comparar')
+    parser.add_argument('--save-baseline', action='store_true', help='Guardar este resultado como línea base')
+    parser.add_argument('--json', help='Guardar también el resultado completo (por documento) en este fichero')
+    args = parser.parse_args()
+
+    corpus_dir = Path(args.corpus) / f"seed{args.seed}_d{args.docs}_p{args.max_pages}"
+    # Siempre el corpus completo (la misma semilla da los mismos documentos); luego se filtra
+    manifest = load_or_generate(corpus_dir, seed=args.seed, docs_per_variant=args.docs, max_pages=args.max_pages)
+    manifest['docs'] = [d for d in manifest['docs'] if d['kind'] in args.kinds and d['variant'] in args.variants]
+    pages = sum(d['pages'] for d in manifest['docs'])
+    print(f"corpus={corpus_dir} documentos={len(manifest['docs'])} páginas={pages}")
+
+    # Los tramos de este proceso no deben mezclarse con las métricas del servicio
+    metrics.get_registry().directory = str(corpus_dir / 'metrics')
+    warm_ocr_engines([args.lang] if args.lang else None)
+
+    docs = run_corpus(manifest, corpus_dir, dpi=args.dpi, lang=args.lang)
+    summary = summarize(docs, dpi=args.dpi, lang=args.lang)
+    print_report(summary)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({'summary': summary, 'docs': docs}, ensure_ascii=False, indent=1))
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(summary, ensure_ascii=False, indent=1) + '\n')
+        print(f"\nlínea base guardada en {baseline_path}")
+        return
+
+    if not baseline_path.exists():
+        print(f"\nsin línea base en {baseline_path} (crearla con --save-baseline)")
+        return
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline.get('environment') != summary['environment']:
+        print(f"\naviso: la línea base es de otro entorno: {baseline.get('environment')}")
+    regressions = compare(summary, baseline)
+    if regressions:
+        print(f"\nREGRESIONES frente a {baseline_path.name} ({baseline.get('created')}):")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    print(f"\nsin regresiones frente a {baseline_path.name} ({baseline.get('created')})")
+
+
+if __name__ == '__main__':
+    main()
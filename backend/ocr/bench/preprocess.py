@@ -0,0 +1,124 @@
+"""
+Microbenchmark del preprocesado de páginas: cadena PIL (basic_preprocess +
+binarize_image) frente al kernel NumPy fusionado (preprocess_page).
+
+Informa ms/página, pico de memoria y coincidencia de píxeles a 220 y 300 DPI.
+
+Uso (desde backend/):
+    python -m ocr.bench.preprocess
+    python -m ocr.bench.preprocess --pdf ocr/pdfs/albaran.pdf --repeat 5
+"""
+import argparse
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from ocr.src.pdf_to_img import basic_preprocess, binarize_image
+from ocr.src.preprocess import preprocess_page
+from ocr.bench.engine_pool import _sample_pdf
+
+
+def _vm_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return None
+
+
+def _render(pdf, dpi):
+    doc = fitz.open(str(pdf))
+    pix = doc[0].get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72), colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombytes('L', (pix.width, pix.height), pix.samples, 'raw', 'L', pix.stride)
+    doc.close()
+    return image
+
+
+def _pil_chain(image):
+    return binarize_image(basic_preprocess(image))
+
+
+METHODS = {'PIL': _pil_chain, 'NumPy': preprocess_page}
+
+
+def _run_method(method, pdf, dpi, repeat):
+    """
+    Se ejecuta en un proceso nuevo por método, para que el pico de memoria de uno
+    no contamine al otro. Linux: pico de RSS (VmHWM) menos el RSS antes de empezar.
+    En otros sistemas: pico de tracemalloc (solo ve las reservas de NumPy, no las de PIL).
+    """
+    fn = METHODS[method]
+    image = _render(pdf, dpi)
+    fn(image)  # calentamiento (imports perezosos, tablas de PIL)
+
+    use_rss = sys.platform.startswith('linux')
+    if use_rss:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')  # reinicia VmHWM
+        base = _vm_kb('VmRSS')
+    else:
+        tracemalloc.start()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(image)
+        times.append(time.perf_counter() - start)
+        if use_rss:
+            del result
+    if use_rss:
+        peak_mb = (_vm_kb('VmHWM') - base) / 1024.0
+    else:
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+        tracemalloc.stop()
+
+    bits = np.packbits(np.asarray(fn(image)) > 0)
+    return {'times': times, 'peak_mb': peak_mb, 'bits': bits, 'size': f"{image.width}x{image.height}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', help='PDF a usar (por defecto se genera uno sintético)')
+    parser.add_argument('--dpi', type=int, nargs='+', default=[220, 300])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    memory_label = 'pico RSS' if sys.platform.startswith('linux') else 'pico tracemalloc'
+    ctx = multiprocessing.get_context('spawn')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(args.pdf) if args.pdf else Path(tmp) / 'sample.pdf'
+        if not args.pdf:
+            _sample_pdf(pdf, 1)
+
+        print(f"PDF={pdf.name} repeticiones={args.repeat} memoria={memory_label}\n")
+        print(f"{'dpi':>4} {'tamaño':>11} {'método':<8} {'ms/página':>10} {'memoria MB':>11} {'coincidencia':>13}")
+
+        for dpi in args.dpi:
+            results = {}
+            for method in METHODS:
+                with ctx.Pool(1) as pool:
+                    results[method] = pool.apply(_run_method, (method, str(pdf), dpi, args.repeat))
+
+            reference = results['PIL']['bits']
+            for method, r in results.items():
+                agreement = ''
+                if method != 'PIL':
+                    same = np.unpackbits(reference) == np.unpackbits(r['bits'])
+                    agreement = f"{float(same.mean()) * 100.0:.3f}%"
+                print(
+                    f"{dpi:>4} {r['size']:>11} {method:<8} {statistics.median(r['times']) * 1000:>10.1f} "
+                    f"{r['peak_mb']:>11.1f} {agreement:>13}"
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,64 @@
+"""
+Uso (desde ocr/):
+    python main.py [--debug-images]
+        Procesa pdfs/*.pdf uno a uno y guarda output/<pdf>_productos.csv
+
+    python main.py --batch [--input DIR] [--output DIR] [--workers N] [--retry-failed]
+        Modo lote (backfills de miles de albaranes): reparte los documentos entre
+        procesos, se salta los ya procesados según output/manifest.sqlite3 (por
+        contenido) y va escribiendo output/productos.csv y output/documentos.jsonl.
+        Si se interrumpe, basta con relanzarlo.
+"""
 import os
-import sys
+import csv
+import time
+import argparse
 from pathlib import Path
-from src.pdf_to_img import convert_pdf_to_images
-from src.ocr import process_image_with_ocr, get_ocr_data, detect_language_from_image
+from src.classify import classify_document
+from src.parallel import pdf_pages, pool_size
 from src.extract import extract_albaran_data
+from src.batch import run_batch
+
+
+def _parse_args():
+    base_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="OCR de albaranes en PDF")
+    parser.add_argument('--debug-images', action='store_true', help="guardar las imágenes preprocesadas en images/")
+    parser.add_argument('--batch', action='store_true', help="modo lote paralelo y reanudable")
+    parser.add_argument('--input', type=Path, default=base_dir / "pdfs", help="carpeta de PDFs (se recorre entera)")
+    parser.add_argument('--output', type=Path, default=base_dir / "output", help="carpeta de salida")
+    parser.add_argument('--manifest', type=Path, help="manifiesto del lote (por defecto <output>/manifest.sqlite3)")
+    parser.add_argument('--workers', type=int, default=pool_size(), help="documentos en paralelo (modo lote)")
+    parser.add_argument('--retry-failed', action='store_true', help="reintentar los PDFs que fallaron en otra ejecución")
+    return parser.parse_args()
 
 
 def main():
+    args = _parse_args()
     # Configurar rutas
     base_dir = Path(__file__).parent
-    pdf_dir = base_dir / "pdfs"
+    pdf_dir = args.input
     images_dir = base_dir / "images"
-    output_dir = base_dir / "output"
+    output_dir = args.output
     
-    # Crear directorios si no existen
-    images_dir.mkdir(exist_ok=True)
-    output_dir.mkdir(exist_ok=True)
+    # Crear directorios si no existen (images/ solo se usa con --debug-images)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if args.debug_images:
+        images_dir.mkdir(exist_ok=True)
+        os.environ['OCR_DEBUG_DIR'] = str(images_dir)
     
     # Buscar PDFs
-    pdf_files = list(pdf_dir.glob("*.pdf"))
+    pdf_files = sorted(pdf_dir.rglob("*.pdf")) if args.batch else list(pdf_dir.glob("*.pdf"))
     
     if not pdf_files:
-        print("❌ No se encontraron archivos PDF en la carpeta 'pdfs/'")
+        print(f"❌ No se encontraron archivos PDF en la carpeta '{pdf_dir}'")
         return
     
     print(f"📄 Encontrados {len(pdf_files)} archivo(s) PDF\n")
+
+    if args.batch:
+        batch(pdf_files, output_dir, args)
+        return
     
     for pdf_file in pdf_files:
         print(f"{'='*60}")
@@ -32,38 +66,31 @@ def main():
         print(f"{'='*60}\n")
         
         try:
-            # Paso 1: Convertir PDF a imágenes
-            print("1️⃣  Convirtiendo PDF a imágenes...")
-            image_files = convert_pdf_to_images(pdf_file, images_dir)
-            print(f"   ✓ Generadas {len(image_files)} imagen(es)\n")
+            # Paso 1: Detectar idioma y tipo de documento (franja de cabecera, sin OCR completo)
+            print("1️⃣  Detectando idioma del documento...")
+            deteccion = classify_document(pdf_file)
+            ocr_lang = deteccion['ocr_lang']
 
-            # Paso 1.5: Detectar idioma del documento para OCR y extracción
-            print("2️⃣  Detectando idioma del documento...")
-            detected_lang = detect_language_from_image(image_files[0])
-            if detected_lang == 'eng':
-                ocr_lang = 'eng'
-            else:
-                # Para español y portugués usamos ambos en OCR, pero el doc_type se detectará en extract_albaran_data
-                ocr_lang = 'spa+por'
-            
-            # No forzar doc_type aquí; dejar que _detect_doc_type lo haga automáticamente
-            doc_type = None
-            print(f"   ✓ Idioma OCR: {ocr_lang}\n")
+            # Solo se fuerza doc_type con marcadores claros; si no, lo detecta extract_albaran_data
+            doc_type = deteccion['doc_type']
+            print(f"   ✓ Idioma OCR: {ocr_lang} ({deteccion['source']}, {deteccion['elapsed']:.2f}s)\n")
             
-            # Paso 2: Procesar cada imagen con OCR
-            print("3️⃣  Realizando OCR...")
+            # Paso 2: capa de texto donde sirve y OCR del resto en el pool de procesos
+            print(f"2️⃣  Realizando OCR ({pool_size()} proceso(s))...")
             all_text = ""
             ocr_data_list = []
-            for img_file in image_files:
-                text = process_image_with_ocr(img_file, lang=ocr_lang)
-                all_text += text + "\n"
-                data = get_ocr_data(img_file, lang=ocr_lang)
-                if data:
-                    ocr_data_list.append(data)
-            print(f"   ✓ OCR completado ({len(all_text)} caracteres)\n")
+            ocr_start = time.time()
+            # DPI por página según el tamaño del texto (ver src/resolution.py)
+            for page in pdf_pages(pdf_file, lang=ocr_lang):
+                all_text += page['text'] + "\n"
+                if page['data']:
+                    ocr_data_list.append(page['data'])
+            ocr_elapsed = time.time() - ocr_start
+            print(f"   ✓ OCR completado ({len(all_text)} caracteres, {ocr_elapsed:.2f}s)")
+            print(f"   ✓ Detección: {deteccion['elapsed'] / max(ocr_elapsed, 1e-6) * 100:.1f}% del coste del OCR\n")
             
             # Paso 3: Extraer datos del albarán
-            print("4️⃣  Extrayendo información del albarán...")
+            print("3️⃣  Extrayendo información del albarán...")
             albaran_data = extract_albaran_data(all_text, ocr_data_list=ocr_data_list, doc_type=doc_type)
             doc_type = albaran_data.get('doc_type', 'portugues')
             print(f"   ✓ Tipo de documento detectado: {doc_type}\n")
@@ -72,28 +99,7 @@ def main():
             output_csv = output_dir / f"{pdf_file.stem}_productos.csv"
 
             # Guardar en CSV
-            with open(output_csv, 'w', encoding='utf-8') as f:
-                if doc_type == 'ingles':
-                    f.write("Nombre,Packing_Cantidad,Peso_With_Glaze_KG,Total\n")
-                    total_weight = albaran_data.get('total_weight', '')
-                    for producto in albaran_data['productos']:
-                        nombre = (producto.get('scientific_name') or producto.get('especie') or '').replace(',', ' ')
-                        packing_qty = (producto.get('packing_qty') or '').replace(',', ' ')
-                        peso = producto['peso_kg'] if producto['peso_kg'] else ''
-                        f.write(f"{nombre},{packing_qty},{peso},{total_weight}\n")
-                elif doc_type == 'español_comercial':
-                    f.write("Nombre,Cantidad,Precio\n")
-                    for producto in albaran_data['productos']:
-                        nombre = (producto.get('nombre') or producto.get('especie') or '').replace(',', ' ')
-                        cantidad = producto.get('cantidad', '')
-                        precio = producto.get('precio', '')
-                        f.write(f"{nombre},{cantidad},{precio}\n")
-                else:
-                    f.write("Lote,Especie,Cajas,Peso_KG\n")
-                    for producto in albaran_data['productos']:
-                        peso = producto['peso_kg'] if producto['peso_kg'] else ''
-                        especie = (producto['especie'] or '').replace(',', ' ')
-                        f.write(f"{producto['lote']},{especie},{producto['cajas']},{peso}\n")
+            guardar_csv(output_csv, doc_type, albaran_data)
             
             print(f"   ✓ Extraídos {albaran_data['total_productos']} productos:")
             for producto in albaran_data['productos'][:5]:  # Mostrar primeros 5
@@ -111,5 +117,47 @@ def main():
             continue
 
 
+def guardar_csv(output_csv, doc_type, albaran_data):
+    """CSV de un albarán con las columnas de su tipo."""
+    with open(output_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if doc_type == 'ingles':
+            writer.writerow(["Nombre", "Packing_Cantidad", "Peso_With_Glaze_KG", "Total"])
+            total_weight = albaran_data.get('total_weight', '')
+            for producto in albaran_data['productos']:
+                nombre = producto.get('scientific_name') or producto.get('especie') or ''
+                writer.writerow([nombre, producto.get('packing_qty') or '', producto['peso_kg'] or '', total_weight])
+        elif doc_type == 'español_comercial':
+            writer.writerow(["Nombre", "Cantidad", "Precio"])
+            for producto in albaran_data['productos']:
+                nombre = producto.get('nombre') or producto.get('especie') or ''
+                writer.writerow([nombre, producto.get('cantidad', ''), producto.get('precio', '')])
+        else:
+            writer.writerow(["Lote", "Especie", "Cajas", "Peso_KG"])
+            for producto in albaran_data['productos']:
+                writer.writerow([producto['lote'], producto['especie'] or '', producto['cajas'], producto['peso_kg'] or ''])
+
+
+def batch(pdf_files, output_dir, args):
+    manifest = args.manifest or output_dir / "manifest.sqlite3"
+    try:
+        stats = run_batch(
+            pdf_files, output_dir, manifest, workers=max(1, args.workers), retry_failed=args.retry_failed,
+        )
+    except KeyboardInterrupt:
+        print("\n⏸  Interrumpido: vuelve a lanzar el mismo comando para continuar")
+        return
+
+    minutos = max(stats['segundos'], 1e-6) / 60
+    print(f"\n{'='*60}")
+    print(f"✅ Lote terminado en {stats['segundos']:.1f}s")
+    print(f"   Documentos: {stats['hechos']} hechos, {stats['errores']} con error, "
+          f"{stats['saltados']} ya procesados, {stats['duplicados']} duplicados")
+    print(f"   Productos: {stats['productos']}")
+    print(f"   Rendimiento: {stats['hechos'] / minutos:.1f} docs/min, {stats['paginas'] / minutos:.1f} páginas/min")
+    print(f"\n💾 Resultados: {output_dir / 'productos.csv'}, {output_dir / 'documentos.jsonl'}")
+    print(f"   Manifiesto: {manifest}")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,288 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from .cache import pdf_fingerprint
+
+# Estados de un documento en el manifiesto del lote
+HECHO = 'hecho'
+ERROR = 'error'
+
+# Columnas de productos.csv (comunes a los tres tipos de albarán; las que no aplican van vacías)
+CSV_FIELDS = (
+    'archivo', 'hash', 'doc_type', 'lote', 'especie', 'cajas', 'cantidad', 'peso_kg', 'precio',
+    'packing_qty', 'total_weight',
+)
+
+
+class BatchManifest:
+    """
+    Registro en SQLite de los PDFs ya procesados por el modo lote, indexado por
+    la huella del contenido (pdf_fingerprint): un PDF renombrado o copiado no se
+    vuelve a procesar, y una ejecución interrumpida retoma donde se quedó.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS documentos ('
+            ' hash TEXT PRIMARY KEY,'
+            ' archivo TEXT NOT NULL,'
+            ' estado TEXT NOT NULL,'
+            ' doc_type TEXT,'
+            ' paginas INTEGER,'
+            ' productos INTEGER,'
+            ' error TEXT,'
+            ' segundos REAL,'
+            ' procesado REAL NOT NULL)'
+        )
+        self.conn.commit()
+
+    def estados(self):
+        return dict(self.conn.execute('SELECT hash, estado FROM documentos'))
+
+    def registrar(self, clave, archivo, estado, doc_type=None, paginas=None, productos=None, error=None, segundos=None):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO documentos'
+            ' (hash, archivo, estado, doc_type, paginas, productos, error, segundos, procesado)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (clave, archivo, estado, doc_type, paginas, productos, error, segundos, time.time())
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class BatchWriter:
+    """
+    Salida en streaming del lote: una fila de productos.csv por producto y una
+    línea de documentos.jsonl por documento, en modo append y con flush tras cada
+    documento (una ejecución retomada sigue escribiendo en los mismos ficheros).
+    """
+
+    def __init__(self, output_dir):
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.csv_path = output_dir / 'productos.csv'
+        self.jsonl_path = output_dir / 'documentos.jsonl'
+
+        new_csv = not self.csv_path.exists() or self.csv_path.stat().st_size == 0
+        self._csv_file = open(self.csv_path, 'a', newline='', encoding='utf-8')
+        self._csv = csv.DictWriter(self._csv_file, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        if new_csv:
+            self._csv.writeheader()
+        self._jsonl = open(self.jsonl_path, 'a', encoding='utf-8')
+
+    def write(self, result):
+        for producto in result['productos']:
+            self._csv.writerow({
+                'archivo': result['archivo'],
+                'hash': result['hash'],
+                'doc_type': result['doc_type'],
+                'lote': producto.get('lote'),
+                'especie': producto.get('scientific_name') or producto.get('nombre') or producto.get('especie'),
+                'cajas': producto.get('cajas'),
+                'cantidad': producto.get('cantidad'),
+                'peso_kg': producto.get('peso_kg'),
+                'precio': producto.get('precio'),
+                'packing_qty': producto.get('packing_qty'),
+                'total_weight': result.get('total_weight'),
+            })
+        self._jsonl.write(json.dumps(result, ensure_ascii=False) + '\n')
+        self._csv_file.flush()
+        self._jsonl.flush()
+
+    def close(self):
+        self._csv_file.close()
+        self._jsonl.close()
+
+
+def process_document(pdf_path):
+    """
+    Pipeline completo de un PDF (detección, OCR, extracción) en el proceso actual.
+    Es el trabajo de cada proceso del lote.
+    """
+    from .classify import classify_document
+    from .parallel import pdf_pages
+    from .extract import extract_albaran_data
+
+    start = time.time()
+    deteccion = classify_document(pdf_path)
+    paginas = pdf_pages(pdf_path, lang=deteccion['ocr_lang'])
+    albaran = extract_albaran_data(
+        '\n'.join(page['text'] for page in paginas),
+        ocr_data_list=[page['data'] for page in paginas if page['data']],
+        doc_type=deteccion['doc_type'],
+    )
+    return {
+        'doc_type': albaran.get('doc_type'),
+        'paginas': len(paginas),
+        'productos': albaran.get('productos', []),
+        'total_weight': albaran.get('total_weight'),
+        'segundos': round(time.time() - start, 3),
+    }
+
+
+def _init_batch_worker():
+    # Cada proceso del lote hace sus páginas en línea: el paralelismo es entre documentos
+    from .ocr import warm_ocr_engines
+    warm_ocr_engines()
+
+
+def run_batch(pdf_files, output_dir, manifest_path, workers=1, retry_failed=False, log=print):
+    """
+    Procesa `pdf_files` repartiendo documentos entre `workers` procesos.
+
+    Se saltan los PDFs cuyo contenido ya está en el manifiesto como hecho (y los
+    que fallaron, salvo con retry_failed) y los duplicados dentro del propio lote.
+    Cada resultado se escribe en cuanto termina y después se registra en el
+    manifiesto: si el proceso se interrumpe entre ambos pasos, el documento se
+    repite al retomar (las filas llevan el hash para poder deduplicar).
+
+    Returns:
+        Dict con 'total', 'hechos', 'errores', 'saltados', 'duplicados', 'paginas',
+        'productos' y 'segundos'
+    """
+    start = time.time()
+    manifest = BatchManifest(manifest_path)
+    writer = BatchWriter(output_dir)
+    stats = {
+        'total': len(pdf_files), 'hechos': 0, 'errores': 0, 'saltados': 0, 'duplicados': 0,
+        'paginas': 0, 'productos': 0, 'segundos': 0.0,
+    }
+
+    estados = manifest.estados()
+    pendientes, vistos = [], set()
+    for pdf_path in pdf_files:
+        with open(pdf_path, 'rb') as f:
+            clave = pdf_fingerprint(f.read())
+        estado = estados.get(clave)
+        if estado == HECHO or (estado == ERROR and not retry_failed):
+            stats['saltados'] += 1
+        elif clave in vistos:
+            stats['duplicados'] += 1
+        else:
+            vistos.add(clave)
+            pendientes.append((Path(pdf_path), clave))
+
+    log(
+        f"[BATCH] {len(pdf_files)} PDF(s): {len(pendientes)} pendientes, {stats['saltados']} ya en el manifiesto, "
+        f"{stats['duplicados']} duplicados; workers={workers}"
+    )
+
+    def _registrar(pdf_path, clave, result, error):
+        hechos = stats['hechos'] + stats['errores'] + 1
+        if error is not None:
+            stats['errores'] += 1
+            manifest.registrar(clave, pdf_path.name, ERROR, error=str(error))
+            log(f"[BATCH][ERROR] [{hechos}/{len(pendientes)}] {pdf_path.name}: {error}")
+            return
+        result.update(archivo=pdf_path.name, hash=clave)
+        writer.write(result)
+        manifest.registrar(
+            clave, pdf_path.name, HECHO, doc_type=result['doc_type'], paginas=result['paginas'],
+            productos=len(result['productos']), segundos=result['segundos'],
+        )
+        stats['hechos'] += 1
+        stats['paginas'] += result['paginas']
+        stats['productos'] += len(result['productos'])
+        log(
+            f"[BATCH] [{hechos}/{len(pendientes)}] {pdf_path.name} tipo={result['doc_type']} "
+            f"páginas={result['paginas']} productos={len(result['productos'])} {result['segundos']:.1f}s"
+        )
+
+    try:
+        if workers <= 1:
+            for pdf_path, clave in pendientes:
+                try:
+                    result, error = process_document(pdf_path), None
+                except Exception as e:
+                    result, error = None, e
+                _registrar(pdf_path, clave, result, error)
+        else:
+            _run_pooled(pendientes, workers, _registrar, log)
+    finally:
+        stats['segundos'] = time.time() - start
+        writer.close()
+        manifest.close()
+    return stats
+
+
+def _run_pooled(pendientes, workers, registrar, log=print):
+    # Los procesos del lote no abren su propio pool de páginas (heredan el entorno al arrancar)
+    os.environ['OCR_POOL_WORKERS'] = '1'
+    queue = iter(pendientes)
+    while True:
+        sin_registrar = _run_pool(queue, workers, registrar)
+        if not sin_registrar:
+            return
+        # Pool roto (un proceso murió: segfault, memoria): no se sabe cuál de los
+        # documentos en curso fue. Se repiten uno a uno, cada uno en su propio pool; el
+        # que lo vuelve a romper solo queda como error en el manifiesto y los lotes
+        # siguientes lo saltan, en vez de atascarse siempre en él
+        log(
+            f"[BATCH][ERROR] pool roto con {len(sin_registrar)} documento(s) en curso; "
+            f"se repiten uno a uno"
+        )
+        for pdf_path, clave in sin_registrar:
+            if _run_pool(iter([(pdf_path, clave)]), 1, registrar):
+                registrar(pdf_path, clave, None, "el proceso del lote murió procesando este documento")
+
+
+def _run_pool(queue, workers, registrar):
+    """
+    Reparte los documentos de `queue` en un pool nuevo hasta vaciarla.
+
+    Returns:
+        Los documentos en curso cuando se rompió el pool, sin registrar (lista
+        vacía si terminó la cola)
+    """
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_batch_worker,
+    )
+    en_curso = {}
+    roto = []
+
+    def _enviar(documento):
+        try:
+            en_curso[executor.submit(process_document, str(documento[0]))] = documento
+        except BrokenProcessPool:
+            roto.append(documento)
+
+    try:
+        # Como mucho dos documentos por worker en vuelo: miles de PDFs no se encolan de golpe
+        for documento in queue:
+            _enviar(documento)
+            if roto or len(en_curso) >= workers * 2:
+                break
+        while en_curso:
+            done, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_path, clave = documento = en_curso.pop(future)
+                try:
+                    result, error = future.result(), None
+                except BrokenProcessPool:
+                    roto.append(documento)
+                    continue
+                except Exception as e:
+                    result, error = None, e
+                registrar(pdf_path, clave, result, error)
+                siguiente = None if roto else next(queue, None)
+                if siguiente is not None:
+                    _enviar(siguiente)
+        return roto
+    finally:
+        # Ctrl+C: no esperar a los documentos en curso; se repetirán al retomar
+        executor.shutdown(wait=not en_curso, cancel_futures=True)
@@ -0,0 +1,150 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from .ocr import _env_bool
+from .resolution import resolution_label
+
+# Caché persistente de resultados de extracción, indexada por el hash del PDF
+OCR_CACHE_ENABLED = _env_bool('OCR_CACHE_ENABLED', default=True)
+OCR_CACHE_PATH = os.getenv(
+    'OCR_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), '.cache', 'extracciones.sqlite3')
+)
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', '2000'))
+OCR_CACHE_MAX_MB = int(os.getenv('OCR_CACHE_MAX_MB', '64'))
+OCR_CACHE_TTL_DAYS = int(os.getenv('OCR_CACHE_TTL_DAYS', '30'))
+
+# Subir esta versión cuando cambie la extracción para no servir resultados antiguos
+OCR_CACHE_VERSION = '3'
+
+# Metadatos que cambian al re-guardar el mismo documento y no afectan al contenido
+_VOLATILE_PDF_FIELDS = re.compile(
+    rb'/ID\s*\[\s*<[0-9A-Fa-f]*>\s*<[0-9A-Fa-f]*>\s*\]'
+    rb'|/(?:CreationDate|ModDate)\s*\([^)]*\)'
+)
+
+
+def pdf_fingerprint(pdf_bytes):
+    """
+    Hash del PDF normalizado: se ignoran el /ID del trailer y las fechas de
+    creación/modificación, que cambian aunque el albarán sea el mismo.
+    La versión de la caché y la resolución de OCR (fija o 'auto') forman parte de la clave.
+    """
+    normalized = _VOLATILE_PDF_FIELDS.sub(b'', pdf_bytes)
+    digest = hashlib.sha256(normalized).hexdigest()
+    return f"v{OCR_CACHE_VERSION}:{resolution_label()}:{digest}"
+
+
+class ExtractionCache:
+    """
+    Guarda la salida de `extract_albaran_data` (productos, doc_type, totales) en
+    SQLite, compartida entre los workers de gunicorn y persistente entre reinicios.
+    Expulsa por antigüedad (OCR_CACHE_TTL_DAYS) y por tamaño (entradas y MB),
+    empezando por las menos usadas recientemente.
+    """
+
+    def __init__(self, path=OCR_CACHE_PATH, max_entries=OCR_CACHE_MAX_ENTRIES,
+                 max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024, ttl_sec=OCR_CACHE_TTL_DAYS * 86400):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS extracciones ('
+                ' clave TEXT PRIMARY KEY,'
+                ' datos TEXT NOT NULL,'
+                ' bytes INTEGER NOT NULL,'
+                ' creado REAL NOT NULL,'
+                ' usado REAL NOT NULL)'
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, clave):
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                'SELECT datos FROM extracciones WHERE clave = ? AND creado >= ?',
+                (clave, now - self.ttl_sec)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute('UPDATE extracciones SET usado = ? WHERE clave = ?', (now, clave))
+            conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+        except Exception as e:
+            print(f"[OCR][cache][ERROR] lectura clave={clave[:24]}: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, clave, albaran_data):
+        now = time.time()
+        try:
+            datos = json.dumps(albaran_data, ensure_ascii=False)
+            conn = self._conn()
+            conn.execute(
+                'INSERT OR REPLACE INTO extracciones (clave, datos, bytes, creado, usado) VALUES (?, ?, ?, ?, ?)',
+                (clave, datos, len(datos), now, now)
+            )
+            conn.commit()
+            self.evict(now)
+        except Exception as e:
+            print(f"[OCR][cache][ERROR] escritura clave={clave[:24]}: {e}")
+
+    def evict(self, now=None):
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute('DELETE FROM extracciones WHERE creado < ?', (now - self.ttl_sec,))
+
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM extracciones').fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # Recorrer de la menos usada a la más usada hasta volver a estar dentro de los límites
+            sobrantes = []
+            for clave, size in conn.execute('SELECT clave, bytes FROM extracciones ORDER BY usado ASC'):
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                sobrantes.append((clave,))
+                count -= 1
+                total -= size
+            conn.executemany('DELETE FROM extracciones WHERE clave = ?', sobrantes)
+        conn.commit()
+
+    def stats(self):
+        try:
+            count, total = self._conn().execute(
+                'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM extracciones'
+            ).fetchone()
+        except Exception:
+            count, total = None, None
+        return {'entries': count, 'bytes': total, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache()
+        return _cache
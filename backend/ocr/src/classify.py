@@ -0,0 +1,105 @@
+import os
+import time
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from .ocr import ocr_page, score_languages
+from .orientation import estimate_pdf_page_rotation
+from .preprocess import preprocess_page
+from .extract import _detect_doc_type
+from .table import _bands
+from . import metrics
+
+# Detección de idioma/tipo de documento sobre una franja de cabecera a baja resolución,
+# en lugar de un OCR completo eng+spa+por de la primera página
+OCR_DETECT_DPI = int(os.getenv('OCR_DETECT_DPI', '120'))
+OCR_DETECT_STRIP = float(os.getenv('OCR_DETECT_STRIP', '0.3'))
+OCR_DETECT_LANG = os.getenv('OCR_DETECT_LANG', 'eng')
+# Líneas de texto de la franja que se reconocen (el coste del OCR crece con el texto, no con el área)
+OCR_DETECT_LINES = int(os.getenv('OCR_DETECT_LINES', '4'))
+# Palabras clave de ventaja que necesita el inglés sobre español y portugués para
+# usar el modelo `eng`; con empate o menos se mantiene 'spa+por'
+OCR_DETECT_ENG_MARGIN = int(os.getenv('OCR_DETECT_ENG_MARGIN', '1'))
+# Caracteres mínimos de la capa de texto para clasificar sin OCR
+_MIN_TEXT_LAYER_CHARS = 50
+
+
+def classify_document(pdf_path):
+    """
+    Decide el idioma de OCR y, si hay indicios claros, el tipo de documento a partir
+    de la primera página:
+
+    - si tiene capa de texto, se usa directamente (sin OCR)
+    - si no, se reconocen solo las primeras OCR_DETECT_LINES líneas de la franja
+      superior (OCR_DETECT_STRIP de la altura), renderizada a OCR_DETECT_DPI y
+      con un único idioma (OCR_DETECT_LANG)
+
+    Returns:
+        Dict con 'lang' (idioma detectado o None), 'ocr_lang' ('eng' o 'spa+por'),
+        'doc_type' (None si no hay marcadores claros; extract_albaran_data lo
+        detectará sobre el texto completo), 'source' y 'elapsed' (segundos)
+    """
+    start = time.time()
+    doc = fitz.open(str(pdf_path))
+    try:
+        page = doc[0]
+        text = page.get_text() or ''
+        source = 'text_layer'
+        if len(text.strip()) < _MIN_TEXT_LAYER_CHARS:
+            text = _header_strip_text(page)
+            source = 'header_strip'
+    except Exception as e:
+        print(f"[OCR][detect][ERROR] {pdf_path}: {e}")
+        text, source = '', 'error'
+    finally:
+        doc.close()
+
+    lang, scores = score_languages(text)
+    doc_type = _detect_doc_type(text) if text.strip() else None
+    if doc_type == 'portugues':
+        # Es el valor por defecto de _detect_doc_type, no un indicio
+        doc_type = None
+
+    # 'eng' es el primero del diccionario: un empate lo elige en `lang` sin ser un indicio
+    ingles = scores['eng'] >= max(scores['spa'], scores['por']) + OCR_DETECT_ENG_MARGIN
+    ocr_lang = 'eng' if ingles or doc_type == 'ingles' else 'spa+por'
+    elapsed = time.time() - start
+    metrics.observe('ocr_stage_seconds', elapsed, stage='detect_lang', source=source)
+    print(f"[OCR][detect] lang={lang} ocr_lang={ocr_lang} doc_type={doc_type} source={source}")
+    return {
+        'lang': lang,
+        'ocr_lang': ocr_lang,
+        'doc_type': doc_type,
+        'source': source,
+        'elapsed': elapsed,
+    }
+
+
+def _header_strip_text(page):
+    zoom = OCR_DETECT_DPI / 72
+    rect = page.rect
+    # Orientación sobre una miniatura: la cabecera puede estar abajo o en un lateral
+    rotation = estimate_pdf_page_rotation(page)
+    # Página derecha: renderizar solo la franja; girada: entera, para poder girarla
+    clip = fitz.Rect(0, 0, rect.width, rect.height * OCR_DETECT_STRIP) if rotation == 0 and page.rotation == 0 else None
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False, clip=clip)
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride)
+    pix = None
+
+    if clip is None:
+        image = image.rotate(rotation, expand=True)
+        image = image.crop((0, 0, image.width, max(1, int(image.height * OCR_DETECT_STRIP))))
+    image = preprocess_page(image, target_width=0)
+
+    # Cortar tras las primeras líneas de texto (título, emisor, cabecera de la tabla)
+    lines = _bands(np.asarray(image).min(axis=1) == 0, min_size=3)
+    if len(lines) > OCR_DETECT_LINES:
+        bottom = lines[OCR_DETECT_LINES - 1][1]
+        gap = lines[OCR_DETECT_LINES][0] - bottom
+        image = image.crop((0, 0, image.width, bottom + gap // 2))
+    image.info['dpi'] = (OCR_DETECT_DPI, OCR_DETECT_DPI)
+
+    text, _ = ocr_page(image, lang=OCR_DETECT_LANG, prefer_portrait=False)
+    return text
@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from .ocr import _env_bool
+
+_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.cache')
+
+# Cola persistente de trabajos de OCR (SQLite local, compartida entre gunicorn y `python -m ocr.worker`)
+OCR_QUEUE_PATH = os.getenv('OCR_QUEUE_PATH', os.path.join(_CACHE_DIR, 'ocr_jobs.sqlite3'))
+# Copia de cada PDF pendiente; se borra cuando el trabajo termina (bien o con error definitivo)
+OCR_SPOOL_DIR = os.getenv('OCR_SPOOL_DIR', os.path.join(_CACHE_DIR, 'spool'))
+# Un trabajo sin latido durante OCR_JOB_LEASE_SEC vuelve a estar disponible para otro worker
+OCR_JOB_LEASE_SEC = int(os.getenv('OCR_JOB_LEASE_SEC', '120'))
+OCR_JOB_HEARTBEAT_SEC = int(os.getenv('OCR_JOB_HEARTBEAT_SEC', '20'))
+OCR_JOB_MAX_ATTEMPTS = int(os.getenv('OCR_JOB_MAX_ATTEMPTS', '3'))
+# Espera antes de reintentar: intento * OCR_JOB_RETRY_DELAY_SEC
+OCR_JOB_RETRY_DELAY_SEC = int(os.getenv('OCR_JOB_RETRY_DELAY_SEC', '30'))
+# Sin `python -m ocr.worker` aparte (desarrollo con `python app.py`), consumir la cola
+# desde un hilo del propio proceso web
+OCR_QUEUE_EMBEDDED = _env_bool('OCR_QUEUE_EMBEDDED', default=False)
+
+# Estados de un trabajo
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+HECHO = 'hecho'
+ERROR = 'error'
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS trabajos ('
+    ' id TEXT PRIMARY KEY,'
+    ' pedido_id TEXT NOT NULL,'
+    ' pdf_path TEXT NOT NULL,'
+    ' clave_cache TEXT,'
+    ' estado TEXT NOT NULL,'
+    ' intentos INTEGER NOT NULL DEFAULT 0,'
+    ' max_intentos INTEGER NOT NULL,'
+    ' disponible_desde REAL NOT NULL,'
+    ' lease_owner TEXT,'
+    ' lease_hasta REAL,'
+    ' etapa TEXT,'
+    ' pagina INTEGER,'
+    ' paginas INTEGER,'
+    ' error TEXT,'
+    ' etapa_desde REAL,'
+    ' tiempos TEXT,'
+    ' creado REAL NOT NULL,'
+    ' iniciado REAL,'
+    ' actualizado REAL NOT NULL,'
+    ' terminado REAL)',
+    'CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado, disponible_desde)',
+    'CREATE INDEX IF NOT EXISTS trabajos_pedido ON trabajos (pedido_id, creado)',
+    'CREATE TABLE IF NOT EXISTS paginas ('
+    ' trabajo_id TEXT NOT NULL,'
+    ' pagina INTEGER NOT NULL,'
+    ' resultado TEXT NOT NULL,'
+    ' PRIMARY KEY (trabajo_id, pagina))',
+)
+# Columnas añadidas después de la primera versión de la tabla (colas ya creadas en disco)
+_COLUMNAS_NUEVAS = (
+    ('etapa_desde', 'REAL'),
+    ('tiempos', 'TEXT'),
+)
+
+
+class LeaseLost(RuntimeError):
+    """El worker ya no tiene el trabajo (lease vencido y reclamado por otro)."""
+
+
+class JobQueue:
+    """
+    Cola de trabajos de OCR con leases:
+
+    - `enqueue` copia el PDF al spool y crea el trabajo en estado pendiente
+    - `claim` entrega al worker el trabajo más antiguo disponible (pendiente, o en
+      curso con el lease vencido porque su worker murió) y le asigna un lease
+    - `heartbeat` renueva el lease y publica el progreso (etapa, página, tiempos por etapa)
+    - `save_page` guarda el resultado de cada página: un reintento no repite el OCR
+      de las páginas ya hechas
+    - `fail` reprograma el trabajo con espera creciente hasta `max_intentos`
+    """
+
+    def __init__(self, path=OCR_QUEUE_PATH, spool_dir=OCR_SPOOL_DIR):
+        self.path = path
+        self.spool_dir = spool_dir
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # isolation_level=None: las transacciones se abren a mano con BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            existentes = {row['name'] for row in conn.execute('PRAGMA table_info(trabajos)')}
+            for columna, tipo in _COLUMNAS_NUEVAS:
+                if columna not in existentes:
+                    conn.execute(f'ALTER TABLE trabajos ADD COLUMN {columna} {tipo}')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, pedido_id, pdf_path, clave_cache=None, max_intentos=OCR_JOB_MAX_ATTEMPTS):
+        """
+        Copia el PDF al spool (el original es un temporal del request) y encola el trabajo.
+
+        Returns:
+            id del trabajo
+        """
+        job_id = str(uuid.uuid4())
+        os.makedirs(self.spool_dir, exist_ok=True)
+        spool_path = os.path.join(self.spool_dir, f"{job_id}.pdf")
+        shutil.copyfile(pdf_path, spool_path)
+
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO trabajos (id, pedido_id, pdf_path, clave_cache, estado, max_intentos,'
+            ' disponible_desde, etapa, etapa_desde, creado, actualizado) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, pedido_id, spool_path, clave_cache, PENDIENTE, max_intentos, now, 'en_cola', now, now, now)
+        )
+        print(f"[OCR][queue] encolado trabajo={job_id} pedido={pedido_id}")
+        return job_id
+
+    def claim(self, worker_id, lease_sec=OCR_JOB_LEASE_SEC):
+        """Reserva el siguiente trabajo disponible, o None si no hay ninguno."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT * FROM trabajos'
+                ' WHERE (estado = ? AND disponible_desde <= ?)'
+                '    OR (estado = ? AND lease_hasta < ?)'
+                ' ORDER BY creado LIMIT 1',
+                (PENDIENTE, now, EN_CURSO, now)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+
+            if row['intentos'] >= row['max_intentos']:
+                # Lease vencido en el último intento permitido: el worker murió a mitad
+                conn.execute(
+                    'UPDATE trabajos SET estado = ?, error = ?, lease_owner = NULL, actualizado = ?,'
+                    ' terminado = ? WHERE id = ?',
+                    (ERROR, row['error'] or 'lease vencido sin terminar', now, now, row['id'])
+                )
+                conn.execute('COMMIT')
+                self._remove_spool(row['pdf_path'])
+                print(f"[OCR][queue][ERROR] trabajo={row['id']} sin intentos restantes")
+                return self.claim(worker_id, lease_sec)
+
+            conn.execute(
+                'UPDATE trabajos SET estado = ?, intentos = intentos + 1, lease_owner = ?, lease_hasta = ?,'
+                ' etapa = ?, etapa_desde = ?, iniciado = COALESCE(iniciado, ?), actualizado = ? WHERE id = ?',
+                (EN_CURSO, worker_id, now + lease_sec, 'iniciado', now, now, now, row['id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        job = dict(row)
+        job['intentos'] += 1
+        job['estado'] = EN_CURSO
+        job['lease_owner'] = worker_id
+        return job
+
+    def heartbeat(self, job_id, worker_id, lease_sec=OCR_JOB_LEASE_SEC, **progreso):
+        """
+        Renueva el lease y actualiza el progreso (etapa, pagina = páginas hechas,
+        paginas = total, tiempos = {etapa: segundos} de las etapas ya terminadas).
+
+        Raises:
+            LeaseLost: si el trabajo ya no pertenece a este worker
+        """
+        campos = {k: v for k, v in progreso.items() if k in ('etapa', 'pagina', 'paginas', 'tiempos')}
+        if 'tiempos' in campos:
+            campos['tiempos'] = json.dumps(campos['tiempos'])
+        now = time.time()
+        sets = ''
+        params = [now + lease_sec, now]
+        if 'etapa' in campos:
+            # etapa_desde solo cambia cuando cambia la etapa (los latidos la repiten)
+            sets += ', etapa_desde = CASE WHEN etapa IS ? THEN etapa_desde ELSE ? END'
+            params += [campos['etapa'], now]
+        sets += ''.join(f', {k} = ?' for k in campos)
+        cur = self._conn().execute(
+            f'UPDATE trabajos SET lease_hasta = ?, actualizado = ?{sets}'
+            ' WHERE id = ? AND lease_owner = ? AND estado = ?',
+            (*params, *campos.values(), job_id, worker_id, EN_CURSO)
+        )
+        if cur.rowcount == 0:
+            raise LeaseLost(f"trabajo={job_id} ya no pertenece a {worker_id}")
+
+    def save_page(self, job_id, page_result):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO paginas (trabajo_id, pagina, resultado) VALUES (?, ?, ?)',
+            (job_id, page_result['page'], json.dumps(page_result, ensure_ascii=False))
+        )
+
+    def load_pages(self, job_id):
+        """Páginas ya procesadas en intentos anteriores: {número: resultado}."""
+        rows = self._conn().execute(
+            'SELECT pagina, resultado FROM paginas WHERE trabajo_id = ?', (job_id,)
+        ).fetchall()
+        return {row['pagina']: json.loads(row['resultado']) for row in rows}
+
+    def complete(self, job_id, worker_id, tiempos=None):
+        self._finish(job_id, worker_id, HECHO, None, tiempos)
+
+    def fail(self, job_id, worker_id, error, tiempos=None):
+        """
+        Registra el fallo. Si quedan intentos, el trabajo vuelve a pendiente tras
+        intentos * OCR_JOB_RETRY_DELAY_SEC; si no, queda en error definitivo.
+
+        Returns:
+            True si se reintentará
+        """
+        conn = self._conn()
+        row = conn.execute('SELECT intentos, max_intentos FROM trabajos WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return False
+        if row['intentos'] >= row['max_intentos']:
+            self._finish(job_id, worker_id, ERROR, error, tiempos)
+            return False
+
+        now = time.time()
+        conn.execute(
+            'UPDATE trabajos SET estado = ?, lease_owner = NULL, lease_hasta = NULL, disponible_desde = ?,'
+            ' etapa = ?, etapa_desde = ?, tiempos = COALESCE(?, tiempos), error = ?, actualizado = ?'
+            ' WHERE id = ? AND lease_owner = ?',
+            (PENDIENTE, now + row['intentos'] * OCR_JOB_RETRY_DELAY_SEC, 'reintento', now,
+             json.dumps(tiempos) if tiempos else None, str(error), now, job_id, worker_id)
+        )
+        return True
+
+    def _finish(self, job_id, worker_id, estado, error, tiempos=None):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute('SELECT pdf_path FROM trabajos WHERE id = ?', (job_id,)).fetchone()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'UPDATE trabajos SET estado = ?, error = ?, etapa = ?, etapa_desde = ?, lease_owner = NULL,'
+                ' lease_hasta = NULL, tiempos = COALESCE(?, tiempos), actualizado = ?, terminado = ?'
+                ' WHERE id = ? AND lease_owner = ?',
+                (estado, str(error) if error else None, estado, now, json.dumps(tiempos) if tiempos else None,
+                 now, now, job_id, worker_id)
+            )
+            conn.execute('DELETE FROM paginas WHERE trabajo_id = ?', (job_id,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is not None:
+            self._remove_spool(row['pdf_path'])
+
+    def _remove_spool(self, pdf_path):
+        try:
+            os.unlink(pdf_path)
+        except OSError:
+            pass
+
+    def get(self, job_id):
+        row = self._conn().execute('SELECT * FROM trabajos WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def latest_for_pedido(self, pedido_id):
+        row = self._conn().execute(
+            'SELECT * FROM trabajos WHERE pedido_id = ? ORDER BY creado DESC LIMIT 1', (pedido_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def stats(self):
+        rows = self._conn().execute('SELECT estado, COUNT(*) AS n FROM trabajos GROUP BY estado').fetchall()
+        return {row['estado']: row['n'] for row in rows}
+
+
+def job_status(job, now=None):
+    """
+    Estado público de un trabajo para la API:
+
+    - 'estado': pendiente / en_curso / hecho / error
+    - 'etapa': en_cola, iniciado, deteccion, ocr (con 'pagina' de 'paginas'),
+      extraccion, insercion, reintento, hecho o error
+    - 'tiempos': segundos por etapa terminada, más 'en_cola' (espera hasta el primer intento)
+      y, si sigue en curso, 'etapa_seg' con lo que lleva la etapa actual
+    """
+    now = time.time() if now is None else now
+    tiempos = json.loads(job['tiempos']) if job.get('tiempos') else {}
+    if job['iniciado']:
+        tiempos.setdefault('en_cola', round(job['iniciado'] - job['creado'], 3))
+    terminado = job['estado'] in (HECHO, ERROR)
+    fin = job['terminado'] if terminado and job['terminado'] else now
+    return {
+        'trabajo_id': job['id'],
+        'pedido_id': job['pedido_id'],
+        'estado': job['estado'],
+        'etapa': job['etapa'],
+        'pagina': job['pagina'],
+        'paginas': job['paginas'],
+        'intentos': job['intentos'],
+        'max_intentos': job['max_intentos'],
+        'error': job['error'],
+        'tiempos': tiempos,
+        'etapa_seg': None if terminado or not job.get('etapa_desde') else round(now - job['etapa_desde'], 3),
+        'transcurrido_seg': round(fin - job['creado'], 3),
+        'creado': _iso(job['creado']),
+        'iniciado': _iso(job['iniciado']),
+        'actualizado': _iso(job['actualizado']),
+        'terminado': _iso(job['terminado']),
+    }
+
+
+def _iso(timestamp):
+    if not timestamp:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
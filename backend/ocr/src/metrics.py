@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import atexit
+import socket
+import threading
+from contextlib import contextmanager
+
+_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.cache')
+
+# Métricas del pipeline de OCR (tramos por etapa, contadores) en formato Prometheus.
+# No se importa _env_bool de ocr.py: ocr.py usa este módulo y sería un import circular
+OCR_METRICS = os.getenv('OCR_METRICS', '1').strip().lower() in ('1', 'true', 'yes', 'on')
+# Cada proceso (web, worker de OCR, procesos del pool) vuelca aquí su instantánea;
+# /metrics suma las de todos
+OCR_METRICS_DIR = os.getenv('OCR_METRICS_DIR', os.path.join(_CACHE_DIR, 'metrics'))
+OCR_METRICS_FLUSH_SEC = float(os.getenv('OCR_METRICS_FLUSH_SEC', '5'))
+# Instantáneas de procesos que ya no escriben: se descartan pasado este tiempo
+OCR_METRICS_TTL_SEC = int(os.getenv('OCR_METRICS_TTL_SEC', str(7 * 86400)))
+# Imprimir cada tramo ([METRICS] stage=... elapsed=...), para depurar en local
+OCR_METRICS_LOG_SPANS = os.getenv('OCR_METRICS_LOG_SPANS', '0').strip().lower() in ('1', 'true', 'yes', 'on')
+
+# Límites (segundos) de los histogramas de latencia
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Descripción de cada métrica para el # HELP de /metrics
+_HELP = {
+    'ocr_stage_seconds': 'Duración de cada etapa del pipeline de OCR',
+    'ocr_stage_errors_total': 'Etapas que terminaron con excepción',
+    'ocr_pages_total': 'Páginas procesadas con OCR',
+    'ocr_documents_total': 'Documentos procesados por el pipeline de OCR',
+    'ocr_passes_total': 'Pasadas de Tesseract (primary = OCR_PRIMARY_LANG, fallback = todos los idiomas '
+                        'por texto corto, ver OCR_PRIMARY_MIN_CHARS)',
+    'ocr_engine_calls_total': 'Llamadas a Tesseract por motor (capi residente o subprocess)',
+    'ocr_dpi_escalations_total': 'Páginas repetidas a más DPI por confianza baja',
+    'ocr_table_crop_total': 'Resultado de la detección de la tabla de productos',
+    'pedidos_extraccion_total': 'Pedidos creados por origen de los productos (cache, texto, ocr)',
+    'pedido_productos_filas_total': 'Filas de productos extraídos por resultado (insertada, omitida, error)',
+    'ocr_pages_per_second': 'Páginas por segundo de proceso de página (render + preprocesado + OCR)',
+    'ocr_lang_fallback_ratio': 'Fracción de pasadas primary que necesitaron el fallback de idioma',
+    'ocr_jobs': 'Trabajos en la cola de OCR por estado',
+    'supabase_http_conexiones': 'Conexiones del pool HTTP de Supabase del proceso web',
+    'supabase_http_peticiones': 'Peticiones a Supabase del proceso web desde que arrancó (error = respuestas 5xx)',
+    'pedidos_cache_consultas': 'Lecturas de pedidos del proceso web servidas desde la caché (hit) o desde Supabase (miss)',
+    'pedidos_cache_entradas': 'Entradas en la caché de lecturas de pedidos del proceso web',
+    'pedidos_cache_invalidaciones': 'Invalidaciones de la caché de pedidos hechas por el proceso web',
+}
+
+
+class MetricsRegistry:
+    """
+    Contadores e histogramas del proceso actual, identificados por
+    (nombre, etiquetas). `flush` escribe una instantánea JSON en OCR_METRICS_DIR
+    para que el proceso web pueda sumar las de los workers.
+    """
+
+    def __init__(self, directory=OCR_METRICS_DIR):
+        self.directory = directory
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        if not OCR_METRICS:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name, seconds, **labels):
+        if not OCR_METRICS:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist['buckets'][i] += 1
+                    break
+            hist['sum'] += seconds
+            hist['count'] += 1
+        self._maybe_flush()
+
+    def reset(self):
+        """Vacía el registro del proceso (benchmarks: medir cada documento por separado)."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'started': self._started,
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, list(labels), {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}]
+                    for (name, labels), h in self.histograms.items()
+                ],
+            }
+
+    def _path(self):
+        return os.path.join(self.directory, f"{socket.gethostname()}-{os.getpid()}.json")
+
+    def _maybe_flush(self):
+        if time.time() - self._last_flush >= OCR_METRICS_FLUSH_SEC:
+            self.flush()
+
+    def flush(self):
+        """Escribe la instantánea del proceso (escritura atómica: tmp + replace)."""
+        if not OCR_METRICS:
+            return
+        self._last_flush = time.time()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path()
+            tmp = f"{path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[METRICS][ERROR] no se pudo guardar la instantánea: {e}")
+
+
+_registry = MetricsRegistry()
+atexit.register(_registry.flush)
+
+
+def get_registry():
+    return _registry
+
+
+def inc(name, value=1, **labels):
+    _registry.inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    _registry.observe(name, seconds, **labels)
+
+
+def flush():
+    _registry.flush()
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Mide un tramo del pipeline en `ocr_stage_seconds{stage=...}`; si lanza una
+    excepción cuenta además `ocr_stage_errors_total` y la deja pasar.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc('ocr_stage_errors_total', stage=stage, **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('ocr_stage_seconds', elapsed, stage=stage, **labels)
+        if OCR_METRICS_LOG_SPANS:
+            extra = ''.join(f" {k}={v}" for k, v in labels.items())
+            print(f"[METRICS] stage={stage}{extra} elapsed={elapsed:.3f}s")
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# ============================================================
+#  EXPOSICIÓN (/metrics)
+# ============================================================
+
+
+def collect(directory=OCR_METRICS_DIR):
+    """
+    Suma las instantáneas de todos los procesos (más el estado en vivo del actual).
+
+    Returns:
+        (counters, histograms) con claves (nombre, etiquetas)
+    """
+    snapshots = {}
+    now = time.time()
+    if os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                if now - os.path.getmtime(path) > OCR_METRICS_TTL_SEC:
+                    os.unlink(path)
+                    continue
+                with open(path) as f:
+                    snapshots[filename] = json.load(f)
+            except (OSError, ValueError):
+                # Otro proceso la está reemplazando o se borró entre listdir y open
+                continue
+    snapshots[os.path.basename(_registry._path())] = _registry.snapshot()
+
+    counters, histograms = {}, {}
+    for snap in snapshots.values():
+        for name, labels, value in snap.get('counters', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, hist in snap.get('histograms', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0})
+            for i, n in enumerate(hist['buckets'][:len(BUCKETS)]):
+                total['buckets'][i] += n
+            total['sum'] += hist['sum']
+            total['count'] += hist['count']
+    return counters, histograms
+
+
+def render_prometheus(gauges=None):
+    """
+    Texto en formato de exposición de Prometheus (0.0.4) con los contadores,
+    los histogramas y, como gauges derivados, páginas/segundo y la tasa de
+    fallback de idioma. `gauges` añade otras series: {(nombre, etiquetas): valor}.
+    """
+    counters, histograms = collect()
+    lines = []
+
+    for name in sorted({name for name, _ in counters}):
+        _header(lines, name, 'counter')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+
+    for name in sorted({name for name, _ in histograms}):
+        _header(lines, name, 'histogram')
+        for (metric, labels), hist in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS, hist['buckets']):
+                cumulative += n
+                lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', _fmt_value(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(hist['sum'])}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {hist['count']}")
+
+    derived = dict(gauges or {})
+    pages = sum(v for (name, _), v in counters.items() if name == 'ocr_pages_total')
+    page_seconds = sum(
+        h['sum'] for (name, labels), h in histograms.items()
+        if name == 'ocr_stage_seconds' and ('stage', 'page') in labels
+    )
+    if page_seconds:
+        derived[('ocr_pages_per_second', ())] = pages / page_seconds
+    passes = {'primary': 0, 'fallback': 0}
+    for (name, labels), value in counters.items():
+        if name == 'ocr_passes_total':
+            attempt = dict(labels).get('attempt')
+            if attempt in passes:
+                passes[attempt] += value
+    if passes['primary']:
+        derived[('ocr_lang_fallback_ratio', ())] = passes['fallback'] / passes['primary']
+
+    for name in sorted({name for name, _ in derived}):
+        _header(lines, name, 'gauge')
+        for (metric, labels), value in sorted(derived.items()):
+            if metric == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def _header(lines, name, kind):
+    if name in _HELP:
+        lines.append(f"# HELP {name} {_HELP[name]}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _fmt_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _fmt_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
@@ -1,9 +1,17 @@
 import os
+import atexit
+import queue
 import shutil
-import time
+import unicodedata
+import threading
+from contextlib import contextmanager
 import pytesseract
 from PIL import Image, ImageOps
 
+from . import tess_capi
+from . import metrics
+from .orientation import correct_orientation, OCR_ORIENTATION
+
 # Ruta al ejecutable de Tesseract (compatible Windows y Linux/Docker)
 _tesseract = shutil.which('tesseract') or r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 pytesseract.pytesseract.tesseract_cmd = _tesseract
@@ -22,9 +30,24 @@ def _env_bool(name, default=False):
 OCR_TEXT_TIMEOUT = int(os.getenv('OCR_TEXT_TIMEOUT', '45'))
 OCR_DATA_TIMEOUT = int(os.getenv('OCR_DATA_TIMEOUT', '25'))
 OCR_OSD_TIMEOUT = int(os.getenv('OCR_OSD_TIMEOUT', '5'))
+# OSD de Tesseract (una pasada extra por página) para detectar páginas al revés; ya lo
+# cubre orientation.py, se mantiene solo como comprobación opcional
 OCR_USE_OSD = _env_bool('OCR_USE_OSD', default=False)
 OCR_PRIMARY_LANG = os.getenv('OCR_PRIMARY_LANG', 'spa')
 OCR_PRIMARY_MIN_CHARS = int(os.getenv('OCR_PRIMARY_MIN_CHARS', '120'))
+OCR_DPI = int(os.getenv('OCR_DPI', '220'))
+# Pool de procesos para OCR en paralelo por página (0 = según los cores disponibles)
+OCR_POOL_WORKERS = int(os.getenv('OCR_POOL_WORKERS', '0'))
+# Hilos OpenMP que puede usar cada Tesseract; workers * hilos no debe superar los cores
+OCR_THREADS_PER_JOB = int(os.getenv('OCR_THREADS_PER_JOB', '1'))
+
+# Tesseract (y los subprocesos que lanza pytesseract) leen este límite al arrancar
+os.environ.setdefault('OMP_THREAD_LIMIT', str(OCR_THREADS_PER_JOB))
+# Motor de OCR: 'capi' (motores residentes vía libtesseract), 'subprocess' (pytesseract)
+# o 'auto' (capi si la librería está disponible, si no subprocess)
+OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto').strip().lower()
+OCR_ENGINES_PER_LANG = int(os.getenv('OCR_ENGINES_PER_LANG', '1'))
+OCR_WARM_LANGS = [l.strip() for l in os.getenv('OCR_WARM_LANGS', 'spa,spa+por,eng').split(',') if l.strip()]
 
 
 def get_ocr_runtime_info(required_langs=None):
@@ -37,6 +60,7 @@ def get_ocr_runtime_info(required_langs=None):
         'version': None,
         'available_langs': [],
         'missing_langs': [],
+        'engine': get_engine_pool().stats(),
     }
 
     try:
@@ -55,61 +79,276 @@ def get_ocr_runtime_info(required_langs=None):
     return info
 
 
+# ============================================================
+#  POOL DE MOTORES DE TESSERACT
+# ============================================================
+
+
+class TesseractEnginePool:
+    """
+    Mantiene motores de Tesseract cargados por combinación de idiomas
+    (`spa`, `spa+por`, `eng`...) y los reutiliza entre páginas y trabajos, en vez
+    de lanzar un proceso `tesseract` que recarga los `.traineddata` en cada llamada.
+
+    Cada proceso (web o worker del pool de OCR) tiene su propio pool; dentro del
+    proceso cada motor lo usa un único hilo a la vez.
+    """
+
+    def __init__(self, mode=OCR_ENGINE, per_lang=OCR_ENGINES_PER_LANG):
+        self.mode = mode
+        self.per_lang = max(1, per_lang)
+        self._idle = {}
+        self._created = {}
+        self._lock = threading.Lock()
+        self._enabled = None
+        self.calls = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self):
+        if self._enabled is None:
+            if self.mode == 'subprocess':
+                self._enabled = False
+            else:
+                self._enabled = tess_capi.load_library() is not None
+                if not self._enabled:
+                    print(f"[OCR][engine] libtesseract no disponible, se usa pytesseract: {tess_capi.library_error()}")
+        return self._enabled
+
+    @contextmanager
+    def acquire(self, lang, oem=tess_capi.OEM_DEFAULT, psm=tess_capi.PSM_SINGLE_BLOCK):
+        key = (lang, oem, psm)
+        engine = self._checkout(key)
+        try:
+            yield engine
+        finally:
+            self._idle[key].put(engine)
+
+    def _checkout(self, key):
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.Queue())
+            try:
+                return idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._created.get(key, 0) < self.per_lang:
+                self._created[key] = self._created.get(key, 0) + 1
+                create = True
+            else:
+                create = False
+
+        if not create:
+            return idle.get()
+
+        try:
+            with metrics.span('engine_load', lang=key[0]):
+                engine = tess_capi.TesseractEngine(key[0], oem=key[1], psm=key[2])
+        except Exception:
+            with self._lock:
+                self._created[key] -= 1
+            raise
+        print(f"[OCR][engine] motor cargado lang={key[0]} psm={key[2]}")
+        return engine
+
+    def warm(self, langs):
+        for lang in langs:
+            try:
+                with self.acquire(lang):
+                    pass
+            except Exception as e:
+                print(f"[OCR][engine][ERROR] no se pudo precargar lang={lang}: {e}")
+
+    def close_all(self):
+        with self._lock:
+            for idle in self._idle.values():
+                while True:
+                    try:
+                        idle.get_nowait().close()
+                    except queue.Empty:
+                        break
+            self._idle.clear()
+            self._created.clear()
+
+    def count_call(self, capi=True):
+        # Los hilos del servidor y del worker llaman a la vez: `+= 1` no es atómico
+        with self._lock:
+            if capi:
+                self.calls += 1
+            else:
+                self.fallbacks += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'capi': bool(self._enabled),
+                'loaded': {f"{k[0]}/psm{k[2]}": n for k, n in self._created.items()},
+                'calls': self.calls,
+                'fallbacks': self.fallbacks,
+            }
+
+
+_engine_pool = TesseractEnginePool()
+atexit.register(_engine_pool.close_all)
+
+
+def get_engine_pool():
+    return _engine_pool
+
+
+def warm_ocr_engines(langs=None, background=False):
+    """
+    Precarga los motores de los idiomas habituales (OCR_WARM_LANGS) para que la
+    primera página no pague la carga de los modelos.
+    """
+    langs = OCR_WARM_LANGS if langs is None else langs
+    if not _engine_pool.enabled:
+        return
+    if background:
+        threading.Thread(target=_engine_pool.warm, args=(langs,), daemon=True, name='ocr-warm').start()
+    else:
+        _engine_pool.warm(langs)
+
+
+def _parse_tess_config(config):
+    """
+    Traduce la configuración estilo CLI (`--oem 3 --psm 6`) a (oem, psm).
+    Devuelve None si incluye opciones que el motor residente no soporta,
+    en cuyo caso se usa pytesseract.
+    """
+    oem, psm = tess_capi.OEM_DEFAULT, tess_capi.PSM_SINGLE_BLOCK
+    tokens = (config or '').split()
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in ('--oem', '--psm') and i + 1 < len(tokens) and tokens[i + 1].isdigit():
+            if tokens[i] == '--oem':
+                oem = int(tokens[i + 1])
+            else:
+                psm = int(tokens[i + 1])
+            i += 2
+            continue
+        return None
+    return oem, psm
+
+
+def _tess_image_to_data(image, lang, config, timeout_sec):
+    parsed = _parse_tess_config(config)
+    if parsed and _engine_pool.enabled:
+        _engine_pool.count_call()
+        metrics.inc('ocr_engine_calls_total', engine='capi', call='data')
+        with _engine_pool.acquire(lang, *parsed) as engine:
+            return engine.image_to_data(image, timeout_sec=timeout_sec)
+
+    _engine_pool.count_call(capi=False)
+    metrics.inc('ocr_engine_calls_total', engine='subprocess', call='data')
+    return pytesseract.image_to_data(
+        image,
+        lang=lang,
+        config=config,
+        output_type=pytesseract.Output.DICT,
+        timeout=timeout_sec
+    )
+
+
+def _tess_image_to_string(image, lang, config, timeout_sec=0):
+    parsed = _parse_tess_config(config)
+    if parsed and _engine_pool.enabled:
+        _engine_pool.count_call()
+        metrics.inc('ocr_engine_calls_total', engine='capi', call='string')
+        with _engine_pool.acquire(lang, *parsed) as engine:
+            return engine.image_to_string(image, timeout_sec=timeout_sec)
+
+    _engine_pool.count_call(capi=False)
+    metrics.inc('ocr_engine_calls_total', engine='subprocess', call='string')
+    return pytesseract.image_to_string(image, lang=lang, config=config, timeout=timeout_sec)
+
+
+def _tess_osd_rotation(image, lang, timeout_sec=0):
+    """Grados a rotar según OSD (equivalente al campo `Rotate:` de image_to_osd)."""
+    if _engine_pool.enabled:
+        _engine_pool.count_call()
+        metrics.inc('ocr_engine_calls_total', engine='capi', call='osd')
+        # osd.traineddata solo funciona con el motor legacy (oem 0) y psm 0 (solo OSD)
+        with _engine_pool.acquire('osd', 0, 0) as engine:
+            deg = engine.detect_rotation(image)
+        return None if deg is None else (360 - deg) % 360
+
+    _engine_pool.count_call(capi=False)
+    metrics.inc('ocr_engine_calls_total', engine='subprocess', call='osd')
+    osd = pytesseract.image_to_osd(image, lang=lang, timeout=timeout_sec)
+    return _parse_osd_rotation(osd)
+
+
 # ============================================================
 #  DETECCIÓN DE IDIOMA
 # ============================================================
 
 
+# Palabras clave por idioma (una selección pequeña pero confiable)
+LANGUAGE_KEYWORDS = {
+    'eng': ['invoice', 'packing', 'weight', 'quantity', 'total', 'date', 'goods', 'description', 'price', 'receipt'],
+    'spa': ['factura', 'albarán', 'cantidad', 'peso', 'precio', 'total', 'fecha', 'producto', 'concepto', 'descripción'],
+    'por': ['nota', 'quantidade', 'peso', 'preço', 'data', 'total', 'descrição', 'fatura', 'recibo'],
+    'fra': ['facture', 'quantité', 'poids', 'prix', 'date', 'total', 'description', 'montant', 'article'],
+    'deu': ['rechnung', 'gewicht', 'menge', 'preis', 'datum', 'summe', 'artikel', 'beschreibung', 'gesamtbetrag'],
+    'ita': ['fattura', 'quantità', 'peso', 'prezzo', 'data', 'totale', 'articolo', 'descrizione', 'importo'],
+}
+
+
+def score_languages(text):
+    """
+    Cuenta las palabras clave de cada idioma presentes en el texto. Se comparan
+    sin tildes: con el modelo `eng` "albarán" sale como "albaran".
+
+    Returns:
+        Tupla (idioma con más coincidencias o None si no hay ninguna, dict de puntuaciones)
+    """
+    text = _strip_accents(text.lower())
+    scores = {lang: 0 for lang in LANGUAGE_KEYWORDS}
+    for lang, words_list in LANGUAGE_KEYWORDS.items():
+        for keyword in words_list:
+            if _strip_accents(keyword) in text:
+                scores[lang] += 1
+
+    max_score = max(scores.values())
+    if max_score > 0:
+        return max(scores, key=scores.get), scores
+    return None, scores
+
+
+def _strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+
 def detect_language_from_image(image_path):
     """
-    Detecta el idioma principal de una imagen usando Tesseract y análisis de palabras clave
+    Detecta el idioma principal de una imagen usando Tesseract y análisis de palabras clave.
+    Hace un OCR completo con eng+spa+por; para PDFs es más barato `classify.classify_document`.
     
     Args:
-        image_path: Ruta a la imagen
+        image_path: Ruta a la imagen o imagen PIL ya cargada
     
     Returns:
         String con el código de idioma detectado (ej: 'spa', 'eng', 'fra', 'deu', 'por', etc.)
     """
-    image = Image.open(image_path)
-    image = ImageOps.exif_transpose(image)
+    image = _open_image(image_path)
     
     # Primero, hacer OCR con inglés para obtener el texto
     try:
         config = r'--oem 3 --psm 6'
-        text = pytesseract.image_to_string(image, lang='eng+spa+por', config=config).lower()
+        text = _tess_image_to_string(image, 'eng+spa+por', config).lower()
     except:
         return 'eng'  # Default a inglés si falla
     
-    # Palabras clave por idioma (una selección pequeña pero confiable)
-    keywords = {
-        'eng': ['invoice', 'packing', 'weight', 'quantity', 'total', 'date', 'goods', 'description', 'price', 'receipt'],
-        'spa': ['factura', 'albarán', 'cantidad', 'peso', 'precio', 'total', 'fecha', 'producto', 'concepto', 'descripción'],
-        'por': ['nota', 'quantidade', 'peso', 'preço', 'data', 'total', 'descrição', 'fatura', 'recibo'],
-        'fra': ['facture', 'quantité', 'poids', 'prix', 'date', 'total', 'description', 'montant', 'article'],
-        'deu': ['rechnung', 'gewicht', 'menge', 'preis', 'datum', 'summe', 'artikel', 'beschreibung', 'gesamtbetrag'],
-        'ita': ['fattura', 'quantità', 'peso', 'prezzo', 'data', 'totale', 'articolo', 'descrizione', 'importo'],
-    }
-    
-    # Contar coincidencias de palabras clave
-    scores = {lang: 0 for lang in keywords}
-    
-    for lang, words_list in keywords.items():
-        for keyword in words_list:
-            if keyword in text:
-                scores[lang] += 1
-    
     # Si encuentra palabras clave, usar el idioma con más coincidencias
-    max_score = max(scores.values())
-    if max_score > 0:
-        detected_lang = max(scores, key=scores.get)
+    detected_lang, _ = score_languages(text)
+    if detected_lang:
         return detected_lang
     
     # Fallback: usar la puntuación de Tesseract OSD si no hay palabras clave
     try:
-        osd = pytesseract.image_to_osd(image)
-        for line in osd.split('\n'):
-            if line.startswith('Script:'):
-                return 'eng'  # Default a inglés
+        if _tess_osd_rotation(image, 'osd') is not None:
+            return 'eng'  # Default a inglés
     except:
         pass
     
@@ -121,9 +360,7 @@ def detect_language_from_image(image_path):
 def process_image_with_ocr(image_path, lang='spa+por', timeout_sec=None, use_osd=None):
     """
     Procesa una imagen con Tesseract OCR
-    Aplica una orientación básica para documentos verticales:
-    - rota si la imagen está en horizontal (probablemente PDF escaneado girado)
-    - usa OSD para detectar si está al revés (180°)
+    Antes corrige la orientación (0/90/180/270 e inclinación, ver orientation.py)
 
     Args:
         image_path: Ruta a la imagen
@@ -135,40 +372,8 @@ def process_image_with_ocr(image_path, lang='spa+por', timeout_sec=None, use_osd
     timeout_sec = OCR_TEXT_TIMEOUT if timeout_sec is None else timeout_sec
     use_osd = OCR_USE_OSD if use_osd is None else use_osd
 
-    image = Image.open(image_path)
-    step_start = time.time()
-    print(f"[OCR][process_image_with_ocr] START image={image_path} lang={lang} timeout={timeout_sec} use_osd={use_osd}")
-
-    # Aplicar transpose EXIF primero
-    try:
-        image = ImageOps.exif_transpose(image)
-    except:
-        pass
-
-    # Si está en formato landscape, rotamos 90° para ponerlo en portrait
-    if image.width > image.height:
-        print(f"[OCR][process_image_with_ocr] rotate portrait width={image.width} height={image.height}")
-        image = image.rotate(90, expand=True)
-
-    # Intentar detectar rotación 180 usando OSD (rápido)
-    if use_osd:
-        try:
-            osd_start = time.time()
-            print(f"[OCR][process_image_with_ocr] OSD start image={image_path} timeout={OCR_OSD_TIMEOUT}")
-            osd = pytesseract.image_to_osd(image, lang=lang, timeout=OCR_OSD_TIMEOUT)
-            print(f"[OCR][process_image_with_ocr] OSD done image={image_path} elapsed={time.time()-osd_start:.2f}s")
-            rot = _parse_osd_rotation(osd)
-            if rot == 180:
-                image = image.rotate(180, expand=True)
-                print(f"[OCR][process_image_with_ocr] OSD rotate=180 image={image_path}")
-        except Exception as e:
-            print(f"[OCR][process_image_with_ocr] OSD skipped/fail image={image_path} error={e}")
-    else:
-        print(f"[OCR][process_image_with_ocr] OSD disabled image={image_path}")
-
-    # Convertir a RGB si no lo es
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
+    image = _load_image_for_ocr(image_path, lang=lang, use_osd=use_osd)
+    image_path = _image_label(image_path)
 
     # OCR directo con configuración rápido
     custom_config = r'--oem 3 --psm 6'
@@ -177,32 +382,176 @@ def process_image_with_ocr(image_path, lang='spa+por', timeout_sec=None, use_osd
         # Fallback to requested multi-language only if result is too short.
         first_lang = OCR_PRIMARY_LANG if '+' in lang else lang
 
-        first_start = time.time()
-        print(f"[OCR][process_image_with_ocr] OCR start image={image_path} lang={first_lang} config={custom_config}")
-        text = pytesseract.image_to_string(image, lang=first_lang, config=custom_config, timeout=timeout_sec)
-        print(
-            f"[OCR][process_image_with_ocr] OCR done image={image_path} lang={first_lang} "
-            f"elapsed={time.time()-first_start:.2f}s chars={len(text)}"
-        )
+        with metrics.span('ocr_text', lang=first_lang):
+            text = _tess_image_to_string(image, first_lang, custom_config, timeout_sec)
+        metrics.inc('ocr_passes_total', stage='ocr_text', attempt='primary')
 
         if '+' in lang and len((text or '').strip()) < OCR_PRIMARY_MIN_CHARS:
-            fallback_start = time.time()
             print(
-                f"[OCR][process_image_with_ocr] OCR fallback start image={image_path} "
+                f"[OCR][process_image_with_ocr] OCR fallback image={image_path} "
                 f"lang={lang} reason=short_text({len((text or '').strip())}<{OCR_PRIMARY_MIN_CHARS})"
             )
-            text = pytesseract.image_to_string(image, lang=lang, config=custom_config, timeout=timeout_sec)
+            metrics.inc('ocr_passes_total', stage='ocr_text', attempt='fallback')
+            with metrics.span('ocr_text', lang=lang):
+                text = _tess_image_to_string(image, lang, custom_config, timeout_sec)
+
+        return text
+    except Exception as e:
+        print(f"[OCR][process_image_with_ocr][ERROR] image={image_path} error={e}")
+        return ""
+
+def ocr_page(image_path, lang='spa+por', config=None, timeout_sec=None, use_osd=None, prefer_portrait=True):
+    """
+    Ejecuta Tesseract UNA sola vez por página y devuelve tanto el texto plano
+    como el diccionario de palabras con coordenadas.
+
+    El texto se reconstruye a partir de la salida TSV de `image_to_data`
+    (bloque/párrafo/línea), así que no hace falta una segunda pasada con
+    `image_to_string`. Mantiene la misma estrategia de idioma que
+    `process_image_with_ocr`: primero `OCR_PRIMARY_LANG` y, si el texto sale
+    demasiado corto, una única pasada con todos los idiomas pedidos.
+
+    Args:
+        image_path: Ruta a la imagen o imagen PIL ya cargada
+        lang: Idiomas para OCR (español + portugués)
+        config: Configuración de Tesseract (por defecto `--oem 3 --psm 6`)
+        prefer_portrait: Corregir orientación e inclinación (False para recortes, p. ej.
+                         la tabla de productos o la franja de cabecera, que ya vienen derechos)
+
+    Returns:
+        Tupla (texto, datos). `datos` es None si el OCR falla.
+    """
+    timeout_sec = OCR_TEXT_TIMEOUT if timeout_sec is None else timeout_sec
+    use_osd = OCR_USE_OSD if use_osd is None else use_osd
+    if config is None:
+        config = r'--oem 3 --psm 6'
+
+    image = _load_image_for_ocr(image_path, lang=lang, use_osd=use_osd, prefer_portrait=prefer_portrait)
+    image_path = _image_label(image_path)
+
+    try:
+        first_lang = OCR_PRIMARY_LANG if '+' in lang else lang
+
+        with metrics.span('ocr_data', lang=first_lang):
+            data = _tess_image_to_data(image, first_lang, config, timeout_sec)
+        text = _text_from_ocr_data(data)
+        metrics.inc('ocr_passes_total', stage='ocr_data', attempt='primary')
+
+        if '+' in lang and len(text.strip()) < OCR_PRIMARY_MIN_CHARS:
             print(
-                f"[OCR][process_image_with_ocr] OCR fallback done image={image_path} lang={lang} "
-                f"elapsed={time.time()-fallback_start:.2f}s chars={len(text)}"
+                f"[OCR][ocr_page] OCR fallback image={image_path} "
+                f"lang={lang} reason=short_text({len(text.strip())}<{OCR_PRIMARY_MIN_CHARS})"
             )
+            metrics.inc('ocr_passes_total', stage='ocr_data', attempt='fallback')
+            with metrics.span('ocr_data', lang=lang):
+                data = _tess_image_to_data(image, lang, config, timeout_sec)
+            text = _text_from_ocr_data(data)
 
-        print(f"[OCR][process_image_with_ocr] TOTAL image={image_path} elapsed={time.time()-step_start:.2f}s")
-        return text
+        return text, data
     except Exception as e:
-        print(f"[OCR][process_image_with_ocr][ERROR] image={image_path} elapsed={time.time()-step_start:.2f}s error={e}")
+        print(f"[OCR][ocr_page][ERROR] image={image_path} error={e}")
+        return "", None
+
+
+def _text_from_ocr_data(data):
+    """
+    Reconstruye el texto plano (equivalente a `image_to_string`) a partir del
+    diccionario de `image_to_data`: palabras de una misma línea separadas por
+    espacio, líneas por salto de línea y párrafos/bloques por una línea vacía.
+    """
+    if not data:
         return ""
 
+    texts = data.get('text', [])
+    levels = data.get('level', [5] * len(texts))
+    out = []
+    current_line = None
+    current_par = None
+    line_words = []
+
+    for i, word in enumerate(texts):
+        if levels[i] != 5:
+            continue
+        word = (word or '').strip()
+        if not word:
+            continue
+
+        par_key = (data['page_num'][i], data['block_num'][i], data['par_num'][i])
+        line_key = par_key + (data['line_num'][i],)
+
+        if line_key != current_line:
+            if line_words:
+                out.append(' '.join(line_words))
+            if current_par is not None and par_key != current_par:
+                out.append('')
+            line_words = []
+            current_line = line_key
+            current_par = par_key
+
+        line_words.append(word)
+
+    if line_words:
+        out.append(' '.join(line_words))
+
+    return '\n'.join(out) + '\n' if out else ""
+
+
+def _load_image_for_ocr(image_path, lang='spa+por', use_osd=False, prefer_portrait=True):
+    """
+    Abre la imagen y aplica la orientación común a todas las pasadas de OCR:
+    EXIF transpose, orientación e inclinación por perfiles de proyección (salvo en
+    páginas que ya la traen corregida del render) y, opcionalmente, OSD para 180°.
+    """
+    image = _open_image(image_path)
+
+    if prefer_portrait and OCR_ORIENTATION and 'orientation' not in image.info:
+        with metrics.span('orientation'):
+            image, orientation = correct_orientation(image)
+        if orientation['rotation'] or orientation['skew']:
+            print(
+                f"[OCR][_load_image_for_ocr] rotación={orientation['rotation']} inclinación={orientation['skew']} "
+                f"confianza={orientation['confidence']} image={_image_label(image_path)}"
+            )
+
+    if use_osd:
+        try:
+            with metrics.span('osd'):
+                rot = _tess_osd_rotation(image, lang, timeout_sec=OCR_OSD_TIMEOUT)
+            if rot == 180:
+                image = image.rotate(180, expand=True)
+                print(f"[OCR][_load_image_for_ocr] OSD rotate=180 image={_image_label(image_path)}")
+        except Exception as e:
+            print(f"[OCR][_load_image_for_ocr] OSD skipped/fail image={_image_label(image_path)} error={e}")
+
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    return image
+
+
+def _open_image(image):
+    """
+    Acepta una ruta o una imagen PIL ya cargada (pipeline en memoria).
+    Solo las imágenes leídas de disco pueden traer EXIF, así que el transpose
+    se aplica únicamente en ese caso.
+    """
+    if isinstance(image, Image.Image):
+        return image
+
+    image = Image.open(image)
+    try:
+        image = ImageOps.exif_transpose(image)
+    except:
+        pass
+    return image
+
+
+def _image_label(image):
+    if isinstance(image, Image.Image):
+        return f"<memoria {image.width}x{image.height}>"
+    return image
+
+
 def _parse_osd_rotation(osd_text):
     for line in osd_text.split('\n'):
         if 'Rotate' in line:
@@ -218,7 +567,10 @@ def _parse_osd_rotation(osd_text):
 def normalize_orientation(image, lang='spa+por', prefer_portrait=True):
     """
     Corrige únicamente usando EXIF transpose sin lógica adicional.
+    Las páginas renderizadas en memoria no tienen EXIF: se devuelven sin copiar.
     """
+    if not image.getexif().get(0x0112):
+        return image
     return ImageOps.exif_transpose(image)
 
 
@@ -233,40 +585,14 @@ def get_ocr_data(image_path, lang='eng', config=None):
     Returns:
         Dict con información detallada del OCR
     """
-    image = Image.open(image_path)
-    step_start = time.time()
-    print(f"[OCR][get_ocr_data] START image={image_path} lang={lang} timeout={OCR_DATA_TIMEOUT}")
-    try:
-        image = ImageOps.exif_transpose(image)
-    except:
-        pass
-
-    # Si la imagen viene en landscape, rotar para portrait (igual que en process_image)
-    if image.width > image.height:
-        print(f"[OCR][get_ocr_data] rotate portrait width={image.width} height={image.height}")
-        image = image.rotate(90, expand=True)
-
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
+    image = _load_image_for_ocr(image_path, lang=lang)
+    image_path = _image_label(image_path)
     
     try:
         if config is None:
             config = r'--oem 3 --psm 6'
-        data_start = time.time()
-        print(f"[OCR][get_ocr_data] image_to_data start image={image_path} config={config}")
-        data = pytesseract.image_to_data(
-            image,
-            lang=lang,
-            config=config,
-            output_type=pytesseract.Output.DICT,
-            timeout=OCR_DATA_TIMEOUT
-        )
-        words = len(data.get('text', [])) if isinstance(data, dict) else -1
-        print(
-            f"[OCR][get_ocr_data] image_to_data done image={image_path} "
-            f"elapsed={time.time()-data_start:.2f}s words={words} total={time.time()-step_start:.2f}s"
-        )
-        return data
+        with metrics.span('ocr_data', lang=lang):
+            return _tess_image_to_data(image, lang, config, OCR_DATA_TIMEOUT)
     except Exception as e:
-        print(f"[OCR][get_ocr_data][ERROR] image={image_path} elapsed={time.time()-step_start:.2f}s error={e}")
-        return None
\ No newline at end of file
+        print(f"[OCR][get_ocr_data][ERROR] image={image_path} error={e}")
+        return None
@@ -0,0 +1,251 @@
+import os
+import math
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from .preprocess import preprocess_page, otsu_threshold_from_hist
+
+# Orientación (0/90/180/270) e inclinación de la página por perfiles de proyección,
+# sin pasada extra de Tesseract (OSD). No se importa _env_bool de ocr.py: ocr.py usa
+# este módulo y sería un import circular
+OCR_ORIENTATION = os.getenv('OCR_ORIENTATION', '1').strip().lower() in ('1', 'true', 'yes', 'on')
+# Ancho de trabajo: la página se reduce a este ancho aproximado antes de estimar
+OCR_ORIENT_WIDTH = int(os.getenv('OCR_ORIENT_WIDTH', '1000'))
+# Inclinación máxima que se busca y mínima que se corrige (grados)
+OCR_MAX_SKEW = float(os.getenv('OCR_MAX_SKEW', '5'))
+OCR_MIN_SKEW = float(os.getenv('OCR_MIN_SKEW', '0.3'))
+# Resolución de la miniatura con la que se orientan páginas de PDF (vista previa, detección)
+OCR_ORIENT_DPI = int(os.getenv('OCR_ORIENT_DPI', '72'))
+# Una página apaisada solo se gira 90/270 si el perfil girado tiene al menos esta
+# energía relativa: en tablas las columnas alineadas también dan un perfil marcado
+OCR_ORIENT_AXIS_RATIO = float(os.getenv('OCR_ORIENT_AXIS_RATIO', '1.5'))
+# Confianza mínima del voto arriba/abajo para dar la vuelta (180°) a la página
+OCR_ORIENT_FLIP_CONF = float(os.getenv('OCR_ORIENT_FLIP_CONF', '0.15'))
+# Confianza mínima para girar el PDF guardado (vista previa, firma); por debajo, el
+# giro solo se aplica a la imagen que va al OCR
+OCR_ORIENT_APPLY_CONF = float(os.getenv('OCR_ORIENT_APPLY_CONF', '0.4'))
+
+# Por debajo de tantos píxeles de tinta (en la imagen reducida) la página se deja como está
+_MIN_INK = 500
+# Puntos de tinta que se usan como máximo en la búsqueda de inclinación
+_MAX_POINTS = 100_000
+
+
+def estimate_orientation(image, max_skew=None):
+    """
+    Estima cuánto hay que girar la página para dejar el texto derecho.
+
+    - 0/180 frente a 90/270: las líneas de texto dan un perfil de filas a franjas
+      (tinta / interlineado) más marcado que el de columnas; se compara la energía
+      del perfil (suma de diferencias al cuadrado entre filas vecinas) con la
+      página tal cual y girada 90°. Solo en páginas apaisadas, y solo si la girada
+      gana por OCR_ORIENT_AXIS_RATIO: en una tabla vertical las columnas alineadas
+      pueden dar más energía que las filas.
+    - inclinación: el ángulo que maximiza esa misma energía al proyectar la tinta
+      a lo largo de rectas inclinadas (búsqueda gruesa cada 0.5° y fina cada 0.1°).
+    - derecha o del revés: en cada línea la banda central (altura de la x) queda
+      abajo, porque hay más ascendentes (mayúsculas, dígitos, b d f h k l t) que
+      descendentes (g j p q y); con la tinta por encima < por debajo, está al revés.
+      Se da la vuelta solo con confianza OCR_ORIENT_FLIP_CONF o más.
+
+    Args:
+        image: PIL Image (binarizada o en grises)
+        max_skew: Inclinación máxima a buscar en grados (por defecto OCR_MAX_SKEW)
+
+    Returns:
+        Dict con 'rotation' (grados en sentido antihorario, como `Image.rotate`:
+        0/90/180/270), 'skew' (grados, también antihorario) y 'confidence' (0-1,
+        lo claro que está el sentido arriba/abajo)
+    """
+    max_skew = OCR_MAX_SKEW if max_skew is None else max_skew
+    ys, xs, height, width = _ink_points(image)
+    if len(ys) < _MIN_INK:
+        return {'rotation': 0, 'skew': 0.0, 'confidence': 0.0}
+
+    # Página tal cual (k=0) y, si es apaisada, girada 90° antihorario (k=1): rot90
+    # lleva (y, x) a (W-1-x, y)
+    k, cy, cx = 0, ys, xs
+    skew, score = _best_skew(cy, cx, max_skew)
+    if width > height:
+        skew_90, score_90 = _best_skew(width - 1 - xs, ys, max_skew)
+        if score_90 >= OCR_ORIENT_AXIS_RATIO * score:
+            k, cy, cx, skew = 1, width - 1 - xs, ys, skew_90
+        elif score_90 * OCR_ORIENT_AXIS_RATIO > score:
+            # Ningún eje gana con claridad: el voto arriba/abajo no tendría sentido
+            return {'rotation': 0, 'skew': 0.0, 'confidence': 0.0}
+
+    upright, confidence = _upright_score(cy, cx, skew)
+    # Con voto dudoso: derecha, o girada 90° (lo que hacía el giro de apaisada a vertical)
+    rotation = 90 * k + (180 if not upright and confidence >= OCR_ORIENT_FLIP_CONF else 0)
+    return {'rotation': rotation % 360, 'skew': round(skew, 2), 'confidence': round(float(confidence), 3)}
+
+
+def correct_orientation(image, estimate=None):
+    """
+    Gira la página según `estimate_orientation` (los múltiplos de 90° son una
+    transposición exacta; la inclinación, una rotación con fondo blanco).
+
+    Returns:
+        Tupla (imagen corregida, estimación)
+    """
+    if estimate is None:
+        estimate = estimate_orientation(image)
+    rotation, skew = estimate['rotation'], estimate['skew']
+    if rotation:
+        image = image.rotate(rotation, expand=True)
+    if abs(skew) >= OCR_MIN_SKEW:
+        # Página binarizada: vecino más próximo para que siga siendo 0/255
+        resample = Image.Resampling.NEAREST if _is_binary(image) else Image.Resampling.BICUBIC
+        fill = 255 if image.mode in ('1', 'L') else (255,) * len(image.getbands())
+        image = image.rotate(skew, resample=resample, expand=True, fillcolor=fill)
+    return image, estimate
+
+
+def estimate_pdf_page_rotation(page, dpi=None, min_confidence=0.0):
+    """
+    Orientación de una página de PyMuPDF tal como se muestra (con su /Rotate),
+    a partir de una miniatura a OCR_ORIENT_DPI. La usan la detección de idioma,
+    la vista previa y la firma, que tienen que coincidir entre sí.
+
+    Args:
+        min_confidence: Por debajo de esta confianza se devuelve 0. Al guardar el
+            PDF, la vista previa y la firma usan OCR_ORIENT_APPLY_CONF: un giro
+            dudoso no se escribe en el documento (el OCR orienta su propio render)
+
+    Returns:
+        Grados a girar en sentido antihorario (0/90/180/270)
+    """
+    if not OCR_ORIENTATION:
+        return 0
+    zoom = (dpi or OCR_ORIENT_DPI) / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride)
+    estimate = estimate_orientation(image)
+    return estimate['rotation'] if estimate['confidence'] >= min_confidence else 0
+
+
+def _ink_points(image):
+    """Coordenadas (y, x) de la tinta en la página reducida a ~OCR_ORIENT_WIDTH de ancho."""
+    if image.mode != 'L':
+        image = image.convert('L')
+    # Página ya binarizada (la del pipeline) o en grises (miniaturas, imágenes sueltas)
+    binary = _is_binary(image)
+    factor = max(1, round(min(image.width, image.height) / OCR_ORIENT_WIDTH))
+    if factor > 1:
+        # Promedio por bloques: un trazo fino sigue siendo más oscuro que el fondo
+        image = image.reduce(factor)
+    if binary:
+        gray = np.asarray(image)
+        # El histograma de una de cada 16 muestras basta para el umbral
+        ink = gray <= otsu_threshold_from_hist(np.bincount(gray[::4, ::4].ravel(), minlength=256))
+    else:
+        # Escaneos con fondo gris o degradado: el Otsu directo parte el fondo en dos
+        gray = np.asarray(preprocess_page(image, target_width=0))
+        ink = gray == 0
+    ys, xs = np.nonzero(ink)
+    if len(ys) > gray.size // 2:
+        # Más tinta que fondo: umbral fallido o página en negativo
+        return ys[:0], xs[:0], gray.shape[0], gray.shape[1]
+    if len(ys) > _MAX_POINTS:
+        step = len(ys) // _MAX_POINTS + 1
+        ys, xs = ys[::step], xs[::step]
+    return ys.astype(np.float64), xs.astype(np.float64), gray.shape[0], gray.shape[1]
+
+
+def _profile(ys, xs, skew):
+    # Perfil de filas a lo largo de rectas con pendiente `skew` (grados)
+    shifted = ys - xs * math.tan(math.radians(skew))
+    return np.bincount(np.rint(shifted - shifted.min()).astype(np.int64)).astype(np.float64)
+
+
+def _profile_energy(ys, xs, skew):
+    diff = np.diff(_profile(ys, xs, skew))
+    return float(np.dot(diff, diff))
+
+
+def _best_skew(ys, xs, max_skew):
+    coarse = np.arange(-max_skew, max_skew + 1e-9, 0.5)
+    best = max(coarse, key=lambda a: _profile_energy(ys, xs, a))
+    fine = np.arange(best - 0.4, best + 0.4 + 1e-9, 0.1)
+    scored = [(_profile_energy(ys, xs, a), a) for a in fine]
+    score, best = max(scored)
+    return float(best), score
+
+
+def _upright_score(ys, xs, skew):
+    """
+    Vota si la página está derecha con dos pistas por línea de texto:
+
+    - ascendentes: tinta por encima de la banda central frente a por debajo
+      (falla con texto todo en mayúsculas y dígitos, donde no hay banda central)
+    - alineación: los comienzos de línea se repiten (margen izquierdo, sangrías)
+      y los finales quedan dispersos; del revés es al contrario
+
+    Returns:
+        Tupla (True si está derecha, confianza 0-1)
+    """
+    # Coordenadas con la inclinación deshecha (giro, no cizalla: los comienzos de
+    # línea tienen que quedar en la misma x)
+    cos, sin = math.cos(math.radians(skew)), math.sin(math.radians(skew))
+    shifted = ys * cos - xs * sin
+    xs = xs * cos + ys * sin
+    rows = np.rint(shifted - shifted.min()).astype(np.int64)
+    profile = np.bincount(rows).astype(np.float64)
+    floor = 0.02 * np.percentile(profile[profile > 0], 95)
+
+    line_of_row = np.full(len(profile), -1)
+    above = below = 0.0
+    lines = 0
+    for start, end in _runs(profile > floor):
+        if end - start < 4:
+            continue
+        band = profile[start:end]
+        core = np.nonzero(band >= 0.5 * band.max())[0]
+        above += band[:core[0]].sum()
+        below += band[core[-1] + 1:].sum()
+        line_of_row[start:end] = lines
+        lines += 1
+    if not lines:
+        return True, 0.0
+
+    line = line_of_row[rows]
+    inside = line >= 0
+    starts = np.full(lines, np.inf)
+    ends = np.full(lines, -np.inf)
+    np.minimum.at(starts, line[inside], xs[inside])
+    np.maximum.at(ends, line[inside], xs[inside])
+    # Entropía de las posiciones en cubos de ~1% del ancho: menor = más alineadas
+    bucket = max(2.0, (xs.max() - xs.min()) / 100)
+    start_entropy = _entropy(((starts - starts.min()) / bucket).astype(np.int64))
+    end_entropy = _entropy(((ends - ends.min()) / bucket).astype(np.int64))
+
+    vote = 0.0
+    if above + below:
+        vote += (above - below) / (above + below)
+    if max(start_entropy, end_entropy):
+        vote += (end_entropy - start_entropy) / max(start_entropy, end_entropy)
+    return vote >= 0, min(1.0, abs(vote) / 2)
+
+
+def _entropy(values):
+    counts = np.bincount(values)
+    p = counts[counts > 0] / len(values)
+    return float(-(p * np.log(p)).sum())
+
+
+def _runs(mask):
+    # Tramos [inicio, fin) donde la máscara es True
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return zip(edges[::2], edges[1::2])
+
+
+def _is_binary(image):
+    # Muestreo de una de cada 64 posiciones: la página del pipeline solo tiene 0 y 255
+    if image.mode == '1':
+        return True
+    if image.mode != 'L':
+        return False
+    sample = np.asarray(image)[::8, ::8]
+    return not np.any((sample > 0) & (sample < 255))
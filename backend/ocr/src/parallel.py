@@ -0,0 +1,240 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from . import metrics
+from .ocr import ocr_page, warm_ocr_engines, OCR_DPI, OCR_POOL_WORKERS, OCR_THREADS_PER_JOB
+from .pdf_to_img import render_pdf_page, get_pdf_page_count
+from .resolution import OCR_ADAPTIVE_DPI, OCR_ESCALATE_CONF, escalated_dpi, mean_word_confidence
+from .table import OCR_TABLE_CROP, crop_to_table, offset_ocr_data
+from .text_layer import plan_pdf_pages, ocr_page_numbers, merge_pages
+
+# Pool compartido por todos los documentos del proceso (se crea bajo demanda)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def available_cores():
+    """Cores que este proceso puede usar (respeta cgroups/affinity en Linux)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def pool_size():
+    """
+    Número de procesos del pool. Con OCR_POOL_WORKERS=0 se reparte el presupuesto
+    de cores entre los hilos que usa cada Tesseract (OCR_THREADS_PER_JOB).
+    """
+    if OCR_POOL_WORKERS > 0:
+        return OCR_POOL_WORKERS
+    return max(1, available_cores() // max(1, OCR_THREADS_PER_JOB))
+
+
+def _init_worker(threads_per_job):
+    # Evita que cada Tesseract abra tantos hilos OpenMP como cores (sobresuscripción)
+    os.environ['OMP_THREAD_LIMIT'] = str(threads_per_job)
+    # Cada proceso del pool carga sus motores una vez y los reutiliza en todas sus páginas
+    warm_ocr_engines()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = pool_size()
+            # spawn: el proceso padre tiene hilos (gunicorn, OCR en background) y fork no es seguro
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(OCR_THREADS_PER_JOB,),
+            )
+            print(f"[OCR][pool] creado workers={workers} threads_per_job={OCR_THREADS_PER_JOB}")
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def shutdown_pool():
+    _reset_pool()
+
+
+def _ocr_pdf_page(pdf_path, page_number, dpi, lang):
+    """
+    Trabajo de un proceso del pool: renderiza, preprocesa y hace OCR de una página.
+    Si la confianza media de las palabras queda por debajo de OCR_ESCALATE_CONF,
+    repite la página una vez a más resolución y se queda con el mejor resultado.
+    """
+    start = time.time()
+    with metrics.span('page'):
+        page = render_pdf_page(pdf_path, page_number, dpi=dpi)
+        text, data = _ocr_image(page['image'], lang)
+        conf = mean_word_confidence(data)
+        used_dpi = page['dpi']
+
+        retry_dpi = escalated_dpi(used_dpi)
+        if conf is not None and conf < OCR_ESCALATE_CONF and retry_dpi:
+            print(f"[OCR][dpi] página {page_number}: conf={conf:.0f} dpi={used_dpi} -> {retry_dpi}")
+            metrics.inc('ocr_dpi_escalations_total')
+            retry = render_pdf_page(pdf_path, page_number, dpi=retry_dpi)
+            retry_text, retry_data = _ocr_image(retry['image'], lang)
+            retry_conf = mean_word_confidence(retry_data)
+            if retry_conf is not None and retry_conf > conf:
+                text, data, conf, used_dpi = retry_text, retry_data, retry_conf, retry['dpi']
+
+    metrics.inc('ocr_pages_total')
+    # Los procesos del pool no atienden /metrics: dejar la instantánea al día en cada página
+    metrics.flush()
+    return {
+        'page': page_number,
+        'text': text,
+        'data': data,
+        'dpi': used_dpi,
+        'conf': conf,
+        'elapsed': time.time() - start,
+        # ocr_page devuelve data=None si Tesseract falla: la página sale vacía
+        'failed': data is None,
+    }
+
+
+def _ocr_image(image, lang):
+    """
+    OCR de una página. Con OCR_TABLE_CROP solo se reconoce la tabla de productos
+    (ver table.py) y las coordenadas se devuelven en el espacio de la página.
+    """
+    if OCR_TABLE_CROP:
+        with metrics.span('table_detect'):
+            crop, offset, table = crop_to_table(image)
+        metrics.inc('ocr_table_crop_total', result='none' if table is None else 'full' if offset is None else 'crop')
+        if offset is not None:
+            print(
+                f"[OCR][tabla] recorte bbox={table['bbox']} filas={len(table['rows'])} "
+                f"columnas={len(table['columns']) + 1} ruled={table['ruled']}"
+            )
+            text, data = ocr_page(crop, lang=lang, prefer_portrait=False)
+            return text, offset_ocr_data(data, *offset)
+    return ocr_page(image, lang=lang)
+
+
+def ocr_pdf(pdf_path, dpi=None, lang='spa+por', done=None, on_page=None, pages=None):
+    """
+    Hace OCR de las páginas de un PDF repartiéndolas entre los procesos del
+    pool compartido. Si solo hay un worker (o una página) se procesa en el propio
+    proceso, sin coste de IPC.
+
+    Args:
+        dpi: Resolución fija; None deja que el planificador la elija por página
+             (OCR_ADAPTIVE_DPI) o usa OCR_DPI si está desactivado
+        done: {página: resultado} ya procesadas (checkpoints de un intento anterior);
+              no se vuelven a procesar
+        on_page: Callback con el resultado de cada página según va terminando
+        pages: Números de página (1-based) a procesar; None = todas
+
+    Returns:
+        Lista de dicts {'page', 'text', 'data', 'dpi', 'conf', 'elapsed', 'failed'}
+        ordenada por página; 'failed' marca las páginas que no se pudieron leer (salen
+        vacías y el resultado del documento está incompleto)
+    """
+    if dpi is None and not OCR_ADAPTIVE_DPI:
+        dpi = OCR_DPI
+    page_count = get_pdf_page_count(pdf_path)
+    wanted = range(1, page_count + 1) if pages is None else sorted(set(pages))
+    done = {number: result for number, result in (done or {}).items() if number in wanted}
+    pending = [number for number in wanted if number not in done]
+    workers = pool_size()
+
+    if workers > 1 and len(pending) > 1:
+        # Si el pool se rompe (un proceso murió, p. ej. por memoria con una página
+        # enorme), las páginas que faltan se repiten una vez en un pool nuevo; nunca en
+        # este proceso, que la misma página podría tumbar. Si vuelve a romperse, esas
+        # páginas quedan vacías
+        for intento in (1, 2):
+            try:
+                _ocr_pdf_pooled(pdf_path, pending, page_count, dpi, lang, done, on_page)
+                pending = []
+                break
+            except BrokenProcessPool as e:
+                _reset_pool()
+                pending = [number for number in pending if number not in done]
+                print(
+                    f"[OCR][pool][ERROR] pool roto con {len(pending)} página(s) pendientes "
+                    f"({'se repiten en un pool nuevo' if intento == 1 else 'quedan vacías'}): {e}"
+                )
+        for number in pending:
+            done[number] = _empty_page(number, dpi)
+        pending = []
+
+    _ocr_pdf_inline(pdf_path, pending, page_count, dpi, lang, done, on_page)
+    return [done[number] for number in sorted(done)]
+
+
+def pdf_pages(pdf_path, dpi=None, lang='spa+por', done=None, on_page=None):
+    """
+    Texto de todas las páginas del PDF: la capa de texto en las que la tienen
+    utilizable y OCR solo en el resto (ver text_layer.py).
+
+    Returns:
+        La lista de `ocr_pdf`, en orden de página, con 'source' ('texto' u 'ocr')
+    """
+    plan = plan_pdf_pages(pdf_path)
+    ocr_pages = ocr_page_numbers(plan)
+    if len(ocr_pages) < len(plan):
+        print(f"[OCR] capa de texto en {len(plan) - len(ocr_pages)}/{len(plan)} página(s); OCR en {ocr_pages}")
+    results = ocr_pdf(pdf_path, dpi=dpi, lang=lang, done=done, on_page=on_page, pages=ocr_pages) if ocr_pages else []
+    return merge_pages(plan, results)
+
+
+def _ocr_pdf_pooled(pdf_path, pending, page_count, dpi, lang, done, on_page):
+    pool = _get_pool()
+    futures = {
+        pool.submit(_ocr_pdf_page, str(pdf_path), number, dpi, lang): number
+        for number in pending
+    }
+
+    try:
+        for future in as_completed(futures):
+            number = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                print(f"[OCR][pool][ERROR] página {number}/{page_count}: {e}")
+                done[number] = _empty_page(number, dpi)
+                continue
+            done[number] = result
+            if on_page:
+                on_page(result)
+    except BaseException:
+        # Si el callback aborta (p. ej. el worker perdió el trabajo), no seguir ocupando el pool
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def _ocr_pdf_inline(pdf_path, pending, page_count, dpi, lang, done, on_page):
+    for number in pending:
+        try:
+            result = _ocr_pdf_page(pdf_path, number, dpi, lang)
+        except Exception as e:
+            print(f"[OCR][ERROR] página {number}/{page_count}: {e}")
+            done[number] = _empty_page(number, dpi)
+            continue
+        done[number] = result
+        if on_page:
+            on_page(result)
+
+
+def _empty_page(number, dpi):
+    return {'page': number, 'text': '', 'data': None, 'dpi': dpi, 'conf': None, 'elapsed': 0.0, 'failed': True}
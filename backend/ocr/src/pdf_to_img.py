@@ -1,58 +1,168 @@
+import os
 from pathlib import Path
 
 import fitz  # PyMuPDF — convierte PDF a imagen sin Poppler
 from PIL import Image, ImageEnhance, ImageFilter
 
-from .ocr import normalize_orientation
+from . import metrics
+# Alias: `correct_orientation` es también el nombre del parámetro de las funciones de render
+from .orientation import correct_orientation as orient_page, OCR_ORIENTATION
+from .preprocess import preprocess_page, TARGET_WIDTH
+from .resolution import plan_page_dpi
 
+# Directorio opcional para volcar cada página preprocesada como PNG (solo depuración)
+OCR_DEBUG_DIR = os.getenv('OCR_DEBUG_DIR')
 
-def convert_pdf_to_images(pdf_path, output_dir, dpi=300, correct_orientation=True, lang='spa+por'):
+
+def iter_pdf_pages(pdf_path, dpi=300, correct_orientation=True, lang='spa+por', debug_dir=None):
     """
-    Convierte un archivo PDF en imágenes (una por página) usando PyMuPDF.
-    No requiere Poppler ni ningún binario externo.
+    Recorre el PDF página a página y entrega cada página ya preprocesada en memoria,
+    directamente desde el pixmap de PyMuPDF (sin codificar/decodificar PNG ni
+    pasar por un directorio temporal).
 
     Args:
         pdf_path: Ruta al archivo PDF
-        output_dir: Directorio donde guardar las imágenes
-        dpi: Resolución de la imagen
+        dpi: Resolución de renderizado; None para que el planificador elija el
+             DPI de cada página según el tamaño del texto (ver resolution.py)
+        debug_dir: Si se indica (o existe OCR_DEBUG_DIR), guarda además cada página
+                   como PNG para poder inspeccionarla
+
+    Yields:
+        Dict con 'page' (1-based), 'page_count', 'image' (PIL, modo L binarizado),
+        'width', 'height', 'dpi' (el usado al renderizar), 'xheight' (estimada al
+        planificar, o None) y 'orientation' (la corrección aplicada, o None)
+    """
+    pdf_path = Path(pdf_path)
+    debug_dir = debug_dir or OCR_DEBUG_DIR
+    if debug_dir:
+        debug_dir = Path(debug_dir)
+        debug_dir.mkdir(parents=True, exist_ok=True)
+
+    doc = fitz.open(str(pdf_path))
+    try:
+        page_count = len(doc)
+        for i, page in enumerate(doc, start=1):
+            yield _render_page(page, i, page_count, dpi, pdf_path.stem,
+                               correct_orientation=correct_orientation, lang=lang, debug_dir=debug_dir)
+    finally:
+        doc.close()
+
+
+def render_pdf_page(pdf_path, page_number, dpi=300, correct_orientation=True, lang='spa+por', debug_dir=None):
+    """
+    Renderiza y preprocesa una única página (1-based) del PDF.
+    Lo usan los procesos del pool de OCR para que cada uno renderice solo su página.
 
     Returns:
-        Lista de rutas a las imágenes generadas
+        El mismo dict que produce `iter_pdf_pages` para esa página
     """
     pdf_path = Path(pdf_path)
-    output_dir = Path(output_dir)
+    debug_dir = debug_dir or OCR_DEBUG_DIR
+    if debug_dir:
+        debug_dir = Path(debug_dir)
+        debug_dir.mkdir(parents=True, exist_ok=True)
 
     doc = fitz.open(str(pdf_path))
-    zoom = dpi / 72  # 72 es la resolución base de PDF
-    matrix = fitz.Matrix(zoom, zoom)
+    try:
+        return _render_page(doc[page_number - 1], page_number, len(doc), dpi, pdf_path.stem,
+                            correct_orientation=correct_orientation, lang=lang, debug_dir=debug_dir)
+    finally:
+        doc.close()
 
-    image_files = []
-    for i, page in enumerate(doc, start=1):
-        pix = page.get_pixmap(matrix=matrix)
 
-        # Convertir a PIL Image
-        image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+def get_pdf_page_count(pdf_path):
+    doc = fitz.open(str(pdf_path))
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def _render_page(page, number, page_count, dpi, stem, correct_orientation=True, lang='spa+por', debug_dir=None):
+    xheight = None
+    if dpi is None:
+        with metrics.span('plan_dpi'):
+            dpi, xheight = plan_page_dpi(page)
+    else:
+        # DPI fijo: mantener el ancho mínimo que antes garantizaba el reescalado LANCZOS,
+        # pero renderizando directamente a esa escala
+        portrait_width = min(page.rect.width, page.rect.height) if correct_orientation else page.rect.width
+        if portrait_width * dpi / 72 < TARGET_WIDTH:
+            dpi = TARGET_WIDTH * 72 / portrait_width
+
+    zoom = dpi / 72  # 72 es la resolución base de PDF
+    # Renderizar directamente en escala de grises: el preprocesado trabaja en modo L
+    with metrics.span('render'):
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride)
+        pix = None
+
+    # Contraste, nitidez, mediana y Otsu en un único kernel NumPy (ver preprocess.py);
+    # la página ya viene a la escala buscada, sin reescalado posterior
+    with metrics.span('preprocess'):
+        image = preprocess_page(image, target_width=0)
+
+    # Orientación e inclinación sobre la página binarizada (ver orientation.py)
+    orientation = None
+    if correct_orientation and OCR_ORIENTATION:
+        with metrics.span('orientation'):
+            image, orientation = orient_page(image)
+        if orientation['rotation'] or orientation['skew']:
+            print(
+                f"[OCR][orientación] página {number}: rotación={orientation['rotation']} "
+                f"inclinación={orientation['skew']} confianza={orientation['confidence']}"
+            )
+        # ocr_page no vuelve a estimarla
+        image.info['orientation'] = orientation
+    # Tesseract usa la resolución en sus heurísticas de tamaño de texto
+    dpi = int(round(dpi))
+    image.info['dpi'] = (dpi, dpi)
+
+    if debug_dir:
+        image.save(debug_dir / f"{stem}_page_{number}.png", 'PNG')
+
+    return {
+        'page': number,
+        'page_count': page_count,
+        'image': image,
+        'width': image.width,
+        'height': image.height,
+        'dpi': dpi,
+        'xheight': xheight,
+        'orientation': orientation,
+    }
 
-        # Preprocesar
-        image = basic_preprocess(image)
 
-        if correct_orientation:
-            image = normalize_orientation(image, lang=lang, prefer_portrait=True)
+def convert_pdf_to_images(pdf_path, output_dir, dpi=300, correct_orientation=True, lang='spa+por'):
+    """
+    Convierte un archivo PDF en imágenes PNG (una por página) usando PyMuPDF.
+    Se mantiene para depuración y herramientas externas; el pipeline de OCR
+    usa `iter_pdf_pages` y no escribe nada en disco.
 
-        image = binarize_image(image)
+    Args:
+        pdf_path: Ruta al archivo PDF
+        output_dir: Directorio donde guardar las imágenes
+        dpi: Resolución de la imagen
 
-        # Guardar imagen
-        output_file = output_dir / f"{pdf_path.stem}_page_{i}.png"
-        image.save(output_file, 'PNG')
+    Returns:
+        Lista de rutas a las imágenes generadas
+    """
+    pdf_path = Path(pdf_path)
+    output_dir = Path(output_dir)
+
+    image_files = []
+    for page in iter_pdf_pages(pdf_path, dpi=dpi, correct_orientation=correct_orientation, lang=lang):
+        output_file = output_dir / f"{pdf_path.stem}_page_{page['page']}.png"
+        page['image'].save(output_file, 'PNG')
         image_files.append(output_file)
 
-    doc.close()
     return image_files
 
 
 def preprocess_image(image):
     """
-    Preprocesa la imagen para mejorar la precision del OCR
+    Preprocesa la imagen para mejorar la precision del OCR.
+    Cadena PIL de referencia; el pipeline usa `preprocess.preprocess_page`.
     """
     image = basic_preprocess(image)
     image = binarize_image(image)
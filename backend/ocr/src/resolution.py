@@ -0,0 +1,134 @@
+import os
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from .ocr import _env_bool, OCR_DPI
+from .preprocess import otsu_threshold_from_hist
+
+# Planificador de resolución: elegir por página el DPI mínimo con el que el texto
+# llega a la altura de x que Tesseract necesita, en vez de un DPI fijo para todo
+OCR_ADAPTIVE_DPI = _env_bool('OCR_ADAPTIVE_DPI', default=True)
+OCR_PROBE_DPI = int(os.getenv('OCR_PROBE_DPI', '100'))
+OCR_TARGET_XHEIGHT = float(os.getenv('OCR_TARGET_XHEIGHT', '20'))
+OCR_MIN_DPI = int(os.getenv('OCR_MIN_DPI', '150'))
+OCR_MAX_DPI = int(os.getenv('OCR_MAX_DPI', '400'))
+# Si la confianza media de las palabras queda por debajo, se repite la página a más DPI
+OCR_ESCALATE_CONF = float(os.getenv('OCR_ESCALATE_CONF', '65'))
+OCR_ESCALATE_FACTOR = float(os.getenv('OCR_ESCALATE_FACTOR', '1.5'))
+
+# Líneas de texto plausibles en la imagen de sondeo (px); fuera de esto son ruido o bloques
+_MIN_LINE_ROWS = 3
+_MAX_LINE_ROWS = 80
+# Una fila con más tinta que esto es una línea de tabla o un borde, no texto
+_RULE_FILL = 0.6
+
+
+def estimate_xheight(gray):
+    """
+    Estima la altura de x (px) de una página en escala de grises a partir del
+    perfil de proyección horizontal: cada banda de filas con tinta es una línea
+    de texto y, dentro de ella, la zona central (filas con al menos la mitad de
+    la tinta de la fila más cargada) corresponde al cuerpo de las minúsculas;
+    ascendentes y descendentes aportan mucha menos tinta.
+
+    Args:
+        gray: PIL Image en modo L o array uint8
+
+    Returns:
+        Altura de x en píxeles (mediana de las líneas), o None si no hay texto reconocible
+    """
+    array = np.asarray(gray, dtype=np.uint8)
+    if array.ndim != 2 or array.size == 0:
+        return None
+
+    threshold = otsu_threshold_from_hist(np.bincount(array.ravel(), minlength=256))
+    ink = array <= threshold
+    if ink.mean() > 0.5:
+        # Otsu degenerado (página casi en blanco y antialiasing): umbral fijo como en binarize_image
+        ink = array < 128
+    estimate = _xheight_from_profile(ink)
+    if estimate is None:
+        # Página girada 90°: las líneas de texto son columnas
+        estimate = _xheight_from_profile(ink.T)
+    return estimate
+
+
+def _xheight_from_profile(ink):
+    rows = ink.sum(axis=1)
+    width = ink.shape[1]
+    rows[rows > width * _RULE_FILL] = 0
+
+    # Bandas contiguas de filas con tinta
+    has_ink = np.concatenate(([False], rows > 0, [False]))
+    edges = np.flatnonzero(has_ink[1:] != has_ink[:-1])
+    starts, stops = edges[0::2], edges[1::2]
+
+    heights = []
+    for start, stop in zip(starts, stops):
+        if not (_MIN_LINE_ROWS <= stop - start <= _MAX_LINE_ROWS):
+            continue
+        band = rows[start:stop]
+        core = np.count_nonzero(band >= band.max() * 0.5)
+        if core >= 2:
+            heights.append(core)
+
+    # Con menos de tres líneas la mediana no es fiable (logos, sellos)
+    if len(heights) < 3:
+        return None
+    return float(np.median(heights))
+
+
+def resolution_label():
+    """DPI efectivo de la configuración, para logs y claves de caché ('auto' si es adaptativo)."""
+    return 'auto' if OCR_ADAPTIVE_DPI else str(OCR_DPI)
+
+
+def plan_dpi(xheight, probe_dpi=None):
+    """
+    DPI mínimo para que una altura de x medida a `probe_dpi` llegue a OCR_TARGET_XHEIGHT,
+    acotado a [OCR_MIN_DPI, OCR_MAX_DPI] y redondeado a múltiplos de 10.
+    Sin estimación se usa OCR_DPI.
+    """
+    probe_dpi = OCR_PROBE_DPI if probe_dpi is None else probe_dpi
+    if not xheight:
+        return OCR_DPI
+    dpi = probe_dpi * OCR_TARGET_XHEIGHT / xheight
+    dpi = int(round(dpi / 10.0)) * 10
+    return max(OCR_MIN_DPI, min(OCR_MAX_DPI, dpi))
+
+
+def plan_page_dpi(page):
+    """
+    Renderiza la página de PyMuPDF a OCR_PROBE_DPI en escala de grises, estima la
+    altura de x y devuelve el DPI planificado.
+
+    Returns:
+        (dpi, xheight_a_probe_dpi o None)
+    """
+    zoom = OCR_PROBE_DPI / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    probe = Image.frombytes("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride)
+    xheight = estimate_xheight(probe)
+    return plan_dpi(xheight), xheight
+
+
+def escalated_dpi(dpi):
+    """Siguiente DPI a probar cuando la confianza es baja, o None si ya está en el máximo."""
+    if dpi >= OCR_MAX_DPI:
+        return None
+    return min(OCR_MAX_DPI, int(round(dpi * OCR_ESCALATE_FACTOR / 10.0)) * 10)
+
+
+def mean_word_confidence(data):
+    """Confianza media (0-100) de las palabras con texto en el dict de image_to_data."""
+    if not data:
+        return None
+    confs = [
+        float(conf) for conf, text in zip(data.get('conf', []), data.get('text', []))
+        if (text or '').strip() and float(conf) >= 0
+    ]
+    if not confs:
+        return None
+    return sum(confs) / len(confs)
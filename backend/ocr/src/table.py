@@ -0,0 +1,196 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from .ocr import _env_bool
+
+# Recortar la página a la tabla de productos antes del OCR (desactivado por defecto:
+# el texto de cabecera fuera de la tabla deja de reconocerse)
+OCR_TABLE_CROP = _env_bool('OCR_TABLE_CROP', default=False)
+# Si la tabla ocupa más que esta fracción de la página, se hace OCR de la página entera
+OCR_TABLE_MAX_AREA = float(os.getenv('OCR_TABLE_MAX_AREA', '0.85'))
+
+# Filas de tabla: mínimo de celdas por línea y de líneas seguidas
+_MIN_CELLS = 3
+_MIN_ROWS = 3
+# Líneas de texto sin estructura de columnas toleradas dentro de la tabla (descripciones partidas)
+_MAX_ROW_GAP = 1
+STRIPE_ROWS = 256
+
+
+def detect_table(image):
+    """
+    Localiza la tabla de productos en una página binarizada (tinta = 0).
+
+    Primero busca líneas de regla horizontales y verticales (tablas con bordes);
+    si no hay al menos dos de cada, usa perfiles de proyección: las líneas de
+    texto con tres o más bloques separados por espacios anchos se consideran
+    filas de tabla, y la racha más larga de filas seguidas es la tabla.
+
+    Args:
+        image: PIL Image en modo L binarizada (0/255) o array uint8
+
+    Returns:
+        Dict con 'bbox' (x0, y0, x1, y1), 'rows' (lista de (y0, y1)), 'columns'
+        (x de las separaciones entre columnas), 'ruled' y, si tiene bordes, 'rules'
+        ({'h': [(y0, y1)], 'v': [(x0, x1)]}); o None si no hay tabla
+    """
+    ink = np.asarray(image, dtype=np.uint8) < 128
+    if ink.ndim != 2 or not ink.any():
+        return None
+    height, width = ink.shape
+
+    rows = ink.sum(axis=1)
+    h_rules = _rule_positions(ink, max(40, width // 4))
+    for y0, y1 in h_rules:
+        rows[y0:y1] = 0
+
+    bands = _bands(rows > 0, min_size=4)
+    if len(bands) < _MIN_ROWS:
+        return None
+    line_h = float(np.median([y1 - y0 for y0, y1 in bands]))
+    gap = max(8, int(line_h * 1.5))
+
+    v_rules = _rule_positions(ink.T, max(40, int(line_h * 4), height // 20))
+    table = _ruled_table(h_rules, v_rules, bands)
+    if table is None:
+        table = _borderless_table(ink, bands, gap)
+    if table is None:
+        return None
+
+    # Margen de media línea para no cortar ascendentes/descendentes
+    pad = int(line_h / 2)
+    x0, y0, x1, y1 = table['bbox']
+    table['bbox'] = (max(0, x0 - pad), max(0, y0 - pad), min(width, x1 + pad), min(height, y1 + pad))
+    return table
+
+
+def _rule_positions(ink, min_length):
+    """
+    Filas de `ink` con un tramo de tinta continuo de al menos `min_length` píxeles,
+    agrupadas en reglas (y0, y1). Se recorre por franjas para acotar memoria.
+    """
+    height, width = ink.shape
+    if width < min_length:
+        return []
+    is_rule = np.zeros(height, dtype=bool)
+    for start in range(0, height, STRIPE_ROWS):
+        stripe = ink[start:start + STRIPE_ROWS]
+        csum = np.zeros((stripe.shape[0], width + 1), dtype=np.int32)
+        np.cumsum(stripe, axis=1, out=csum[:, 1:])
+        is_rule[start:start + stripe.shape[0]] = (
+            (csum[:, min_length:] - csum[:, :-min_length]) == min_length
+        ).any(axis=1)
+    return _bands(is_rule, min_size=1)
+
+
+def _bands(mask, min_size):
+    """Rachas de True en un vector booleano como lista de (inicio, fin)."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return [(int(a), int(b)) for a, b in zip(edges[0::2], edges[1::2]) if b - a >= min_size]
+
+
+def _ruled_table(h_rules, v_rules, bands):
+    if len(h_rules) < 2 or len(v_rules) < 2:
+        return None
+    ys = [(a + b) // 2 for a, b in h_rules]
+    xs = [(a + b) // 2 for a, b in v_rules]
+    y0, y1 = min(ys), max(ys)
+    inside = [band for band in bands if band[0] >= y0 and band[1] <= y1]
+    if len(inside) < _MIN_ROWS:
+        return None
+    # Filas: entre reglas consecutivas si hay texto entre ellas; si no, las líneas de texto
+    rows = [(a, b) for a, b in zip(ys, ys[1:]) if any(a <= band[0] and band[1] <= b for band in inside)]
+    if len(rows) < _MIN_ROWS:
+        rows = inside
+    return {
+        'bbox': (min(xs), y0, max(xs), y1),
+        'rows': rows,
+        'columns': xs[1:-1],
+        'ruled': True,
+        'rules': {'h': h_rules, 'v': v_rules},
+    }
+
+
+def _borderless_table(ink, bands, gap):
+    cells = []
+    for y0, y1 in bands:
+        xs = np.flatnonzero(ink[y0:y1].any(axis=0))
+        cells.append(1 + int(np.count_nonzero(np.diff(xs) > gap)) if xs.size else 0)
+
+    # Racha más larga de líneas con estructura de columnas
+    best, current, misses = (0, -1), None, 0
+    for i, count in enumerate(cells):
+        if count >= _MIN_CELLS:
+            current = i if current is None else current
+            misses = 0
+            if i - current > best[1] - best[0]:
+                best = (current, i)
+        elif current is not None:
+            misses += 1
+            if misses > _MAX_ROW_GAP:
+                current, misses = None, 0
+    first, last = best
+    if last - first + 1 < _MIN_ROWS:
+        return None
+
+    rows = bands[first:last + 1]
+    y0, y1 = rows[0][0], rows[-1][1]
+    profile = np.zeros(ink.shape[1], dtype=np.int32)
+    for a, b in rows:
+        profile += ink[a:b].sum(axis=0, dtype=np.int32)
+    xs = np.flatnonzero(profile)
+    x0, x1 = int(xs[0]), int(xs[-1]) + 1
+
+    # Separaciones: huecos verticales sin tinta en todas las filas de la tabla
+    columns = [
+        (a + b) // 2 for a, b in _bands(profile[x0:x1] == 0, min_size=max(2, gap // 2))
+    ]
+    return {
+        'bbox': (x0, y0, x1, y1),
+        'rows': rows,
+        'columns': [x0 + x for x in columns],
+        'ruled': False,
+    }
+
+
+def crop_to_table(image):
+    """
+    Recorta la página a la tabla detectada si eso ahorra área suficiente.
+
+    Returns:
+        (imagen recortada o la original, (dx, dy) del recorte o None, tabla o None)
+    """
+    table = detect_table(image)
+    if table is None:
+        return image, None, None
+    x0, y0, x1, y1 = table['bbox']
+    if (x1 - x0) * (y1 - y0) > OCR_TABLE_MAX_AREA * image.width * image.height:
+        return image, None, table
+    crop = image.crop((x0, y0, x1, y1))
+    if table['ruled']:
+        crop = _erase_rules(crop, table['rules'], x0, y0)
+    return crop, (x0, y0), table
+
+
+def _erase_rules(crop, rules, dx, dy):
+    # Las reglas de la tabla se reconocen como basura ('|', '_', dígitos sueltos): se borran
+    array = np.array(crop)
+    for a, b in rules['h']:
+        array[max(0, a - dy - 1):max(0, b - dy + 1), :] = 255
+    for a, b in rules['v']:
+        array[:, max(0, a - dx - 1):max(0, b - dx + 1)] = 255
+    erased = Image.fromarray(array)
+    erased.info = dict(crop.info)
+    return erased
+
+
+def offset_ocr_data(data, dx, dy):
+    """Traslada las coordenadas de image_to_data de un recorte al espacio de la página."""
+    if not data:
+        return data
+    data['left'] = [left + dx for left in data['left']]
+    data['top'] = [top + dy for top in data['top']]
+    return data
@@ -0,0 +1,227 @@
+"""
+Binding mínimo (ctypes) de la API C de Tesseract (`libtesseract`, capi.h).
+
+Permite mantener motores de reconocimiento cargados en memoria en lugar de
+lanzar un proceso `tesseract` por llamada como hace pytesseract. No añade
+dependencias: la librería ya viene con el paquete `tesseract-ocr` del Dockerfile.
+"""
+import ctypes
+import ctypes.util
+import os
+import threading
+
+# Modos de Tesseract (tesseract/publictypes.h)
+OEM_DEFAULT = 3
+PSM_SINGLE_BLOCK = 6
+
+# Columnas de la salida TSV, igual que pytesseract.Output.DICT
+TSV_COLUMNS = [
+    'level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+    'left', 'top', 'width', 'height', 'conf', 'text',
+]
+
+_lib = None
+_lib_error = None
+_lib_lock = threading.Lock()
+
+
+class TesseractTimeout(RuntimeError):
+    pass
+
+
+def load_library():
+    """
+    Carga libtesseract una sola vez por proceso.
+    TESSERACT_LIB permite indicar la ruta exacta (p. ej. en Windows).
+
+    Returns:
+        El objeto ctypes de la librería, o None si no está disponible
+    """
+    global _lib, _lib_error
+    with _lib_lock:
+        if _lib is not None or _lib_error is not None:
+            return _lib
+
+        candidates = [os.getenv('TESSERACT_LIB'), ctypes.util.find_library('tesseract'),
+                      'libtesseract.so.5', 'libtesseract-5.dll', 'libtesseract.dylib']
+        errors = []
+        for name in candidates:
+            if not name:
+                continue
+            try:
+                lib = ctypes.CDLL(name)
+                _declare(lib)
+                _lib = lib
+                return _lib
+            except (OSError, AttributeError) as e:
+                errors.append(e)
+
+        # Conservar el primer error: suele ser el de la ruta más específica
+        _lib_error = errors[0] if errors else OSError('libtesseract no encontrada')
+        return None
+
+
+def library_error():
+    return _lib_error
+
+
+def _declare(lib):
+    handle = ctypes.c_void_p
+
+    lib.TessVersion.restype = ctypes.c_char_p
+    lib.TessBaseAPICreate.restype = handle
+    lib.TessBaseAPIInit2.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+    lib.TessBaseAPIInit2.restype = ctypes.c_int
+    lib.TessBaseAPISetPageSegMode.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPISetVariable.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p]
+    lib.TessBaseAPISetVariable.restype = ctypes.c_int
+    lib.TessBaseAPISetImage.argtypes = [handle, ctypes.c_char_p, ctypes.c_int, ctypes.c_int,
+                                        ctypes.c_int, ctypes.c_int]
+    lib.TessBaseAPISetSourceResolution.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPIRecognize.argtypes = [handle, handle]
+    lib.TessBaseAPIRecognize.restype = ctypes.c_int
+    lib.TessBaseAPIGetTsvText.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPIGetTsvText.restype = ctypes.POINTER(ctypes.c_char)
+    lib.TessBaseAPIGetUTF8Text.argtypes = [handle]
+    lib.TessBaseAPIGetUTF8Text.restype = ctypes.POINTER(ctypes.c_char)
+    lib.TessBaseAPIDetectOrientationScript.argtypes = [
+        handle, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_float),
+        ctypes.POINTER(ctypes.c_char_p), ctypes.POINTER(ctypes.c_float),
+    ]
+    lib.TessBaseAPIDetectOrientationScript.restype = ctypes.c_int
+    lib.TessDeleteText.argtypes = [ctypes.POINTER(ctypes.c_char)]
+    lib.TessBaseAPIClear.argtypes = [handle]
+    lib.TessBaseAPIEnd.argtypes = [handle]
+    lib.TessBaseAPIDelete.argtypes = [handle]
+    lib.TessMonitorCreate.restype = handle
+    lib.TessMonitorDelete.argtypes = [handle]
+    lib.TessMonitorSetDeadlineMSecs.argtypes = [handle, ctypes.c_int]
+
+
+class TesseractEngine:
+    """
+    Un reconocedor de Tesseract inicializado para una combinación de idiomas.
+    No es thread-safe: cada hilo debe usar su propio motor (ver el pool en ocr.py).
+    """
+
+    def __init__(self, lang, datapath=None, oem=OEM_DEFAULT, psm=PSM_SINGLE_BLOCK):
+        lib = load_library()
+        if lib is None:
+            raise OSError(f"libtesseract no disponible: {_lib_error}")
+
+        self._lib = lib
+        self.lang = lang
+        self.oem = oem
+        self.psm = psm
+        self._handle = lib.TessBaseAPICreate()
+
+        datapath = datapath or os.environ.get('TESSDATA_PREFIX')
+        rc = lib.TessBaseAPIInit2(
+            self._handle,
+            datapath.encode() if datapath else None,
+            lang.encode(),
+            oem,
+        )
+        if rc != 0:
+            lib.TessBaseAPIDelete(self._handle)
+            self._handle = None
+            raise RuntimeError(f"No se pudo inicializar Tesseract lang={lang} datapath={datapath}")
+
+        lib.TessBaseAPISetPageSegMode(self._handle, psm)
+
+    def close(self):
+        if self._handle:
+            self._lib.TessBaseAPIEnd(self._handle)
+            self._lib.TessBaseAPIDelete(self._handle)
+            self._handle = None
+
+    def _set_image(self, image):
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        bpp = 1 if image.mode == 'L' else 3
+        buf = image.tobytes()
+        self._lib.TessBaseAPISetImage(self._handle, buf, image.width, image.height, bpp, image.width * bpp)
+        # Sin DPI en la imagen Tesseract avisa y estima; las páginas llevan el DPI con que se renderizaron
+        dpi = image.info.get('dpi')
+        self._lib.TessBaseAPISetSourceResolution(self._handle, int(dpi[0]) if dpi else 300)
+        return buf
+
+    def _recognize(self, timeout_sec):
+        monitor = None
+        if timeout_sec:
+            monitor = self._lib.TessMonitorCreate()
+            self._lib.TessMonitorSetDeadlineMSecs(monitor, int(timeout_sec * 1000))
+        try:
+            rc = self._lib.TessBaseAPIRecognize(self._handle, monitor)
+        finally:
+            if monitor:
+                self._lib.TessMonitorDelete(monitor)
+        if rc != 0:
+            # Igual que pytesseract cuando vence el timeout del subproceso
+            raise TesseractTimeout('Tesseract process timeout')
+
+    def _take_text(self, ptr):
+        if not ptr:
+            return ''
+        try:
+            return ctypes.string_at(ptr).decode('utf-8', errors='replace')
+        finally:
+            self._lib.TessDeleteText(ptr)
+
+    def image_to_data(self, image, timeout_sec=None):
+        """Reconoce la imagen y devuelve el mismo dict que pytesseract.image_to_data(Output.DICT)."""
+        buf = self._set_image(image)
+        try:
+            self._recognize(timeout_sec)
+            tsv = self._take_text(self._lib.TessBaseAPIGetTsvText(self._handle, 0))
+        finally:
+            self._lib.TessBaseAPIClear(self._handle)
+            del buf
+        return parse_tsv(tsv)
+
+    def image_to_string(self, image, timeout_sec=None):
+        buf = self._set_image(image)
+        try:
+            self._recognize(timeout_sec)
+            return self._take_text(self._lib.TessBaseAPIGetUTF8Text(self._handle))
+        finally:
+            self._lib.TessBaseAPIClear(self._handle)
+            del buf
+
+    def detect_rotation(self, image):
+        """
+        Equivalente a image_to_osd: grados que hay que rotar la imagen (0/90/180/270).
+        Requiere osd.traineddata y un motor inicializado con lang='osd'.
+        """
+        buf = self._set_image(image)
+        try:
+            deg = ctypes.c_int()
+            conf = ctypes.c_float()
+            script = ctypes.c_char_p()
+            script_conf = ctypes.c_float()
+            ok = self._lib.TessBaseAPIDetectOrientationScript(
+                self._handle, ctypes.byref(deg), ctypes.byref(conf),
+                ctypes.byref(script), ctypes.byref(script_conf),
+            )
+            return deg.value if ok else None
+        finally:
+            self._lib.TessBaseAPIClear(self._handle)
+            del buf
+
+
+def parse_tsv(tsv):
+    data = {col: [] for col in TSV_COLUMNS}
+    for row in tsv.splitlines():
+        parts = row.split('\t')
+        if len(parts) < 11 or parts[0] == 'level':
+            continue
+        if len(parts) == 11:
+            parts.append('')
+        for col, value in zip(TSV_COLUMNS, parts):
+            if col == 'text':
+                data[col].append(value)
+            elif col == 'conf':
+                data[col].append(float(value))
+            else:
+                data[col].append(int(value))
+    return data
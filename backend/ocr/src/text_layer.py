@@ -0,0 +1,162 @@
+import os
+
+import fitz  # PyMuPDF
+
+from .ocr import OCR_DPI, _text_from_ocr_data
+
+# Origen del texto de cada página
+TEXTO = 'texto'
+OCR = 'ocr'
+
+# Una página cubierta por imágenes (escaneo) con menos caracteres que esto va a OCR:
+# el texto será un sello, un número de página o la capa OCR parcial de un escáner
+PDF_DIRECT_TEXT_MIN_CHARS = int(os.getenv('PDF_DIRECT_TEXT_MIN_CHARS', '80'))
+# Fracción de la página cubierta por imágenes a partir de la cual se considera escaneada
+PDF_PAGE_IMAGE_COVERAGE = float(os.getenv('PDF_PAGE_IMAGE_COVERAGE', '0.5'))
+# Capas de texto sin ToUnicode salen como U+FFFD: por encima de esta fracción, a OCR
+_MAX_GARBAGE_RATIO = 0.3
+# Dos palabras van en la misma línea si sus centros verticales distan menos que
+# esta fracción de la altura de la más baja
+_SAME_LINE = 0.5
+
+
+def plan_pdf_pages(pdf_path):
+    """
+    Decide página a página si la capa de texto sirve o hace falta OCR:
+
+    - sin texto: OCR si tiene imágenes o trazos (escaneo, o texto convertido a
+      trazos); si no, es una página en blanco y se queda como texto vacío
+    - texto ilegible (mayoría de U+FFFD, fuentes sin ToUnicode): OCR
+    - cubierta de imágenes y con poco texto: OCR
+    - en otro caso, la capa de texto, aunque sea corta (p. ej. una página de totales)
+
+    De las páginas de texto se guardan también las cajas de palabras en el formato
+    de `image_to_data` (ver `ocr_data_from_words`), y el texto se reconstruye por
+    líneas visuales como el del OCR: en muchos PDF digitales `get_text()` saca
+    cada celda de la tabla en una línea distinta.
+
+    Returns:
+        Lista ordenada de dicts {'page' (1-based), 'source' (TEXTO u OCR), 'text'
+        ('' en las de OCR), 'data' (None en las de OCR), 'chars', 'image_coverage'}
+    """
+    plan = []
+    doc = fitz.open(str(pdf_path))
+    try:
+        for number, page in enumerate(doc, start=1):
+            text = page.get_text() or ''
+            chars = len(text.strip())
+            garbage = text.count('\ufffd')
+            coverage = _image_coverage(page)
+
+            if chars == 0:
+                # Páginas en blanco (separadores, reversos) no mandan un PDF digital a la cola
+                source = OCR if coverage > 0 or page.get_drawings() else TEXTO
+            elif garbage > _MAX_GARBAGE_RATIO * chars:
+                source = OCR
+            elif coverage >= PDF_PAGE_IMAGE_COVERAGE and chars < PDF_DIRECT_TEXT_MIN_CHARS:
+                source = OCR
+            else:
+                source = TEXTO
+            data = ocr_data_from_words(page) if source == TEXTO else None
+            plan.append({
+                'page': number,
+                'source': source,
+                'text': (_text_from_ocr_data(data) or text) if data else '',
+                'data': data,
+                'chars': chars,
+                'image_coverage': round(coverage, 3),
+            })
+    finally:
+        doc.close()
+    return plan
+
+
+def ocr_page_numbers(plan):
+    return [entry['page'] for entry in plan if entry['source'] == OCR]
+
+
+def merge_pages(plan, ocr_results):
+    """
+    Une, en orden de página, las páginas de capa de texto del plan con los
+    resultados del OCR (mismo formato que `parallel.ocr_pdf`).
+    """
+    by_page = {result['page']: result for result in ocr_results}
+    pages = []
+    for entry in plan:
+        if entry['source'] == TEXTO:
+            pages.append({
+                'page': entry['page'], 'text': entry['text'], 'data': entry['data'],
+                'dpi': None, 'conf': None, 'elapsed': 0.0, 'source': TEXTO,
+            })
+        elif entry['page'] in by_page:
+            pages.append(dict(by_page[entry['page']], source=OCR))
+    return pages
+
+
+def ocr_data_from_words(page, dpi=OCR_DPI):
+    """
+    Convierte las palabras de la capa de texto (`page.get_text("words")`) al
+    diccionario de `pytesseract.image_to_data`, para que los extractores por
+    columnas (extract_productos_from_ocr_data) funcionen sin OCR.
+
+    Las palabras se agrupan en líneas visuales por su centro vertical (un PDF
+    digital suele poner cada celda en su propio bloque) y las coordenadas pasan
+    de puntos a píxeles a `dpi`, la escala en la que están las tolerancias de
+    extract.py. La confianza es 100: el texto es exacto.
+
+    Returns:
+        Dict con las listas de image_to_data (nivel 5, palabras), o None si la
+        página no tiene palabras
+    """
+    words = [w for w in page.get_text("words") if w[4].strip()]
+    if not words:
+        return None
+    scale = dpi / 72
+    if page.rotation:
+        # get_text da coordenadas de la página sin girar; se pasan a las de lectura
+        words = [tuple(fitz.Rect(w[:4]) * page.rotation_matrix) + tuple(w[4:]) for w in words]
+
+    # Agrupar por centro vertical, de arriba abajo
+    lines = []
+    for x0, y0, x1, y1, text, *_ in sorted(words, key=lambda w: (w[1] + w[3]) / 2):
+        center, height = (y0 + y1) / 2, y1 - y0
+        line = lines[-1] if lines else None
+        if line and abs(center - line['center']) <= _SAME_LINE * min(height, line['height']):
+            line['words'].append((x0, y0, x1, y1, text))
+            n = len(line['words'])
+            line['center'] += (center - line['center']) / n
+        else:
+            lines.append({'center': center, 'height': height, 'words': [(x0, y0, x1, y1, text)]})
+
+    data = {key: [] for key in (
+        'level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+        'left', 'top', 'width', 'height', 'conf', 'text',
+    )}
+    for line_num, line in enumerate(lines, start=1):
+        for word_num, (x0, y0, x1, y1, text) in enumerate(sorted(line['words']), start=1):
+            data['level'].append(5)
+            data['page_num'].append(1)
+            data['block_num'].append(1)
+            data['par_num'].append(1)
+            data['line_num'].append(line_num)
+            data['word_num'].append(word_num)
+            data['left'].append(int(round(x0 * scale)))
+            data['top'].append(int(round(y0 * scale)))
+            data['width'].append(int(round((x1 - x0) * scale)))
+            data['height'].append(int(round((y1 - y0) * scale)))
+            data['conf'].append(100)
+            data['text'].append(text)
+    return data
+
+
+def _image_coverage(page):
+    # Área de la página cubierta por imágenes (recortada a la página; solapes no se restan)
+    area = abs(page.rect)
+    if not area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info['bbox']) & page.rect
+        if not bbox.is_empty:
+            covered += abs(bbox)
+    return min(1.0, covered / area)
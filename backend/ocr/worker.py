@@ -0,0 +1,177 @@
+"""
+Worker de OCR: consume la cola persistente de ocr/src/jobs.py.
+
+Uso (desde backend/):
+    python -m ocr.worker
+
+Cada trabajo se procesa con un lease que se renueva con latidos; si el worker
+muere, el trabajo vuelve a estar disponible cuando vence el lease y el siguiente
+intento retoma desde las páginas ya guardadas. Con SIGTERM/SIGINT termina el
+trabajo en curso y sale.
+"""
+import os
+import json
+import signal
+import socket
+import threading
+import time
+
+from ocr.src import metrics
+from ocr.src.jobs import (
+    get_job_queue, LeaseLost, OCR_JOB_HEARTBEAT_SEC,
+)
+from ocr.src.ocr import warm_ocr_engines
+from ocr.src.parallel import shutdown_pool
+from ocr.src.text_layer import plan_pdf_pages, ocr_page_numbers
+
+OCR_WORKER_POLL_SEC = float(os.getenv('OCR_WORKER_POLL_SEC', '2'))
+
+
+class _Heartbeat(threading.Thread):
+    """Renueva el lease del trabajo en segundo plano mientras dura el OCR."""
+
+    def __init__(self, queue, job_id, worker_id, tiempos=None):
+        super().__init__(daemon=True, name=f"ocr-heartbeat-{job_id[:8]}")
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.progress = {}
+        # Segundos por etapa; un reintento sigue sumando a los del intento anterior
+        self.tiempos = dict(tiempos or {})
+        self._etapa = None
+        self._etapa_desde = time.time()
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+
+    def beat(self, **progress):
+        etapa = progress.get('etapa')
+        if etapa and etapa != self._etapa:
+            self.close_stage()
+            self._etapa = etapa
+            progress['tiempos'] = dict(self.tiempos)
+        self.progress.update(progress)
+        self._send()
+
+    def close_stage(self):
+        """Suma lo que ha durado la etapa actual a `tiempos` (segundos por etapa)."""
+        now = time.time()
+        if self._etapa:
+            self.tiempos[self._etapa] = round(self.tiempos.get(self._etapa, 0) + now - self._etapa_desde, 3)
+        self._etapa_desde = now
+        return self.tiempos
+
+    def _send(self):
+        try:
+            self.queue.heartbeat(self.job_id, self.worker_id, **self.progress)
+        except LeaseLost as e:
+            print(f"[OCR][worker][ERROR] {e}")
+            self.lost.set()
+
+    def run(self):
+        while not self._stopped.wait(OCR_JOB_HEARTBEAT_SEC):
+            self._send()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def process_job(queue, job, worker_id, service):
+    tiempos = json.loads(job['tiempos']) if job.get('tiempos') else None
+    heartbeat = _Heartbeat(queue, job['id'], worker_id, tiempos=tiempos)
+    heartbeat.start()
+    try:
+        done = queue.load_pages(job['id'])
+        if done:
+            print(f"[OCR][worker] trabajo={job['id']} retomado con {len(done)} página(s) ya hechas")
+        # Progreso sobre las páginas que van a OCR (las de capa de texto no cuentan)
+        paginas = len(ocr_page_numbers(plan_pdf_pages(job['pdf_path'])))
+        heartbeat.beat(pagina=len(done), paginas=paginas)
+        hechas = [len(done)]
+
+        def on_page(result):
+            if heartbeat.lost.is_set():
+                raise LeaseLost(f"trabajo={job['id']} perdido durante el OCR")
+            queue.save_page(job['id'], result)
+            hechas[0] += 1
+            heartbeat.beat(pagina=hechas[0])
+
+        def on_stage(etapa):
+            if heartbeat.lost.is_set():
+                raise LeaseLost(f"trabajo={job['id']} perdido en la etapa {etapa}")
+            heartbeat.beat(etapa=etapa)
+
+        service.procesar_ocr(
+            job['pedido_id'], job['pdf_path'], clave_cache=job['clave_cache'],
+            done_pages=done, on_page=on_page, on_stage=on_stage,
+        )
+        queue.complete(job['id'], worker_id, tiempos=heartbeat.close_stage())
+        print(f"[OCR][worker] trabajo={job['id']} HECHO")
+    except LeaseLost as e:
+        # Otro worker lo tiene: no tocar su estado
+        print(f"[OCR][worker][ERROR] {e}")
+    except Exception as e:
+        retry = queue.fail(job['id'], worker_id, e, tiempos=heartbeat.close_stage())
+        print(
+            f"[OCR][worker][ERROR] trabajo={job['id']} intento={job['intentos']}/{job['max_intentos']} "
+            f"error={e} {'(se reintentará)' if retry else '(definitivo)'}"
+        )
+    finally:
+        heartbeat.stop()
+        metrics.flush()
+
+
+def run(stop_event=None, worker_id=None):
+    """
+    Bucle del worker. `stop_event` permite pararlo desde otro hilo
+    (modo embebido en el proceso web, OCR_QUEUE_EMBEDDED).
+    """
+    stop_event = stop_event or threading.Event()
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = get_job_queue()
+
+    # Import tardío: el servicio arrastra el cliente de Supabase y la configuración
+    from pedidos.pedidos_service import PedidosService
+    service = PedidosService()
+
+    print(f"[OCR][worker] iniciado id={worker_id} cola={queue.path}")
+    warm_ocr_engines()
+    while not stop_event.is_set():
+        try:
+            job = queue.claim(worker_id)
+        except Exception as e:
+            print(f"[OCR][worker][ERROR] leyendo la cola: {e}")
+            job = None
+        if job is None:
+            stop_event.wait(OCR_WORKER_POLL_SEC)
+            continue
+        print(f"[OCR][worker] trabajo={job['id']} pedido={job['pedido_id']} intento={job['intentos']}")
+        process_job(queue, job, worker_id, service)
+
+    print(f"[OCR][worker] detenido id={worker_id}")
+
+
+def start_embedded():
+    """Arranca un único consumidor en un hilo del proceso actual (desarrollo sin worker aparte)."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run, args=(stop_event,), daemon=True, name="ocr-worker")
+    thread.start()
+    return stop_event
+
+
+def main():
+    stop_event = threading.Event()
+
+    def _stop(signum, frame):
+        print(f"[OCR][worker] señal {signum}: se termina el trabajo en curso y se sale")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    try:
+        run(stop_event)
+    finally:
+        shutdown_pool()
+
+
+if __name__ == '__main__':
+    main()
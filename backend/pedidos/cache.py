@@ -0,0 +1,230 @@
+import os
+import copy
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Caché de lecturas de pedidos (listados por rol, detalle, productos) en memoria de
+# cada proceso, invalidada por las operaciones que modifican pedidos y productos.
+# No se importa _env_bool de ocr.py para no cargar el OCR desde productos.py
+PEDIDOS_CACHE = os.getenv('PEDIDOS_CACHE', '1').strip().lower() in ('1', 'true', 'yes', 'on')
+PEDIDOS_CACHE_TTL_SEC = float(os.getenv('PEDIDOS_CACHE_TTL_SEC', '30'))
+PEDIDOS_CACHE_MAX_ENTRIES = int(os.getenv('PEDIDOS_CACHE_MAX_ENTRIES', '1000'))
+# Las ETag (ver etag_lectura) cambian además cada tantos segundos: recogen también los
+# cambios hechos fuera de la API (panel de Supabase), que no pasan por invalidar
+PEDIDOS_ETAG_TTL_SEC = int(os.getenv('PEDIDOS_ETAG_TTL_SEC', '300'))
+# Versiones por pedido en SQLite, compartidas entre los workers de gunicorn y el de OCR
+# (mismo directorio que la cola): lo que invalida un proceso lo ven los demás en su
+# siguiente lectura. Vacío = solo en memoria (un único proceso)
+PEDIDOS_CACHE_SYNC_PATH = os.getenv(
+    'PEDIDOS_CACHE_SYNC_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'ocr', '.cache', 'pedidos_versiones.sqlite3')
+)
+
+# Etiquetas de invalidación: todos los listados, un pedido concreto o todo
+LISTADOS = 'listados'
+TODO = '*'
+
+
+def etiqueta_pedido(pedido_id):
+    # Mismo UUID en mayúsculas o minúsculas (la ruta de productos no lo normaliza)
+    return f"pedido:{str(pedido_id).strip().lower()}"
+
+
+class LecturasCache:
+    """
+    LRU con caducidad (PEDIDOS_CACHE_TTL_SEC) y tamaño máximo. Cada entrada lleva
+    etiquetas (LISTADOS, pedido:<id>) y `invalidar` borra las que comparten alguna.
+
+    Cada invalidación sube un número de versión global; en SQLite se guarda la
+    última versión de cada etiqueta, así que los demás procesos solo tienen que
+    pedir las etiquetas con versión mayor que la última que vieron. La misma
+    versión sirve como revisión del pedido (`version`).
+    """
+
+    def __init__(self, ttl_sec=PEDIDOS_CACHE_TTL_SEC, max_entries=PEDIDOS_CACHE_MAX_ENTRIES,
+                 sync_path=PEDIDOS_CACHE_SYNC_PATH):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.sync_path = sync_path or None
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Versiones en memoria si no hay SQLite compartido
+        self._versiones = {}
+        self._vista = self._version_global()
+        # Sube con cada invalidación aplicada: una carga que empezó antes no se guarda
+        self._generacion = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidaciones = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.sync_path), exist_ok=True)
+            conn = sqlite3.connect(self.sync_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS versiones ('
+                ' etiqueta TEXT PRIMARY KEY,'
+                ' version INTEGER NOT NULL,'
+                ' actualizado REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS versiones_version ON versiones (version)')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _version_global(self):
+        if not self.sync_path:
+            return max(self._versiones.values(), default=0)
+        try:
+            return self._conn().execute('SELECT COALESCE(MAX(version), 0) FROM versiones').fetchone()[0]
+        except Exception as e:
+            print(f"[PEDIDOS_CACHE][ERROR] leyendo versiones: {e}")
+            return 0
+
+    def _sincronizar(self):
+        # Aplicar lo que hayan invalidado otros procesos desde la última lectura
+        if not self.sync_path:
+            return
+        try:
+            cambios = self._conn().execute(
+                'SELECT etiqueta, version FROM versiones WHERE version > ?', (self._vista,)
+            ).fetchall()
+        except Exception as e:
+            # Sin canal no se puede saber si hay algo obsoleto: no servir de caché
+            print(f"[PEDIDOS_CACHE][ERROR] sincronizando: {e}")
+            with self._lock:
+                self._entradas.clear()
+                self._generacion += 1
+            return
+        if cambios:
+            with self._lock:
+                self._descartar({etiqueta for etiqueta, _ in cambios})
+                self._vista = max(self._vista, max(version for _, version in cambios))
+
+    def _descartar(self, etiquetas):
+        # Con el lock tomado
+        if TODO in etiquetas:
+            self._entradas.clear()
+        else:
+            for clave in [c for c, (_, _, et) in self._entradas.items() if et & etiquetas]:
+                del self._entradas[clave]
+        self._generacion += 1
+
+    def leer(self, clave, etiquetas, cargar, cacheable=lambda valor: True):
+        """
+        Devuelve el valor de `clave` desde la caché o, si no está o caducó, el de
+        `cargar()`, que se guarda si `cacheable(valor)`. Se devuelven copias: quien
+        llama puede modificar el resultado.
+        """
+        if not PEDIDOS_CACHE:
+            return cargar()
+        self._sincronizar()
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return copy.deepcopy(entrada[1])
+            self.misses += 1
+            generacion = self._generacion
+
+        valor = cargar()
+        if cacheable(valor):
+            with self._lock:
+                # Si se invalidó algo mientras se cargaba, el valor puede ser ya antiguo
+                if generacion == self._generacion:
+                    self._entradas[clave] = (ahora + self.ttl_sec, copy.deepcopy(valor), frozenset(etiquetas))
+                    self._entradas.move_to_end(clave)
+                    while len(self._entradas) > self.max_entries:
+                        self._entradas.popitem(last=False)
+        return valor
+
+    def invalidar(self, *etiquetas):
+        etiquetas = {e for e in etiquetas if e}
+        if not etiquetas:
+            return
+        if self.sync_path:
+            try:
+                conn = self._conn()
+                # IMMEDIATE: dos procesos no pueden sacar la misma versión
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    version = conn.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM versiones').fetchone()[0]
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO versiones (etiqueta, version, actualizado) VALUES (?, ?, ?)',
+                        [(etiqueta, version, time.time()) for etiqueta in etiquetas]
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            except Exception as e:
+                print(f"[PEDIDOS_CACHE][ERROR] publicando invalidación {sorted(etiquetas)}: {e}")
+        else:
+            version = max(self._versiones.values(), default=0) + 1
+            self._versiones.update(dict.fromkeys(etiquetas, version))
+        with self._lock:
+            self._descartar(etiquetas)
+            self.invalidaciones += 1
+
+    def version(self, etiqueta):
+        """Última versión de la etiqueta (0 si nunca se invalidó)."""
+        if not self.sync_path:
+            return self._versiones.get(etiqueta, 0)
+        try:
+            fila = self._conn().execute('SELECT version FROM versiones WHERE etiqueta = ?', (etiqueta,)).fetchone()
+        except Exception as e:
+            print(f"[PEDIDOS_CACHE][ERROR] leyendo versión de {etiqueta}: {e}")
+            return None
+        return fila[0] if fila else 0
+
+    def stats(self):
+        with self._lock:
+            entradas = len(self._entradas)
+        return {'entries': entradas, 'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidaciones}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_lecturas_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LecturasCache()
+        return _cache
+
+
+def invalidar_pedido(pedido_id=None):
+    """
+    Tras modificar un pedido o sus productos: su detalle, sus productos y todos
+    los listados. Sin pedido_id (no se sabe cuál cambió), toda la caché.
+    """
+    etiqueta = etiqueta_pedido(pedido_id) if pedido_id else TODO
+    get_lecturas_cache().invalidar(LISTADOS, etiqueta)
+
+
+def etag_lectura(etiquetas, *partes):
+    """
+    ETag de una lectura a partir de las versiones de sus etiquetas (y de TODO), sin
+    consultar Supabase: mientras nadie invalide esas etiquetas, la respuesta es la
+    misma. `partes` distingue representaciones de la misma URL (rol, ?fields=...).
+    Con varios procesos necesita el canal compartido (PEDIDOS_CACHE_SYNC_PATH).
+
+    Returns:
+        El ETag (sin comillas), o None si no se pudieron leer las versiones
+    """
+    cache = get_lecturas_cache()
+    versiones = [cache.version(etiqueta) for etiqueta in sorted(set(etiquetas) | {TODO})]
+    if None in versiones:
+        return None
+    periodo = int(time.time() // PEDIDOS_ETAG_TTL_SEC) if PEDIDOS_ETAG_TTL_SEC > 0 else 0
+    return hashlib.sha1(repr((versiones, periodo, partes)).encode()).hexdigest()[:20]
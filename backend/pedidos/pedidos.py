@@ -1,13 +1,26 @@
-from flask import Blueprint, jsonify, request, send_file
-from auth.jwt_handler import verificar_jwt
+import os
+import json
+import time
+from flask import Blueprint, jsonify, request, send_file, Response, stream_with_context
+from auth.jwt_handler import verificar_jwt, generar_token_stream, verificar_token_stream
 from .pedidos_service import PedidosService
 from auth.jwt_handler import requiere_autenticacion, requiere_rol
 from utils.error_handler import respuesta_error
+from utils.etag import no_modificado, con_etag, respuesta_no_modificada
+from .cache import etag_lectura, etiqueta_pedido, LISTADOS
 
 
 pedidos_bp = Blueprint('pedidos', __name__, url_prefix='/api/pedidos')
 service = PedidosService()
 
+# Stream de progreso del OCR (Server-Sent Events): cada cuánto se mira la cola, cuánto
+# dura como máximo una conexión (el navegador reconecta solo) y cada cuánto se manda
+# un comentario para que los proxies no la corten
+OCR_SSE_POLL_SEC = float(os.getenv('OCR_SSE_POLL_SEC', '1'))
+OCR_SSE_MAX_SEC = int(os.getenv('OCR_SSE_MAX_SEC', '120'))
+OCR_SSE_KEEPALIVE_SEC = int(os.getenv('OCR_SSE_KEEPALIVE_SEC', '15'))
+OCR_SSE_RETRY_MS = 2000
+
 # =========================
 # OBTENER PEDIDOS POR ROL
 # =========================
@@ -37,9 +50,37 @@ def obtener_pedidos():
     if not rol_usuario:
         return respuesta_error("Rol no encontrado en el token", 403)
 
-    pedidos = service.obtener_por_rol(rol_usuario)
+    # Paginación opcional: ?limit=N devuelve N pedidos y, si hay más, la cabecera
+    # X-Next-Cursor, que se pasa como ?cursor= para pedir la página siguiente
+    try:
+        limite = int(request.args.get("limit", 0))
+    except ValueError:
+        return respuesta_error("limit debe ser un número", 400)
+    if limite < 0:
+        return respuesta_error("limit debe ser positivo", 400)
+
+    filtros = {clave: request.args.get(clave) for clave in ("estado", "cliente", "desde", "hasta", "responsable")}
+
+    # Si el cliente ya tiene esta versión del listado, 304 sin consultar nada
+    etag = etag_lectura({LISTADOS}, rol_usuario.strip().lower(), request.query_string)
+    if no_modificado(etag):
+        return respuesta_no_modificada(etag)
+
+    resultado = service.obtener_por_rol(
+        rol_usuario,
+        filtros=filtros,
+        campos=request.args.get("fields"),
+        limite=limite,
+        cursor=request.args.get("cursor"),
+    )
 
-    return jsonify(pedidos), 200
+    if "error" in resultado:
+        return respuesta_error(resultado["error"], 400)
+
+    respuesta = jsonify(resultado["pedidos"])
+    if resultado["siguiente"]:
+        respuesta.headers["X-Next-Cursor"] = resultado["siguiente"]
+    return con_etag(respuesta, etag), 200
 
 
 # =========================
@@ -49,13 +90,119 @@ def obtener_pedidos():
 @pedidos_bp.route('/<uuid:id>', methods=['GET'])
 @requiere_autenticacion
 def obtener_pedido(id):
+    """
+    Pedido con sus productos en una sola consulta. ?fields=estado,cliente_nombre,productos
+    limita las columnas ("productos" incluye los productos; el id va siempre).
+    """
+
+    etag = etag_lectura({etiqueta_pedido(id)}, request.args.get("fields"))
+    if no_modificado(etag):
+        return respuesta_no_modificada(etag)
 
-    resultado = service.obtener_por_id(str(id))
+    resultado = service.obtener_por_id(str(id), campos=request.args.get("fields"))
 
     if not resultado:
         return respuesta_error("Pedido no encontrado", 404)
 
-    return jsonify(resultado), 200
+    if "error" in resultado:
+        return respuesta_error(resultado["error"], 400)
+
+    return con_etag(jsonify(resultado), etag), 200
+
+# =========================
+# ESTADO DEL OCR DE UN PEDIDO
+# =========================
+
+@pedidos_bp.route('/<uuid:id>/ocr', methods=['GET'])
+@requiere_autenticacion
+def obtener_estado_ocr(id):
+    """
+    Estado del OCR en segundo plano; con estado 'hecho' incluye los productos.
+    Mientras no ha terminado incluye 'stream_token', para abrir
+    GET /ocr/stream?token=... (ver stream_estado_ocr).
+    """
+
+    estado = service.estado_ocr(str(id))
+
+    if estado is None:
+        return respuesta_error("El pedido no tiene OCR en segundo plano", 404)
+
+    if estado["estado"] not in ("hecho", "error"):
+        payload = verificar_jwt(request.headers.get("Authorization").split(" ")[1])
+        estado["stream_token"] = generar_token_stream(id, payload.get("user_id"))
+
+    return jsonify(estado), 200
+
+
+@pedidos_bp.route('/<uuid:id>/ocr/stream', methods=['GET'])
+def stream_estado_ocr(id):
+    """
+    Progreso del OCR como Server-Sent Events:
+
+    - 'progreso': el estado de GET /ocr cada vez que cambia (etapa, página i de n)
+    - 'fin': estado final ('hecho' con los productos, o 'error'); el cliente debe
+      cerrar el EventSource al recibirlo
+
+    EventSource no permite cabeceras: ?token= lleva el 'stream_token' de GET /ocr,
+    que solo vale para este pedido y caduca enseguida (queda en los logs de acceso).
+    El JWT de sesión solo se acepta en la cabecera Authorization.
+    """
+
+    pedido_id = str(id)
+    auth_header = request.headers.get("Authorization")
+    if auth_header:
+        try:
+            token = auth_header.split(" ")[1]
+        except IndexError:
+            return respuesta_error("Formato de token inválido", 401)
+        valido = verificar_jwt(token)
+    else:
+        token = request.args.get("token")
+        if not token:
+            return respuesta_error("Token requerido", 401)
+        valido = verificar_token_stream(token, pedido_id)
+
+    if not valido:
+        return respuesta_error("Token inválido", 401)
+
+    if service.estado_ocr(pedido_id, con_productos=False) is None:
+        return respuesta_error("El pedido no tiene OCR en segundo plano", 404)
+
+    def eventos():
+        yield f"retry: {OCR_SSE_RETRY_MS}\n\n"
+        inicio = ultimo_envio = time.time()
+        ultimo = None
+        while True:
+            estado = service.estado_ocr(pedido_id, con_productos=False)
+            if estado is None:
+                return
+            ahora = time.time()
+            if estado["actualizado"] != ultimo:
+                ultimo = estado["actualizado"]
+                if estado["estado"] in ("hecho", "error"):
+                    if estado["estado"] == "hecho":
+                        estado["productos"] = service.obtener_productos(pedido_id)
+                    yield _evento_sse("fin", estado)
+                    return
+                yield _evento_sse("progreso", estado)
+                ultimo_envio = ahora
+            elif ahora - ultimo_envio >= OCR_SSE_KEEPALIVE_SEC:
+                yield ": keepalive\n\n"
+                ultimo_envio = ahora
+            if ahora - inicio >= OCR_SSE_MAX_SEC:
+                return
+            time.sleep(OCR_SSE_POLL_SEC)
+
+    return Response(
+        stream_with_context(eventos()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
 
 # =========================
 # CREAR PEDIDO
@@ -104,11 +251,15 @@ def crear_pedido():
     if not usuario_responsable_id:
         return jsonify({"error": "No se pudo obtener el ID del usuario del token"}), 401
     
+    # ocr_cache=0 fuerza a volver a procesar el PDF aunque ya esté en la caché de extracciones
+    usar_cache = request.form.get("ocr_cache", "1").strip().lower() not in ("0", "false", "no")
+
     # Crear el pedido con solo estos datos; OCR extraerá el resto
     resultado = service.crear_con_pdf(
         cliente_nombre=cliente_nombre,
         usuario_responsable_id=usuario_responsable_id,
-        archivo_pdf=archivo_pdf
+        archivo_pdf=archivo_pdf,
+        usar_cache=usar_cache
     )
 
     if "error" in resultado:
@@ -171,14 +322,66 @@ def actualizar_estado_pedido(id):
         return respuesta_error("Token inválido", 401)
 
     rol_usuario = payload.get("rol")
+    # Opcional: el estado que el cliente ve; si el pedido ya no está en él, 409
+    estado_esperado = (request.get_json(silent=True) or {}).get("estado_esperado")
 
     try:
-        resultado = service.actualizar_estado(str(id), rol_usuario)
+        resultado = service.actualizar_estado(str(id), rol_usuario, estado_esperado)
     except Exception as e:
         print(f"[ESTADO][ERROR] Error actualizando estado: {e}")
         return respuesta_error(f"Error al actualizar estado: {e}", 500)
 
     if isinstance(resultado, dict) and "error" in resultado:
+        return respuesta_error(resultado["error"], resultado.get("codigo", 400))
+
+    return jsonify(resultado), 200
+
+
+# =========================
+# ACTUALIZAR ESTADO DE VARIOS PEDIDOS
+# =========================
+
+@pedidos_bp.route('/estado', methods=['PATCH'])
+@requiere_autenticacion
+def actualizar_estado_pedidos():
+    """
+    Avanza (o con "accion": "retroceder", retrocede) varios pedidos en una petición.
+    Cuerpo: {"ids": [...], "accion": "avanzar", "estado_esperado": opcional}.
+    Responde 200 con el resultado de cada pedido (ok, o error con su código 404/409/400).
+    """
+
+    auth_header = request.headers.get("Authorization")
+
+    if not auth_header:
+        return respuesta_error("Token requerido", 401)
+
+    try:
+        token = auth_header.split(" ")[1]
+    except IndexError:
+        return respuesta_error("Formato de token inválido", 401)
+
+    payload = verificar_jwt(token)
+
+    if not payload:
+        return respuesta_error("Token inválido", 401)
+
+    datos = request.get_json(silent=True) or {}
+    accion = datos.get("accion", "avanzar")
+    if accion not in ("avanzar", "retroceder"):
+        return respuesta_error("accion debe ser 'avanzar' o 'retroceder'", 400)
+
+    try:
+        resultado = service.transicion_masiva(
+            datos.get("ids"),
+            payload.get("rol"),
+            paso=1 if accion == "avanzar" else -1,
+            estado_esperado=datos.get("estado_esperado"),
+        )
+    except Exception as e:
+        print(f"[ESTADO][ERROR] Error en el cambio de estado masivo: {e}")
+        return respuesta_error(f"Error al actualizar estados: {e}", 500)
+
+    if "error" in resultado:
         return respuesta_error(resultado["error"], 400)
 
     return jsonify(resultado), 200
@@ -208,11 +411,12 @@ def retroceder_estado_pedido(id):
         return respuesta_error("Token inválido", 401)
 
     rol_usuario = payload.get("rol")
+    estado_esperado = (request.get_json(silent=True) or {}).get("estado_esperado")
 
-    resultado = service.retroceder_estado(str(id), rol_usuario)
+    resultado = service.retroceder_estado(str(id), rol_usuario, estado_esperado)
 
-    if "error" in resultado:
-        return respuesta_error(resultado["error"], 400)
+    if isinstance(resultado, dict) and "error" in resultado:
+        return respuesta_error(resultado["error"], resultado.get("codigo", 400))
 
     return jsonify(resultado), 200
 
@@ -1,22 +1,49 @@
 from database.supabase_client_admin import supabase_admin
-from datetime import datetime
+from datetime import datetime, timedelta
+import json
 import os
+import re
 import uuid
 import tempfile
-import shutil
 import base64
-import time
-import threading
 from pathlib import Path
 
 # OCR imports (usa el paquete local `ocr/src`)
-from ocr.src.pdf_to_img import convert_pdf_to_images
-from ocr.src.ocr import process_image_with_ocr, get_ocr_data
+from ocr.src.parallel import pdf_pages, pool_size
+from ocr.src.text_layer import plan_pdf_pages, ocr_page_numbers
+from ocr.src.classify import classify_document
+from ocr.src.orientation import estimate_pdf_page_rotation, OCR_ORIENT_APPLY_CONF
+from ocr.src.resolution import resolution_label
 from ocr.src.extract import extract_albaran_data
+from ocr.src.cache import get_extraction_cache, pdf_fingerprint, OCR_CACHE_ENABLED
+from ocr.src.jobs import get_job_queue, job_status, HECHO
+from ocr.src import metrics
+from .cache import get_lecturas_cache, invalidar_pedido, etiqueta_pedido, LISTADOS
 from openpyxl import Workbook
-from pypdf import PdfReader, PdfWriter
+from postgrest.exceptions import APIError
 from io import BytesIO
 import fitz
+
+# Nombres de columna aceptados en las proyecciones (?fields=): se interpolan en el select
+_CAMPO_VALIDO = re.compile(r'^[a-z_][a-z0-9_]*$')
+# Errores de PostgREST/Postgres causados por la petición (columna que no existe, valor
+# con formato inválido en un filtro): se devuelven como 400, no como error del servidor
+_ERRORES_PETICION = {"42703": "Campos inválidos", "PGRST100": "Consulta inválida", "22P02": "Filtro inválido",
+                     "22007": "Filtro inválido", "22008": "Filtro inválido"}
+
+# Tamaño máximo de página del listado de pedidos (?limit=)
+PEDIDOS_PAGE_MAX = int(os.getenv('PEDIDOS_PAGE_MAX', '200'))
+
+# Pedidos por petición en los cambios de estado masivos (PATCH /api/pedidos/estado)
+PEDIDOS_BULK_MAX = int(os.getenv('PEDIDOS_BULK_MAX', '500'))
+# Ids por petición a Supabase en esos cambios: van en la URL (id=in.(...)) y 500 UUID
+# pasan de los ~16 KB que admiten muchos proxies delante de PostgREST (414)
+PEDIDOS_BULK_CHUNK = int(os.getenv('PEDIDOS_BULK_CHUNK', '150'))
+
+# Filas de pedido_productos por petición en las inserciones masivas
+PEDIDOS_INSERT_CHUNK = int(os.getenv('PEDIDOS_INSERT_CHUNK', '500'))
+
+
 class PedidosService:
     
     ESTADOS = {
@@ -35,73 +62,193 @@ class PedidosService:
     
     
     # Métodos para obtener pedidos (usa supabase_admin para bypass RLS)
-    def obtener_todos(self):
-        response = supabase_admin.table("pedidos").select("*").execute()
-        return response.data
+    def obtener_todos(self, **opciones):
+        return self._listar(None, **opciones)
 
     # Obtener pedidos por estado (almacen, logistica, transportista, oficina)
-    def obtener_por_estado(self, estado):
-        response = (
-            supabase_admin
-            .table("pedidos")
-            .select("*")
-            .eq("estado", estado)
-            .execute()
-        )
-        return response.data
+    def obtener_por_estado(self, estado, **opciones):
+        return self._listar(estado, **opciones)
 
     # Obtener pedidos por rol (almacen, logistica, transportista, oficina)
-    def obtener_por_rol(self, rol):
+    def obtener_por_rol(self, rol, filtros=None, campos=None, limite=None, cursor=None):
+        """
+        Pedidos visibles para el rol: admin y oficina ven todos, el resto solo los
+        de su estado. Ver `_listar` para filtros, proyección y paginación.
+
+        Returns:
+            Dict {"pedidos": [...], "siguiente": cursor de la página siguiente o None},
+            o {"error": ...} si algún parámetro no es válido
+        """
         if not rol:
-            return []
+            return {"pedidos": [], "siguiente": None}
 
         rol_norm = rol.strip().lower()
+        clave = (
+            "listado", rol_norm, tuple(sorted((k, v) for k, v in (filtros or {}).items() if v)),
+            campos, limite, cursor,
+        )
+        return get_lecturas_cache().leer(
+            clave, {LISTADOS},
+            lambda: self._listar_por_rol(rol_norm, filtros, campos, limite, cursor),
+            cacheable=lambda resultado: "error" not in resultado,
+        )
+
+    def _listar_por_rol(self, rol_norm, filtros, campos, limite, cursor):
+        opciones = {"filtros": filtros, "campos": campos, "limite": limite, "cursor": cursor}
 
         if rol_norm in ("admin", "oficina"):
-            return self.obtener_todos()
+            return self.obtener_todos(**opciones)
 
         if rol_norm not in self.ESTADOS:
-            return []
+            return {"pedidos": [], "siguiente": None}
 
         estado_num = self.ESTADOS[rol_norm]
-        return self.obtener_por_estado(estado_num)
+        return self.obtener_por_estado(estado_num, **opciones)
+
+    def _listar(self, estado=None, filtros=None, campos=None, limite=None, cursor=None):
+        """
+        Listado de pedidos del más reciente al más antiguo, paginado por clave
+        (fecha_creacion, id): cada página empieza justo después de la última fila
+        de la anterior, sin OFFSET, así que cuesta lo mismo la primera que la
+        centésima y no se saltan ni repiten filas si entran pedidos nuevos.
+
+        Args:
+            estado: Estado fijo por el rol (None = todos)
+            filtros: Dict con 'estado', 'cliente' (prefijo de cliente_nombre, sin
+                     distinguir mayúsculas), 'desde'/'hasta' (fecha_creacion, ISO; una
+                     fecha sin hora en 'hasta' incluye ese día) y 'responsable'
+                     (usuario_responsable_id)
+            campos: Columnas separadas por comas, como en obtener_por_id
+            limite: Tamaño de página (None o 0 = sin paginar, hasta PEDIDOS_PAGE_MAX)
+            cursor: Valor de "siguiente" de la página anterior
+        """
+        filtros = filtros or {}
+        columnas, con_productos = _proyeccion(campos, productos=False)
+        if columnas is None:
+            return {"error": f"Campos inválidos: {campos}"}
+        if limite and columnas != "*" and "fecha_creacion" not in columnas.split(", "):
+            # El cursor sale de la última fila
+            columnas += ", fecha_creacion"
+        seleccion = columnas + (", productos:pedido_productos(*)" if con_productos else "")
+
+        consulta = supabase_admin.table("pedidos").select(seleccion)
+
+        if estado is not None:
+            consulta = consulta.eq("estado", estado)
+        if filtros.get("estado") not in (None, ""):
+            try:
+                estado_filtro = int(filtros["estado"])
+            except (TypeError, ValueError):
+                return {"error": f"Estado inválido: {filtros['estado']}"}
+            if estado is not None and estado_filtro != estado:
+                return {"pedidos": [], "siguiente": None}
+            consulta = consulta.eq("estado", estado_filtro)
+        if filtros.get("cliente"):
+            # Prefijo literal: se escapan los comodines de LIKE (y el * de PostgREST)
+            prefijo = re.sub(r'([\\%_])', r'\\\1', filtros["cliente"].strip()).replace("*", "")
+            consulta = consulta.ilike("cliente_nombre", f"{prefijo}%")
+        if filtros.get("responsable"):
+            consulta = consulta.eq("usuario_responsable_id", filtros["responsable"])
+        for clave in ("desde", "hasta"):
+            if filtros.get(clave):
+                limite_fecha = _fecha_filtro(filtros[clave], fin=(clave == "hasta"))
+                if limite_fecha is None:
+                    return {"error": f"Fecha inválida en '{clave}': {filtros[clave]}"}
+                operador, valor = limite_fecha
+                consulta = consulta.filter("fecha_creacion", operador, valor)
+
+        if cursor:
+            posicion = _leer_cursor(cursor)
+            if posicion is None:
+                return {"error": "Cursor inválido"}
+            fecha, ultimo_id = posicion
+            consulta = consulta.or_(
+                f'fecha_creacion.lt."{fecha}",and(fecha_creacion.eq."{fecha}",id.lt.{ultimo_id})'
+            )
+
+        consulta = consulta.order("fecha_creacion", desc=True).order("id", desc=True)
+        if limite:
+            # Una fila de más para saber si hay página siguiente
+            consulta = consulta.limit(min(limite, PEDIDOS_PAGE_MAX) + 1)
 
-    def obtener_por_id(self, pedido_id):
+        try:
+            pedidos = consulta.execute().data or []
+        except APIError as e:
+            if e.code not in _ERRORES_PETICION:
+                raise
+            return {"error": f"{_ERRORES_PETICION[e.code]}: {e.message}"}
+        siguiente = None
+        if limite and len(pedidos) > min(limite, PEDIDOS_PAGE_MAX):
+            pedidos = pedidos[:min(limite, PEDIDOS_PAGE_MAX)]
+            siguiente = _crear_cursor(pedidos[-1])
+        return {"pedidos": pedidos, "siguiente": siguiente}
+
+    def obtener_por_id(self, pedido_id, campos=None):
         """
-        Obtiene un pedido por su ID y adjunta los productos relacionados.
+        Obtiene un pedido por su ID con sus productos en una sola consulta
+        (select embebido de PostgREST sobre la relación pedido_productos).
         Usa el cliente admin para asegurar que se recuperan los productos
         independientemente de las políticas RLS (la ruta que llama a este
         método ya está protegida por autenticación).
+
+        Args:
+            pedido_id: ID del pedido
+            campos: Columnas a devolver separadas por comas (p. ej. "estado,cliente_nombre,productos");
+                    "productos" incluye los productos. Por defecto, todo
+
+        Returns:
+            Dict del pedido con la clave "productos", None si no existe o
+            {"error": ...} si algún campo no es válido
         """
-        pedido = (
-            supabase_admin
-            .table("pedidos")
-            .select("*")
-            .eq("id", pedido_id)
-            .maybe_single()
-            .execute()
+        columnas, con_productos = _proyeccion(campos)
+        if columnas is None:
+            return {"error": f"Campos inválidos: {campos}"}
+
+        return get_lecturas_cache().leer(
+            ("pedido", pedido_id, columnas, con_productos), {etiqueta_pedido(pedido_id)},
+            lambda: self._leer_pedido(pedido_id, columnas, con_productos),
+            cacheable=lambda resultado: resultado is not None and "error" not in resultado,
         )
 
-        if not pedido.data:
-            return None
-
-        # Obtener productos asociados usando el cliente admin para evitar RLS
+    def _leer_pedido(self, pedido_id, columnas, con_productos):
+        # limit(1) y no maybe_single: maybe_single cambia cualquier error de PostgREST
+        # por uno genérico y no se podría distinguir la relación o el campo que faltan
+        seleccion = columnas + (", productos:pedido_productos(*)" if con_productos else "")
         try:
-            productos_resp = (
-                supabase_admin
-                .table("pedido_productos")
-                .select("*")
-                .eq("pedido_id", pedido_id)
-                .execute()
-            )
-            productos = productos_resp.data or []
-        except Exception:
-            productos = []
+            try:
+                filas = self._select_pedido(pedido_id, seleccion)
+            except APIError as e:
+                if e.code != "PGRST200" or not con_productos:
+                    raise
+                # Sin clave foránea declarada no hay relación que embeber: dos consultas
+                print(f"[PEDIDO][WARN] Sin relación pedidos -> pedido_productos, consulta aparte: {e.message}")
+                filas = self._select_pedido(pedido_id, columnas)
+                if filas:
+                    filas[0]["productos"] = self.obtener_productos(pedido_id)
+        except APIError as e:
+            # ?fields= con una columna que no existe
+            if e.code not in _ERRORES_PETICION:
+                raise
+            return {"error": f"{_ERRORES_PETICION[e.code]}: {e.message}"}
+
+        if not filas:
+            return None
 
-        resultado = pedido.data
-        resultado["productos"] = productos
+        resultado = filas[0]
+        if con_productos:
+            resultado["productos"] = resultado.get("productos") or []
         return resultado
-    
+
+    def _select_pedido(self, pedido_id, seleccion):
+        return (
+            supabase_admin
+            .table("pedidos")
+            .select(seleccion)
+            .eq("id", pedido_id)
+            .limit(1)
+            .execute()
+        ).data or []
+
     # ===============================================
     # CREAR Y SUBIR PDF
     # ===============================================
@@ -133,8 +280,108 @@ class PedidosService:
     #     return response.data
     
     
+    # Insertar en 'pedido_productos' los productos extraídos de un albarán
+    # Inserta los productos extraídos de un pedido. Con idempotente=True (reintentos del
+    # worker de OCR) se omiten las filas que ya están, para no duplicarlas.
+    def _insertar_productos(self, pedido_id, productos, tag="CREATE_PEDIDO", idempotente=False):
+        with metrics.span('db_insert'):
+            return self._insertar_filas(pedido_id, productos, tag, idempotente)
+
+    # Todas las filas en una sola petición (en trozos de PEDIDOS_INSERT_CHUNK). Si un trozo
+    # falla, se reintenta fila a fila para saber cuáles fallan y guardar el resto.
+    # Devuelve {'insertados', 'omitidos', 'errores': [{'indice', 'nombre_producto', 'error'}]}
+    def _insertar_filas(self, pedido_id, productos, tag, idempotente=False):
+        filas = [
+            {
+                'pedido_id': pedido_id,
+                'nombre_producto': producto.get('especie') or producto.get('linea_original'),
+                'cantidad': producto.get('peso_kg') or 0,
+                'precio': producto.get('precio') or 0,
+            }
+            for producto in productos
+        ]
+        resultado = {'insertados': 0, 'omitidos': 0, 'errores': []}
+
+        pendientes = list(enumerate(filas))
+        if idempotente and pendientes:
+            pendientes = self._filas_nuevas(pedido_id, pendientes, tag)
+            resultado['omitidos'] = len(filas) - len(pendientes)
+        # Filas de esta llamada que ya están en el pedido (omitidas o insertadas)
+        indices_pendientes = {indice for indice, _ in pendientes}
+        en_pedido = [(indice, fila) for indice, fila in enumerate(filas) if indice not in indices_pendientes]
+
+        for inicio in range(0, len(pendientes), PEDIDOS_INSERT_CHUNK):
+            trozo = pendientes[inicio:inicio + PEDIDOS_INSERT_CHUNK]
+            try:
+                supabase_admin.table('pedido_productos').insert([fila for _, fila in trozo]).execute()
+                resultado['insertados'] += len(trozo)
+                en_pedido.extend(trozo)
+                continue
+            except Exception as e:
+                print(f"[{tag}][ERROR] Inserción masiva de {len(trozo)} productos fallida, fila a fila: {e}")
+            if idempotente:
+                # La inserción masiva pudo confirmarse aunque se perdiera la respuesta: se
+                # vuelve a leer el pedido y se descuentan primero las filas ya conocidas;
+                # las del trozo que ya están las insertó esta misma petición
+                indices_trozo = {indice for indice, _ in trozo}
+                nuevas = self._filas_nuevas(pedido_id, en_pedido + trozo, tag)
+                restantes = [(indice, fila) for indice, fila in nuevas if indice in indices_trozo]
+                resultado['insertados'] += len(trozo) - len(restantes)
+                en_pedido.extend(fila for fila in trozo if fila not in restantes)
+                trozo = restantes
+            for indice, fila in trozo:
+                try:
+                    supabase_admin.table('pedido_productos').insert(fila).execute()
+                    resultado['insertados'] += 1
+                    en_pedido.append((indice, fila))
+                except Exception as e:
+                    print(f"[{tag}][ERROR] Error al insertar producto {fila['nombre_producto']}: {e}")
+                    resultado['errores'].append({
+                        'indice': indice, 'nombre_producto': fila['nombre_producto'], 'error': str(e),
+                    })
+
+        if resultado['insertados']:
+            invalidar_pedido(pedido_id)
+        metrics.inc('pedido_productos_filas_total', resultado['insertados'], resultado='insertada')
+        metrics.inc('pedido_productos_filas_total', resultado['omitidos'], resultado='omitida')
+        metrics.inc('pedido_productos_filas_total', len(resultado['errores']), resultado='error')
+        print(
+            f"[{tag}] Productos pedido={pedido_id}: {resultado['insertados']} insertados, "
+            f"{resultado['omitidos']} ya existentes, {len(resultado['errores'])} con error"
+        )
+        return resultado
+
+    # Filas (índice, fila) que aún no están en el pedido, comparando nombre, cantidad y
+    # precio como multiconjunto (dos líneas iguales del albarán cuentan dos veces)
+    def _filas_nuevas(self, pedido_id, pendientes, tag):
+        try:
+            existentes = (
+                supabase_admin
+                .table('pedido_productos')
+                .select('nombre_producto, cantidad, precio')
+                .eq('pedido_id', pedido_id)
+                .execute()
+            ).data or []
+        except Exception as e:
+            print(f"[{tag}][ERROR] No se pudieron leer los productos existentes: {e}")
+            return pendientes
+
+        restantes = {}
+        for fila in existentes:
+            clave = _clave_fila(fila)
+            restantes[clave] = restantes.get(clave, 0) + 1
+        nuevas = []
+        for indice, fila in pendientes:
+            clave = _clave_fila(fila)
+            if restantes.get(clave):
+                restantes[clave] -= 1
+            else:
+                nuevas.append((indice, fila))
+        return nuevas
+
     # Crear un nuevo pedido con PDF. Extrae datos automáticamente del PDF con OCR.
-    def crear_con_pdf(self, cliente_nombre, usuario_responsable_id, archivo_pdf):
+    # Con usar_cache=False no se consulta la caché de extracciones (se vuelve a procesar el PDF).
+    def crear_con_pdf(self, cliente_nombre, usuario_responsable_id, archivo_pdf, usar_cache=True):
 
         pedido_id = str(uuid.uuid4())
         nombre_archivo = f"{pedido_id}.pdf"
@@ -150,27 +397,32 @@ class PedidosService:
             archivo_pdf.save(tmp_pdf.name)
             tmp_pdf_path = tmp_pdf.name
             print(f"[CREATE_PEDIDO] PDF guardado en temporales: {tmp_pdf_path}")
+
+            # Huella del PDF tal como se subió, para la caché de extracciones
+            with open(tmp_pdf_path, 'rb') as f:
+                clave_cache = pdf_fingerprint(f.read())
             
-            # RECTIFICAR ORIENTACIÓN: Si el documento viene horizontal, rotarlo a vertical.
+            # RECTIFICAR ORIENTACIÓN: cada página se guarda derecha (0/90/180/270 según
+            # ocr/src/orientation.py) si la estimación es clara, así la vista previa, la
+            # firma y el OCR ven lo mismo; si es dudosa se deja como viene y solo el OCR
+            # gira su render
             try:
-                reader = PdfReader(tmp_pdf_path)
-                writer = PdfWriter()
+                doc = fitz.open(tmp_pdf_path)
                 modificado = False
-                
-                for page in reader.pages:
-                    w = float(page.mediabox.width)
-                    h = float(page.mediabox.height)
-                    
-                    if w > h:
-                        page.rotate(270)
+                for page in doc:
+                    rotacion = estimate_pdf_page_rotation(page, min_confidence=OCR_ORIENT_APPLY_CONF)
+                    if rotacion:
+                        page.set_rotation((page.rotation - rotacion) % 360)
                         modificado = True
-                    
-                    writer.add_page(page)
-                
+
                 if modificado:
+                    pdf_bytes = doc.tobytes()
+                    doc.close()
                     with open(tmp_pdf_path, 'wb') as f_out:
-                        writer.write(f_out)
-                    print("[CREATE_PEDIDO] PDF corregido: Rotado a formato vertical exitosamente.")
+                        f_out.write(pdf_bytes)
+                    print("[CREATE_PEDIDO] PDF corregido: páginas giradas a su orientación de lectura.")
+                else:
+                    doc.close()
             except Exception as e:
                 print(f"[CREATE_PEDIDO][ERROR] Error ignorado al intentar rotar el PDF: {e}")
 
@@ -203,47 +455,62 @@ class PedidosService:
                 .execute()
             )
             print(f"[CREATE_PEDIDO] Pedido creado en BD: {pedido_id}")
+            invalidar_pedido(pedido_id)
         except Exception as e:
             print(f"[CREATE_PEDIDO][ERROR] Error al crear pedido en BD: {e}")
             return {"error": f"Error al crear pedido: {e}"}
 
+        # ── Intento 0: caché de extracciones (mismo albarán subido otra vez) ──────
+        # Si ya se procesó este PDF, se insertan sus productos y no hay ni texto ni OCR.
+        cache = get_extraction_cache() if OCR_CACHE_ENABLED else None
+        if cache and usar_cache:
+            _cached = cache.get(clave_cache)
+            if _cached is not None:
+                _productos = _cached.get('productos', [])
+                print(f"[CREATE_PEDIDO] Caché de extracción HIT: {len(_productos)} productos (sin OCR)")
+                metrics.inc('pedidos_extraccion_total', origen='cache')
+                self._insertar_productos(pedido_id, _productos)
+                try:
+                    Path(tmp_pdf_path).unlink()
+                except Exception:
+                    pass
+                return response.data
+            print(f"[CREATE_PEDIDO] Caché de extracción MISS")
+
         # ── Intento 1: extracción directa de texto (PDF con capa de texto) ─────────
-        # Funciona de forma síncrona y es instantánea.
-        # Si hay texto suficiente, insertamos productos aquí y NO lanzamos OCR.
+        # Se decide página a página (ocr/src/text_layer.py). Si todas tienen capa de
+        # texto utilizable, se extrae aquí, de forma síncrona, y NO se lanza OCR;
+        # si alguna es un escaneo, el worker hace OCR solo de esas y une el resto.
         _direct_text_ok = False
         try:
-            _t0 = time.time()
-            _doc = fitz.open(tmp_pdf_path)
-            _direct_text = "\n".join(page.get_text() for page in _doc)
-            _doc.close()
-            _direct_chars = len(_direct_text.strip())
-            print(f"[CREATE_PEDIDO] Texto directo extraído: {_direct_chars} chars en {time.time()-_t0:.2f}s")
-
-            _min_chars = int(os.getenv('PDF_DIRECT_TEXT_MIN_CHARS', '80'))
-            if _direct_chars >= _min_chars:
+            with metrics.span('direct_text'):
+                _plan = plan_pdf_pages(tmp_pdf_path)
+            _ocr_pages = ocr_page_numbers(_plan)
+            _direct_text = "\n".join(entry['text'] for entry in _plan)
+            print(
+                f"[CREATE_PEDIDO] Texto directo extraído: {len(_direct_text.strip())} chars, "
+                f"{len(_plan) - len(_ocr_pages)}/{len(_plan)} página(s) con capa de texto"
+            )
+
+            if _plan and not _ocr_pages:
                 print(f"[CREATE_PEDIDO] Usando extracción directa de texto (sin OCR)")
                 try:
-                    _albaran = extract_albaran_data(_direct_text)
+                    # Cajas de palabras de la capa de texto: extracción por columnas sin OCR
+                    with metrics.span('extract', origen='texto'):
+                        _albaran = extract_albaran_data(
+                            _direct_text, ocr_data_list=[entry['data'] for entry in _plan if entry['data']]
+                        )
                     _productos = _albaran.get('productos', [])
                     print(f"[CREATE_PEDIDO] Productos extraídos (directo): {len(_productos)}")
-                    for _prod in _productos:
-                        try:
-                            _kilos = _prod.get('peso_kg') or 0
-                            _fila = {
-                                'pedido_id': pedido_id,
-                                'nombre_producto': _prod.get('especie') or _prod.get('linea_original'),
-                                'cantidad': _kilos,
-                                'precio': _prod.get('precio') or 0,
-                            }
-                            supabase_admin.table('pedido_productos').insert(_fila).execute()
-                            print(f"[CREATE_PEDIDO] Producto insertado: {_fila['nombre_producto']}")
-                        except Exception as _e:
-                            print(f"[CREATE_PEDIDO][ERROR] Error insertando producto directo: {_e}")
+                    metrics.inc('pedidos_extraccion_total', origen='texto')
+                    self._insertar_productos(pedido_id, _productos)
+                    if cache and _productos:
+                        cache.put(clave_cache, _albaran)
                     _direct_text_ok = True
                 except Exception as _e:
                     print(f"[CREATE_PEDIDO][WARN] Error en extract_albaran_data (directo): {_e}")
             else:
-                print(f"[CREATE_PEDIDO] Texto insuficiente ({_direct_chars} chars) — usando OCR")
+                print(f"[CREATE_PEDIDO] Páginas sin capa de texto {_ocr_pages} — usando OCR")
         except Exception as _e:
             print(f"[CREATE_PEDIDO][WARN] Error en extracción directa: {_e}")
 
@@ -255,119 +522,122 @@ class PedidosService:
                 pass
             return response.data
 
-        # ── Intento 2: OCR con Tesseract en hilo de fondo (PDF escaneado) ────────
-        def _run_ocr_background(pedido_id, tmp_pdf_path):
-            tmp_images_dir = None
+        # ── Intento 2: OCR con Tesseract en el worker de OCR (PDF escaneado) ─────
+        # El trabajo queda en la cola persistente (ocr/src/jobs.py) y lo procesa
+        # `python -m ocr.worker`; sobrevive a reinicios y al timeout de gunicorn.
+        try:
+            job_id = get_job_queue().enqueue(pedido_id, tmp_pdf_path, clave_cache=clave_cache)
+            metrics.inc('pedidos_extraccion_total', origen='ocr')
+            print(f"[CREATE_PEDIDO] OCR encolado (trabajo={job_id}), respondiendo al cliente ahora")
+        except Exception as e:
+            print(f"[CREATE_PEDIDO][ERROR] No se pudo encolar el OCR: {e}")
+        finally:
             try:
-                ocr_total_start = time.time()
-                print(f"[OCR] Iniciando procesamiento OCR (background) para pedido {pedido_id}")
-
-                tmp_images_dir = Path(tempfile.mkdtemp())
+                Path(tmp_pdf_path).unlink()
+            except Exception:
+                pass
 
-                # Convertir PDF a imágenes
-                try:
-                    ocr_dpi = int(os.getenv('OCR_DPI', '220'))
-                    convert_start = time.time()
-                    print(f"[OCR] convert_pdf_to_images START pedido={pedido_id} dpi={ocr_dpi}")
-                    image_files = convert_pdf_to_images(tmp_pdf_path, tmp_images_dir, dpi=ocr_dpi)
-                    print(f"[OCR] convert_pdf_to_images DONE pedido={pedido_id} elapsed={time.time()-convert_start:.2f}s")
-                except Exception as e:
-                    print(f"[OCR][ERROR] error al convertir PDF a imágenes: {e}")
-                    image_files = []
-
-                print(f"[OCR] imágenes generadas: {len(image_files)}")
-
-                # Ejecutar OCR sobre cada imagen y recolectar texto y datos
-                all_text = ""
-                ocr_data_list = []
-                for idx, img in enumerate(image_files, start=1):
-                    page_start = time.time()
-                    print(f"[OCR] Página {idx}/{len(image_files)} START img={img}")
-                    try:
-                        txt_start = time.time()
-                        print(f"[OCR] process_image_with_ocr START img={img}")
-                        t = process_image_with_ocr(img)
-                        print(f"[OCR] process_image_with_ocr DONE img={img} elapsed={time.time()-txt_start:.2f}s chars={len(t)}")
-                    except Exception as e:
-                        print(f"[OCR][ERROR] error en process_image_with_ocr para {img}: {e}")
-                        t = ""
-
-                    all_text += t + "\n"
-
-                    try:
-                        data_start = time.time()
-                        print(f"[OCR] get_ocr_data START img={img}")
-                        data = get_ocr_data(img, lang='spa+por')
-                        if data:
-                            print(
-                                f"[OCR] get_ocr_data DONE img={img} elapsed={time.time()-data_start:.2f}s "
-                                f"words={len(data.get('text', [])) if isinstance(data, dict) else 'n/a'}"
-                            )
-                            ocr_data_list.append(data)
-                        else:
-                            print(f"[OCR] get_ocr_data DONE img={img} elapsed={time.time()-data_start:.2f}s result=None")
-                    except Exception as e:
-                        print(f"[OCR][ERROR] error en get_ocr_data para {img}: {e}")
-
-                    print(f"[OCR] Página {idx}/{len(image_files)} DONE elapsed={time.time()-page_start:.2f}s")
-
-                # Extraer productos del albarán
-                try:
-                    albaran_data = extract_albaran_data(all_text, ocr_data_list=ocr_data_list)
-                except Exception as e:
-                    print(f"[OCR][ERROR] error extrayendo productos: {e}")
-                    albaran_data = {'productos': []}
-
-                productos = albaran_data.get('productos', [])
-                print(f"[OCR] productos extraidos: {len(productos)}")
-
-                # Insertar productos en la tabla 'pedido_productos'
-                if productos:
-                    for producto in productos:
-                        try:
-                            kilos = producto.get('peso_kg') or 0
-                            fila = {
-                                'pedido_id': pedido_id,
-                                'nombre_producto': producto.get('especie') or producto.get('linea_original'),
-                                'cantidad': kilos,
-                                'precio': producto.get('precio') or 0,
-                            }
-                            supabase_admin.table('pedido_productos').insert(fila).execute()
-                            print(f"[OCR] Producto insertado: {fila['nombre_producto']} - {fila['cantidad']} kg - {fila['precio']} €")
-                        except Exception as e:
-                            print(f"[OCR][ERROR] Error al insertar producto: {e}")
-                else:
-                    print(f"[OCR] WARNING: No se extrajeron productos del PDF")
+        return response.data
 
-                print(f"[OCR] Pipeline completo pedido={pedido_id} elapsed={time.time()-ocr_total_start:.2f}s")
+    # Pipeline de OCR de un PDF escaneado: detección de idioma, OCR por páginas,
+    # extracción e inserción de productos. Lo ejecuta el worker de OCR (ocr/worker.py).
+    # done_pages/on_page permiten retomar un trabajo desde sus checkpoints por página;
+    # on_stage recibe la etapa actual ('deteccion', 'ocr', 'extraccion', 'insercion').
+    def procesar_ocr(self, pedido_id, pdf_path, clave_cache=None, done_pages=None, on_page=None, on_stage=None):
+        on_stage = on_stage or (lambda etapa: None)
+        print(f"[OCR] Iniciando procesamiento OCR para pedido {pedido_id}")
+
+        with metrics.span('document'):
+            albaran_data = self._pipeline_ocr(pedido_id, pdf_path, clave_cache, done_pages, on_page, on_stage)
+        metrics.inc('ocr_documents_total')
+        return albaran_data
+
+    def _pipeline_ocr(self, pedido_id, pdf_path, clave_cache, done_pages, on_page, on_stage):
+        # Idioma y tipo de documento a partir de la cabecera de la primera página
+        on_stage('deteccion')
+        deteccion = classify_document(pdf_path)
+        ocr_lang = deteccion['ocr_lang']
+
+        # Renderizar + OCR de las páginas en el pool de procesos compartido
+        # (los resultados vuelven ordenados por página, junto a las de capa de texto)
+        on_stage('ocr')
+        print(
+            f"[OCR] ocr_pdf START pedido={pedido_id} lang={ocr_lang} dpi={resolution_label()} "
+            f"workers={pool_size()} checkpoints={len(done_pages or {})}"
+        )
+        with metrics.span('ocr_pdf'):
+            # Capa de texto donde sirve y OCR solo en las páginas escaneadas, en orden de página
+            paginas = pdf_pages(pdf_path, lang=ocr_lang, done=done_pages, on_page=on_page)
+
+        all_text = ""
+        ocr_data_list = []
+        # Páginas que el OCR no pudo leer (pool roto, fallo de Tesseract): salen vacías
+        fallidas = [pagina['page'] for pagina in paginas if pagina.get('failed')]
+        if fallidas:
+            print(f"[OCR][ERROR] pedido={pedido_id} páginas sin leer: {fallidas}")
+        for pagina in paginas:
+            all_text += pagina['text'] + "\n"
+            if pagina['data']:
+                ocr_data_list.append(pagina['data'])
+        print(f"[OCR] páginas procesadas: {len(paginas)} chars={len(all_text.strip())}")
+
+        # Extraer productos del albarán
+        on_stage('extraccion')
+        try:
+            with metrics.span('extract', origen='ocr'):
+                albaran_data = extract_albaran_data(
+                    all_text, ocr_data_list=ocr_data_list, doc_type=deteccion['doc_type']
+                )
+        except Exception as e:
+            print(f"[OCR][ERROR] error extrayendo productos: {e}")
+            albaran_data = {'productos': []}
+
+        productos = albaran_data.get('productos', [])
+        print(f"[OCR] productos extraidos: {len(productos)}")
+
+        # Insertar productos en la tabla 'pedido_productos'
+        on_stage('insercion')
+        if productos:
+            self._insertar_productos(pedido_id, productos, tag="OCR", idempotente=True)
+            cache = get_extraction_cache() if OCR_CACHE_ENABLED else None
+            # Con páginas sin leer la lista está incompleta: no se guarda para las resubidas
+            if cache and clave_cache and not fallidas:
+                cache.put(clave_cache, albaran_data)
+        else:
+            print(f"[OCR] WARNING: No se extrajeron productos del PDF")
+
+        print(f"[OCR] Pipeline completo pedido={pedido_id}")
+        return albaran_data
+
+    # Estado del OCR en segundo plano de un pedido (cola de ocr/src/jobs.py).
+    # Solo lee la cola local; Supabase se consulta una vez, al terminar, para los productos.
+    # Devuelve None si el pedido no pasó por el worker (caché o texto directo).
+    def estado_ocr(self, pedido_id, con_productos=True):
+        job = get_job_queue().latest_for_pedido(pedido_id)
+        if job is None:
+            return None
 
-            except Exception as e:
-                print(f"[OCR][WARNING] Error procesando OCR del PDF para pedido {pedido_id}: {e}")
-            finally:
-                try:
-                    if tmp_pdf_path and Path(tmp_pdf_path).exists():
-                        Path(tmp_pdf_path).unlink()
-                        print(f"[OCR] Archivo temporal PDF limpiado")
-                except Exception:
-                    pass
-                try:
-                    if tmp_images_dir and tmp_images_dir.exists():
-                        shutil.rmtree(tmp_images_dir)
-                        print(f"[OCR] Directorio temporal de imágenes limpiado")
-                except Exception:
-                    pass
+        estado = job_status(job)
+        if con_productos and job['estado'] == HECHO:
+            estado["productos"] = self.obtener_productos(pedido_id)
+        return estado
 
-        ocr_thread = threading.Thread(
-            target=_run_ocr_background,
-            args=(pedido_id, tmp_pdf_path),
-            daemon=True,
-            name=f"ocr-{pedido_id[:8]}"
-        )
-        ocr_thread.start()
-        print(f"[CREATE_PEDIDO] OCR lanzado en background (hilo={ocr_thread.name}), respondiendo al cliente ahora")
+    def obtener_productos(self, pedido_id):
+        try:
+            return get_lecturas_cache().leer(
+                ("productos", pedido_id), {etiqueta_pedido(pedido_id)},
+                lambda: (
+                    supabase_admin
+                    .table("pedido_productos")
+                    .select("*")
+                    .eq("pedido_id", pedido_id)
+                    .execute()
+                ).data or []
+            )
+        except Exception as e:
+            print(f"[OCR_ESTADO][ERROR] Error obteniendo productos: {e}")
+            return []
 
-        return response.data
-    
     # =========================
     # OBTENER URL FIRMADA
     # =========================
@@ -419,9 +689,10 @@ class PedidosService:
                 return {"error": "PDF vacío"}
                 
             page = doc[0]
-            # Si es apaisado, lo mostramos derecho para que coincida con lo que procesa la firma
-            if page.rect.width > page.rect.height:
-                page.set_rotation(page.rotation + 270)
+            # Se muestra derecho (misma estimación que aplica la firma, para que cuadre)
+            rotacion = estimate_pdf_page_rotation(page, min_confidence=OCR_ORIENT_APPLY_CONF)
+            if rotacion:
+                page.set_rotation((page.rotation - rotacion) % 360)
                 
             # Render a imagen (DPI ~150 para que no sea inmensa ni se vea mal)
             mat = fitz.Matrix(2.0, 2.0)
@@ -434,88 +705,192 @@ class PedidosService:
 
     
     # Función que actualiza el estado del pedido, solo si el rol del usuario coincide con el estado actual del pedido
-    def actualizar_estado(self, pedido_id, rol_usuario):
-        # Obtener pedido actual
-        pedido = (
-            supabase_admin
-            .table("pedidos")
-            .select("*")
-            .eq("id", pedido_id)
-            .maybe_single()
-            .execute()
-        )
-
-        rol_usuario = rol_usuario.strip().lower()
+    def actualizar_estado(self, pedido_id, rol_usuario, estado_esperado=None):
+        return self._transicion(pedido_id, rol_usuario, 1, estado_esperado)
 
-        if not pedido.data:
-            return {"error": "Pedido no encontrado"}
-
-        estado_actual = int(pedido.data["estado"])
-
-        # Admin y oficina pueden avanzar cualquier estado
-        if rol_usuario not in ("admin", "oficina"):
-            if rol_usuario not in self.ESTADOS:
-                return {"error": "Rol no válido"}
-            if self.ESTADOS[rol_usuario] != estado_actual:
-                return {"error": "No puedes modificar este pedido en su estado actual"}
+    # Retroceder estado: devolver pedido al rol anterior para correcciones
+    def retroceder_estado(self, pedido_id, rol_usuario, estado_esperado=None):
+        return self._transicion(pedido_id, rol_usuario, -1, estado_esperado)
 
-        # Calcular siguiente estado
-        siguiente_estado = estado_actual + 1
+    def _estado_de_partida(self, rol_usuario, estado_esperado):
+        """
+        Estado desde el que el rol puede mover pedidos: el suyo, o para admin y
+        oficina (que mueven cualquiera) el que diga el cliente, si lo dice.
 
-        if siguiente_estado > 4:
+        Returns:
+            Tupla (estado o None si hay que leerlo, si el estado lo fija solo el rol,
+            dict de error o None)
+        """
+        rol_usuario = (rol_usuario or "").strip().lower()
+        if estado_esperado is not None:
+            try:
+                estado_esperado = int(estado_esperado)
+            except (TypeError, ValueError):
+                return None, False, {"error": f"estado_esperado inválido: {estado_esperado}"}
+
+        # Admin y oficina pueden mover cualquier estado
+        if rol_usuario in ("admin", "oficina"):
+            return estado_esperado, False, None
+        if rol_usuario not in self.ESTADOS:
+            return None, False, {"error": "Rol no válido"}
+        # Los demás roles solo mueven pedidos de su propio estado
+        if estado_esperado is not None and estado_esperado != self.ESTADOS[rol_usuario]:
+            return None, False, {"error": "No puedes modificar este pedido en su estado actual"}
+        return self.ESTADOS[rol_usuario], estado_esperado is None, None
+
+    def _transicion(self, pedido_id, rol_usuario, paso, estado_esperado=None):
+        """
+        Avanza (paso=1) o retrocede (paso=-1) el estado con un UPDATE condicionado
+        al estado de partida (eq("estado", ...)): valida y cambia en una sola
+        petición, y si otro usuario movió el pedido entretanto no se pisa su
+        cambio. Solo hay lectura previa si el rol es admin/oficina y no se manda
+        estado_esperado, y otra después si el UPDATE no cambió nada (para decir
+        por qué).
+
+        Returns:
+            Filas actualizadas, o {"error", "codigo"} (404 no existe, 409 el
+            estado cambió desde que el cliente lo leyó, 400 el resto; también si
+            el pedido no está en el estado del rol)
+        """
+        esperado, por_rol, error = self._estado_de_partida(rol_usuario, estado_esperado)
+        if error:
+            return error
+
+        if esperado is None:
+            actual = self._estado_actual(pedido_id)
+            if actual is None:
+                return {"error": "Pedido no encontrado", "codigo": 404}
+            esperado = actual
+
+        destino = esperado + paso
+        if destino > 4:
             return {"error": "El pedido ya está finalizado"}
+        if destino < 0:
+            return {"error": "El pedido ya está en el primer estado"}
 
-        # Actualizar estado
         response = (
             supabase_admin
             .table("pedidos")
-            .update({"estado": siguiente_estado})
+            .update({"estado": destino})
             .eq("id", pedido_id)
+            .eq("estado", esperado)
             .execute()
         )
 
-        return response.data
+        if response.data:
+            invalidar_pedido(pedido_id)
+            return response.data
 
-    # Retroceder estado: devolver pedido al rol anterior para correcciones
-    def retroceder_estado(self, pedido_id, rol_usuario):
+        # No se actualizó nada: o no existe o ya no está en el estado esperado
+        actual = self._estado_actual(pedido_id)
+        if actual is None:
+            return {"error": "Pedido no encontrado", "codigo": 404}
+        return _rechazo_estado(actual, esperado, por_rol)
+
+    def _estado_actual(self, pedido_id):
         pedido = (
             supabase_admin
             .table("pedidos")
-            .select("*")
+            .select("estado")
             .eq("id", pedido_id)
             .maybe_single()
             .execute()
         )
+        if not pedido or not pedido.data:
+            return None
+        return int(pedido.data["estado"])
 
-        rol_usuario = rol_usuario.strip().lower()
-
-        if not pedido.data:
-            return {"error": "Pedido no encontrado"}
-
-        estado_actual = int(pedido.data["estado"])
-
-        if estado_actual <= 0:
-            return {"error": "El pedido ya está en el primer estado"}
-
-        # Admin y oficina pueden retroceder cualquier estado
-        # Los demás roles solo pueden retroceder su propio estado
-        if rol_usuario not in ("admin", "oficina"):
-            if rol_usuario not in self.ESTADOS:
-                return {"error": "Rol no válido"}
-            if self.ESTADOS[rol_usuario] != estado_actual:
-                return {"error": "No puedes retroceder este pedido en su estado actual"}
-
-        estado_anterior = estado_actual - 1
-
-        response = (
-            supabase_admin
-            .table("pedidos")
-            .update({"estado": estado_anterior})
-            .eq("id", pedido_id)
-            .execute()
+    def transicion_masiva(self, pedido_ids, rol_usuario, paso=1, estado_esperado=None):
+        """
+        Avanza o retrocede varios pedidos a la vez con un UPDATE condicionado por
+        cada estado de partida (uno solo si el rol o estado_esperado lo fijan; como
+        mucho uno por estado si admin/oficina no lo mandan, tras una lectura), más
+        una lectura de los que no se pudieron mover para explicar por qué. Los ids
+        van en trozos de PEDIDOS_BULK_CHUNK por petición.
+
+        Returns:
+            {"resultados": [{"id", "ok", "estado"} o {"id", "ok", "error", "codigo"}],
+             "actualizados", "errores"} en el orden de pedido_ids, o {"error"} si la
+            petición no es válida
+        """
+        if not isinstance(pedido_ids, list) or not pedido_ids:
+            return {"error": "ids debe ser una lista no vacía"}
+        if len(pedido_ids) > PEDIDOS_BULK_MAX:
+            return {"error": f"Como mucho {PEDIDOS_BULK_MAX} pedidos por petición"}
+        try:
+            ids = list(dict.fromkeys(str(uuid.UUID(str(i))) for i in pedido_ids))
+        except ValueError:
+            return {"error": "ids contiene identificadores no válidos"}
+
+        esperado, por_rol, error = self._estado_de_partida(rol_usuario, estado_esperado)
+        if error:
+            return error
+
+        resultados = {}
+        leidos = {}
+        if esperado is None:
+            grupos = {}
+            for fila in self._leer_estados(ids):
+                leidos[fila["id"]] = int(fila["estado"])
+                grupos.setdefault(int(fila["estado"]), []).append(fila["id"])
+        else:
+            grupos = {esperado: ids}
+
+        actualizados = []
+        updates = 0
+        for partida, grupo in grupos.items():
+            destino = partida + paso
+            if not 0 <= destino <= 4:
+                mensaje = "El pedido ya está finalizado" if destino > 4 else "El pedido ya está en el primer estado"
+                resultados.update({i: {"id": i, "ok": False, "error": mensaje, "codigo": 400} for i in grupo})
+                continue
+            for trozo in _trozos(grupo, PEDIDOS_BULK_CHUNK):
+                filas = (
+                    supabase_admin
+                    .table("pedidos")
+                    .update({"estado": destino})
+                    .in_("id", trozo)
+                    .eq("estado", partida)
+                    .execute()
+                ).data or []
+                updates += 1
+                for fila in filas:
+                    resultados[fila["id"]] = {"id": fila["id"], "ok": True, "estado": destino}
+                    actualizados.append(fila["id"])
+
+        pendientes = [i for i in ids if i not in resultados]
+        if pendientes:
+            estados = {fila["id"]: int(fila["estado"]) for fila in self._leer_estados(pendientes)}
+            for i in pendientes:
+                if i not in estados:
+                    resultados[i] = {"id": i, "ok": False, "error": "Pedido no encontrado", "codigo": 404}
+                else:
+                    partida = esperado if esperado is not None else leidos.get(i, estados[i])
+                    resultados[i] = {"id": i, "ok": False, **_rechazo_estado(estados[i], partida, por_rol)}
+
+        if actualizados:
+            get_lecturas_cache().invalidar(LISTADOS, *(etiqueta_pedido(i) for i in actualizados))
+        print(
+            f"[ESTADO] Transición masiva paso={paso}: {len(actualizados)} de {len(ids)} pedidos "
+            f"({updates} UPDATE)"
         )
+        return {
+            "resultados": [resultados[i] for i in ids],
+            "actualizados": len(actualizados),
+            "errores": len(ids) - len(actualizados),
+        }
 
-        return response.data
+    def _leer_estados(self, ids):
+        filas = []
+        for trozo in _trozos(ids, PEDIDOS_BULK_CHUNK):
+            filas += (
+                supabase_admin
+                .table("pedidos")
+                .select("id, estado")
+                .in_("id", trozo)
+                .execute()
+            ).data or []
+        return filas
 
     # Eliminar pedido (solo admin/oficina)
     def eliminar_pedido(self, pedido_id):
@@ -530,6 +905,7 @@ class PedidosService:
             .eq("id", pedido_id)
             .execute()
         )
+        invalidar_pedido(pedido_id)
 
         return response.data
     
@@ -603,9 +979,10 @@ class PedidosService:
             rect = page.rect
             
             # Igualar la rotacion que aplicamos en el preview (para que la firma cuadre)
-            if rect.width > rect.height:
-                page.set_rotation(page.rotation + 270)
-                rect = page.rect 
+            rotacion = estimate_pdf_page_rotation(page, min_confidence=OCR_ORIENT_APPLY_CONF)
+            if rotacion:
+                page.set_rotation((page.rotation - rotacion) % 360)
+                rect = page.rect
             
             # La imagen de la firma enviada desde el frontend tiene el mismo aspect ratio 
             # y coordenadas relativas al documento completo
@@ -634,6 +1011,7 @@ class PedidosService:
             supabase_admin.table("pedidos").update({
                 "pdf_firmado": nombre_firmado
             }).eq("id", pedido_id).execute()
+            invalidar_pedido(pedido_id)
             print(f"[FIRMA] Pedido {pedido_id} pdf_firmado actualizado: {nombre_firmado}")
         except Exception as e:
             print(f"[FIRMA][ERROR] Error actualizando BD: {e}")
@@ -666,4 +1044,89 @@ class PedidosService:
         output.seek(0)
         
         return output
-        
\ No newline at end of file
+        
+
+
+def _clave_fila(fila):
+    def _numero(valor):
+        try:
+            return round(float(valor or 0), 3)
+        except (TypeError, ValueError):
+            return valor
+    return (fila.get('nombre_producto'), _numero(fila.get('cantidad')), _numero(fila.get('precio')))
+
+
+def _proyeccion(campos, productos=True):
+    """
+    Traduce `campos` ("a,b,productos") al select de pedidos.
+
+    Args:
+        productos: Si se incluyen los productos cuando no se piden campos
+
+    Returns:
+        Tupla (columnas para select, incluir productos); columnas es None si
+        algún nombre no es válido. El id va siempre.
+    """
+    if not campos or not campos.strip():
+        return "*", productos
+    nombres = [c.strip().lower() for c in campos.split(",") if c.strip()]
+    if not all(_CAMPO_VALIDO.match(n) for n in nombres):
+        return None, False
+    con_productos = "productos" in nombres
+    columnas = ["id"] + [n for n in nombres if n not in ("id", "productos")]
+    return ", ".join(dict.fromkeys(columnas)), con_productos
+
+
+def _fecha_filtro(valor, fin=False):
+    """
+    Límite de fecha_creacion para los filtros desde/hasta.
+
+    Returns:
+        Tupla (operador, fecha ISO), o None si no es una fecha
+    """
+    try:
+        fecha = datetime.fromisoformat(valor.strip())
+    except (AttributeError, ValueError):
+        return None
+    if not fin:
+        return "gte", fecha.isoformat()
+    if len(valor.strip()) == 10:
+        # Solo fecha: hasta el final de ese día
+        return "lt", (fecha + timedelta(days=1)).isoformat()
+    return "lte", fecha.isoformat()
+
+
+def _crear_cursor(pedido):
+    posicion = json.dumps([pedido.get("fecha_creacion"), pedido.get("id")])
+    return base64.urlsafe_b64encode(posicion.encode()).decode().rstrip("=")
+
+
+def _leer_cursor(cursor):
+    # Tupla (fecha_creacion, id) del último pedido de la página anterior, o None
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        fecha, pedido_id = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        datetime.fromisoformat(fecha)
+        return fecha, str(uuid.UUID(str(pedido_id)))
+    except (TypeError, ValueError):
+        return None
+
+
+def _trozos(lista, tamano):
+    for inicio in range(0, len(lista), max(1, tamano)):
+        yield lista[inicio:inicio + tamano]
+
+
+def _rechazo_estado(actual, esperado, por_rol):
+    """
+    Error de un UPDATE condicionado que no movió el pedido. Si el estado esperado
+    solo lo fija el rol (sin estado_esperado), el pedido no es de ese rol: 400 como
+    siempre. Si el cliente lo había leído así, otro usuario lo ha cambiado: 409.
+    """
+    if por_rol:
+        return {"error": "No puedes modificar este pedido en su estado actual", "codigo": 400, "estado_actual": actual}
+    return {
+        "error": f"El pedido está en el estado {actual}, no en {esperado}: otro usuario lo ha cambiado",
+        "codigo": 409,
+        "estado_actual": actual,
+    }
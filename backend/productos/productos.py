@@ -5,42 +5,36 @@
 #request --> Objeto de Flask que contiene datos de la solicitud HTTP, como JSON, parámetros de consulta, etc.
 #jsonify --> Función de Flask que convierte datos de Python a formato JSON para enviar respuestas HTTP.
 #supabase --> Biblioteca de Python para interactuar con Supabase, una plataforma de backend como servicio que ofrece una base de datos PostgreSQL, autenticación, almacenamiento y funciones en la nube.    
-#os --> Módulo de Python para interactuar con el sistema operativo, utilizado aquí para acceder a variables de entorno.
 #dotenv --> Biblioteca para cargar variables de entorno desde un archivo .env, lo que permite mantener las credenciales y configuraciones sensibles fuera del código fuente.
 
-import os
 from flask import request, jsonify, Blueprint
-from supabase import create_client, Client
 from database.supabase_client import supabase
 from database.supabase_client_admin import supabase_admin
+from database.supabase_pool import cliente_usuario
+from pedidos.cache import get_lecturas_cache, etiqueta_pedido, invalidar_pedido, etag_lectura
+from utils.etag import no_modificado, con_etag, respuesta_no_modificada
 from dotenv import load_dotenv
 from auth.jwt_handler import requiere_autenticacion, requiere_rol
 from utils.error_handler import respuesta_error
 from utils.validators import validar_cantidad
+from .productos_service import ProductosService
 
 load_dotenv()
 
 
 #Creamos el blueprint
 productos_bp = Blueprint('productos', __name__)
+service = ProductosService()
 
-# 2. Conectar con Supabase usando tus credenciales reales. Se leen de las variables de entorno para mantener la seguridad. No se hardcodean en el código fuente.
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-#Funcion auxiliar. Crea un cliente de Supabase utilizando el token de usuario. Clave para que funcionen las politicas de seguridad Row Level Security (RLS) en tu base de datos. Sin este paso, las consultas podrían no retornar datos o fallar debido a restricciones de acceso.
+#Funcion auxiliar. Devuelve un cliente de PostgREST con el token de usuario. Clave para que funcionen las politicas de seguridad Row Level Security (RLS) en tu base de datos. Sin este paso, las consultas podrían no retornar datos o fallar debido a restricciones de acceso.
+#No crea un cliente de Supabase por petición: reutiliza el pool HTTP compartido y solo cambia la cabecera Authorization (ver database/supabase_pool.py).
 def get_supabase_client(token):
-    return create_client(
-        SUPABASE_URL,
-        SUPABASE_KEY,
-        options={
-            "headers": {
-                #Pasamos el token de usuario autenticado. Supabase sabrá quien es y qué rol tiene.
-                "Authorization": f"Bearer {token}"
-            }
-        }
-    )
+    return cliente_usuario(token)
+
+#Funcion auxiliar. Invalida la caché de lecturas de los pedidos de las filas modificadas (update y delete devuelven las filas afectadas).
+def _invalidar_pedidos_de(filas):
+    for pedido_id in {fila.get("pedido_id") for fila in filas or []}:
+        invalidar_pedido(pedido_id)
 
 # --- RUTAS DE LA API ---
 
@@ -50,10 +44,18 @@ def get_supabase_client(token):
 def listar_productos(pedido_id):
     try:
 
-        # Ejecutamos la consulta
-        response = supabase_admin.table("pedido_productos").select("*").eq("pedido_id", pedido_id).execute()
+        # El cliente ya tiene esta versión de los productos: 304 sin consultar Supabase
+        etag = etag_lectura({etiqueta_pedido(pedido_id)})
+        if no_modificado(etag):
+            return respuesta_no_modificada(etag)
 
-        return jsonify(response.data), 200
+        # Ejecutamos la consulta (o la servimos de la caché de lecturas, misma clave que PedidosService.obtener_productos)
+        productos = get_lecturas_cache().leer(
+            ("productos", pedido_id), {etiqueta_pedido(pedido_id)},
+            lambda: supabase_admin.table("pedido_productos").select("*").eq("pedido_id", pedido_id).execute().data or []
+        )
+
+        return con_etag(jsonify(productos), etag), 200
 
     except Exception as e:
         print(f"ERROR CRÍTICO EN GET: {str(e)}")
@@ -84,6 +86,7 @@ def añadir_producto():
             "cantidad": datos['cantidad']
         }
         response = supabase.table("pedido_productos").insert(nueva_fila).execute()
+        invalidar_pedido(datos['pedido_id'])
 
         #Devolvemos la nueva fila insertada en formato JSON
         return jsonify(response.data), 201
@@ -111,6 +114,7 @@ def actualizar_producto(producto_id):
 
         # 2. Ejecutar con el cliente global para asegurar la escritura
         response = supabase.table("pedido_productos").update(payload).eq("id", producto_id).execute()
+        _invalidar_pedidos_de(response.data)
         
         # 3. Verificación de seguridad
         if not response.data:
@@ -136,6 +140,7 @@ def eliminar_producto(producto_id):
 
         # Eliminamos la fila de la tabla 'pedido_productos'
         response = supabase.table("pedido_productos").delete().eq("id", producto_id).execute()
+        _invalidar_pedidos_de(response.data)
 
         # Si no se eliminó ningún registro, significa que el producto no existe o ya fue eliminado. Devolvemos un mensaje de error.
         if not response.data:
@@ -145,3 +150,30 @@ def eliminar_producto(producto_id):
         return jsonify({"message": "Producto eliminado correctamente"}), 200
     except Exception as e:
         return respuesta_error(str(e), 400)
+
+
+# Altas, cambios y bajas de productos de un pedido en una sola petición (POST). Mismos roles que PUT y DELETE.
+# Cuerpo: {"crear": [{"nombre_producto", "cantidad", "precio"?}], "actualizar": [{"id", ...campos}], "eliminar": [ids]}
+# Responde 200 con el resultado de cada elemento (ok con la fila guardada, o error con su código).
+@productos_bp.route('/api/pedidos/<pedido_id>/productos/lote', methods=['POST'])
+@requiere_rol(["oficina", "almacen", "logistica", "admin"])
+def lote_productos(pedido_id):
+    try:
+        datos = request.get_json(silent=True)
+        if not isinstance(datos, dict):
+            return respuesta_error("Cuerpo JSON requerido", 400)
+
+        resultado = service.aplicar_lote(
+            pedido_id,
+            crear=datos.get("crear"),
+            actualizar=datos.get("actualizar"),
+            eliminar=datos.get("eliminar"),
+        )
+
+        if "error" in resultado:
+            return respuesta_error(resultado["error"], 400)
+
+        return jsonify(resultado), 200
+    except Exception as e:
+        print(f"[PRODUCTOS_LOTE][ERROR] {e}")
+        return respuesta_error(str(e), 500)
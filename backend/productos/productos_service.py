@@ -0,0 +1,190 @@
+import os
+
+from database.supabase_client import supabase
+from pedidos.cache import invalidar_pedido
+from utils.validators import validar_cantidad
+
+# Operaciones (crear + actualizar + eliminar) por petición en el endpoint de lote
+PRODUCTOS_LOTE_MAX = int(os.getenv('PRODUCTOS_LOTE_MAX', '500'))
+# Filas por petición a Supabase en las inserciones y actualizaciones del lote
+PRODUCTOS_LOTE_CHUNK = int(os.getenv('PRODUCTOS_LOTE_CHUNK', '500'))
+# Ids por petición en las bajas: van en la URL (id=in.(...)) y no deben pasar de los
+# ~16 KB que admiten muchos proxies delante de PostgREST
+PRODUCTOS_LOTE_IDS_CHUNK = int(os.getenv('PRODUCTOS_LOTE_IDS_CHUNK', '150'))
+
+# Columnas que se pueden crear o modificar desde el lote
+CAMPOS_EDITABLES = ("nombre_producto", "cantidad", "precio")
+
+
+class ProductosService:
+
+    # Aplica de una vez las altas, cambios y bajas de productos de un pedido (p. ej. al
+    # corregir un albarán de 30 líneas en ProductosTable), con un número acotado de
+    # llamadas a Supabase: una lectura de los productos del pedido, un DELETE, un upsert
+    # con los cambios y un INSERT con las altas (en trozos de PRODUCTOS_LOTE_CHUNK filas, y
+    # las bajas de PRODUCTOS_LOTE_IDS_CHUNK ids).
+    # Si un trozo falla se repite fila a fila para saber qué elementos fallan.
+    def aplicar_lote(self, pedido_id, crear=None, actualizar=None, eliminar=None):
+        """
+        Args:
+            pedido_id: Pedido al que pertenecen todos los productos
+            crear: Lista de {"nombre_producto", "cantidad", "precio"?}
+            actualizar: Lista de {"id", y alguno de "nombre_producto", "cantidad", "precio"}
+            eliminar: Lista de ids
+
+        Returns:
+            {"resultados": {"crear", "actualizar", "eliminar"}, "aplicados", "errores"},
+            con un resultado por elemento y en el mismo orden ({"indice", "ok",
+            "producto"} o {"indice", "ok", "error", "codigo"}), o {"error"} si el
+            cuerpo no es válido
+        """
+        crear, actualizar, eliminar = crear or [], actualizar or [], eliminar or []
+        if not all(isinstance(lista, list) for lista in (crear, actualizar, eliminar)):
+            return {"error": "crear, actualizar y eliminar deben ser listas"}
+        total = len(crear) + len(actualizar) + len(eliminar)
+        if not total:
+            return {"error": "El lote está vacío"}
+        if total > PRODUCTOS_LOTE_MAX:
+            return {"error": f"Como mucho {PRODUCTOS_LOTE_MAX} operaciones por lote"}
+
+        resultados = {
+            "crear": [None] * len(crear),
+            "actualizar": [None] * len(actualizar),
+            "eliminar": [None] * len(eliminar),
+        }
+
+        # Productos actuales del pedido: los cambios y bajas solo pueden tocar estos, y
+        # los cambios parciales se completan con ellos (el upsert necesita la fila entera)
+        actuales = {
+            str(fila["id"]): fila
+            for fila in supabase.table("pedido_productos").select("*").eq("pedido_id", pedido_id).execute().data or []
+        }
+
+        # Bajas
+        a_eliminar = {}
+        for indice, producto_id in enumerate(eliminar):
+            producto_id = str(producto_id)
+            if producto_id not in actuales:
+                resultados["eliminar"][indice] = _fallo(indice, "Producto no encontrado en el pedido", 404)
+            else:
+                a_eliminar.setdefault(producto_id, []).append(indice)
+
+        # Cambios
+        a_actualizar = []
+        for indice, datos in enumerate(actualizar):
+            producto_id = str(datos.get("id")) if isinstance(datos, dict) else None
+            if producto_id not in actuales:
+                resultados["actualizar"][indice] = _fallo(indice, "Producto no encontrado en el pedido", 404)
+                continue
+            if producto_id in a_eliminar:
+                resultados["actualizar"][indice] = _fallo(indice, "El producto también se elimina en este lote")
+                continue
+            cambios, error = _validar_campos(datos, parcial=True)
+            if error:
+                resultados["actualizar"][indice] = _fallo(indice, error)
+                continue
+            fila = {campo: actuales[producto_id].get(campo) for campo in CAMPOS_EDITABLES}
+            fila.update(cambios, id=actuales[producto_id]["id"], pedido_id=pedido_id)
+            a_actualizar.append((indice, fila))
+
+        # Altas
+        a_crear = []
+        for indice, datos in enumerate(crear):
+            fila, error = _validar_campos(datos if isinstance(datos, dict) else {}, parcial=False)
+            if error:
+                resultados["crear"][indice] = _fallo(indice, error)
+                continue
+            fila["pedido_id"] = pedido_id
+            a_crear.append((indice, fila))
+
+        aplicados = 0
+        if a_eliminar:
+            borrados = set()
+            ids = list(a_eliminar)
+            for inicio in range(0, len(ids), PRODUCTOS_LOTE_IDS_CHUNK):
+                borrados.update(
+                    str(fila["id"])
+                    for fila in supabase.table("pedido_productos").delete()
+                    .in_("id", ids[inicio:inicio + PRODUCTOS_LOTE_IDS_CHUNK]).eq("pedido_id", pedido_id)
+                    .execute().data or []
+                )
+            for producto_id, indices in a_eliminar.items():
+                for indice in indices:
+                    if producto_id in borrados:
+                        resultados["eliminar"][indice] = {"indice": indice, "ok": True, "id": producto_id}
+                    else:
+                        resultados["eliminar"][indice] = _fallo(indice, "Producto no encontrado o ya eliminado", 404)
+            aplicados += len(borrados)
+
+        for clave, filas, escribir in (
+            ("actualizar", a_actualizar, lambda f: supabase.table("pedido_productos").upsert(f, on_conflict="id")),
+            # default_to_null=False: una alta sin precio toma el valor por defecto de la columna
+            ("crear", a_crear, lambda f: supabase.table("pedido_productos").insert(f, default_to_null=False)),
+        ):
+            for indice, resultado in self._escribir(filas, escribir):
+                resultados[clave][indice] = resultado
+                aplicados += resultado["ok"]
+
+        if aplicados:
+            invalidar_pedido(pedido_id)
+
+        errores = sum(not r["ok"] for lista in resultados.values() for r in lista)
+        print(f"[PRODUCTOS_LOTE] pedido={pedido_id}: {aplicados} operaciones aplicadas, {errores} con error")
+        return {"resultados": resultados, "aplicados": aplicados, "errores": errores}
+
+    def _escribir(self, filas, escribir):
+        # (indice, resultado) de cada fila: en trozos y, si un trozo falla, fila a fila
+        for inicio in range(0, len(filas), PRODUCTOS_LOTE_CHUNK):
+            trozo = filas[inicio:inicio + PRODUCTOS_LOTE_CHUNK]
+            try:
+                guardadas = escribir([fila for _, fila in trozo]).execute().data or []
+                # PostgREST devuelve las filas en el orden en que se enviaron; si devuelve
+                # menos (RLS de lectura) el trozo está escrito igual y no se repite
+                completas = len(guardadas) == len(trozo)
+                for posicion, (indice, _) in enumerate(trozo):
+                    yield indice, {"indice": indice, "ok": True, "producto": guardadas[posicion] if completas else None}
+                continue
+            except Exception as e:
+                print(f"[PRODUCTOS_LOTE][ERROR] Escritura de {len(trozo)} filas fallida, fila a fila: {e}")
+            for indice, fila in trozo:
+                try:
+                    guardadas = escribir(fila).execute().data or []
+                    if guardadas:
+                        yield indice, {"indice": indice, "ok": True, "producto": guardadas[0]}
+                    else:
+                        yield indice, _fallo(indice, "Supabase no devolvió la fila guardada", 500)
+                except Exception as e:
+                    yield indice, _fallo(indice, str(e), 500)
+
+
+def _validar_campos(datos, parcial):
+    """
+    Valida y normaliza nombre_producto, cantidad (validar_cantidad) y precio
+    (admite coma decimal, como PUT /api/pedido-productos/<id>).
+
+    Returns:
+        Tupla (campos normalizados, mensaje de error o None)
+    """
+    campos = {}
+    if "nombre_producto" in datos or not parcial:
+        nombre = str(datos.get("nombre_producto") or "").strip()
+        if not nombre:
+            return None, "nombre_producto es requerido"
+        campos["nombre_producto"] = nombre
+    if "cantidad" in datos or not parcial:
+        cantidad = str(datos.get("cantidad", "")).replace(",", ".")
+        if not validar_cantidad(cantidad):
+            return None, "Cantidad inválida. Debe ser mayor que 0"
+        campos["cantidad"] = float(cantidad)
+    if datos.get("precio") not in (None, ""):
+        try:
+            campos["precio"] = float(str(datos["precio"]).replace(",", "."))
+        except ValueError:
+            return None, f"Precio inválido: {datos['precio']}"
+    if parcial and not campos:
+        return None, "No hay campos que actualizar"
+    return campos, None
+
+
+def _fallo(indice, error, codigo=400):
+    return {"indice": indice, "ok": False, "error": error, "codigo": codigo}
@@ -0,0 +1,100 @@
+"""
+Arranque del contenedor: web (gunicorn) y worker de OCR bajo un mismo supervisor.
+
+Uso (desde backend/, es el CMD del Dockerfile):
+    python servicios.py
+
+- SIGTERM/SIGINT se reenvían a los dos procesos: gunicorn cierra sus workers y el
+  worker de OCR termina el trabajo en curso (ver ocr/worker.py) antes de salir.
+  `docker stop` solo espera 10 s por defecto; con trabajos largos, `docker stop -t`
+  o `stop_grace_period` (si vence, el lease devuelve el trabajo a la cola).
+- Si el worker de OCR se cae, se relanza (con espera creciente si falla nada más
+  arrancar); los PDFs escaneados no se quedan en cola indefinidamente.
+- Si gunicorn termina, se para el worker y el contenedor sale con su código, para
+  que la política de reinicio del orquestador lo levante de nuevo.
+
+Para escalar por separado, lanzar `python -m ocr.worker` en su propio contenedor
+(con política de reinicio) compartiendo ocr/.cache, y OCR_WORKER_SUPERVISADO=0 aquí.
+"""
+import os
+import sys
+import time
+import signal
+import subprocess
+
+GUNICORN_CMD = [
+    'gunicorn', '--bind', f"0.0.0.0:{os.getenv('PORT', '5000')}",
+    '--workers', os.getenv('WEB_CONCURRENCY', '2'),
+    # Los streams de progreso del OCR (SSE) mantienen la conexión abierta y no deben
+    # ocupar uno de los dos workers entero
+    '--threads', '8',
+    '--timeout', '300',
+    '--access-logfile', '-', '--error-logfile', '-', '--capture-output', '--log-level', 'info',
+    'app:app',
+]
+WORKER_CMD = [sys.executable, '-m', 'ocr.worker']
+
+# Lanzar el worker de OCR en este contenedor (0 si va en uno propio)
+OCR_WORKER_SUPERVISADO = os.getenv('OCR_WORKER_SUPERVISADO', '1').strip().lower() in ('1', 'true', 'yes', 'on')
+# Segundos que se espera a que los procesos terminen tras la señal antes de matarlos
+SERVICIOS_STOP_TIMEOUT_SEC = float(os.getenv('SERVICIOS_STOP_TIMEOUT_SEC', '300'))
+# Un worker que dura menos que esto se considera fallo de arranque: la espera se dobla
+_ARRANQUE_MIN_SEC = 30
+_ESPERA_MAX_SEC = 60
+
+
+def main():
+    parando = False
+
+    def _parar(signum, frame):
+        nonlocal parando
+        print(f"[SERVICIOS] señal {signum}: parando web y worker de OCR", flush=True)
+        parando = True
+        for proceso in (web, worker):
+            if proceso is not None and proceso.poll() is None:
+                proceso.send_signal(signum)
+
+    web = worker = None
+    signal.signal(signal.SIGTERM, _parar)
+    signal.signal(signal.SIGINT, _parar)
+
+    web = subprocess.Popen(GUNICORN_CMD)
+    espera, relanzar_en, arrancado = 1.0, 0.0, 0.0
+    while not parando:
+        if web.poll() is not None:
+            print(f"[SERVICIOS][ERROR] gunicorn terminó con código {web.returncode}", flush=True)
+            break
+        if OCR_WORKER_SUPERVISADO:
+            if worker is not None and worker.poll() is not None:
+                duracion = time.time() - arrancado
+                espera = 1.0 if duracion >= _ARRANQUE_MIN_SEC else min(espera * 2, _ESPERA_MAX_SEC)
+                print(
+                    f"[SERVICIOS][ERROR] worker de OCR terminó con código {worker.returncode} "
+                    f"tras {duracion:.0f}s; se relanza en {espera:.0f}s", flush=True
+                )
+                worker, relanzar_en = None, time.time() + espera
+            if worker is None and time.time() >= relanzar_en:
+                worker, arrancado = subprocess.Popen(WORKER_CMD), time.time()
+        time.sleep(0.5)
+
+    # Parada: a los que sigan vivos (p. ej. gunicorn se cayó) también se les manda SIGTERM
+    for proceso in (web, worker):
+        if proceso is not None and proceso.poll() is None:
+            proceso.terminate()
+    limite = time.time() + SERVICIOS_STOP_TIMEOUT_SEC
+    for proceso in (worker, web):
+        if proceso is None:
+            continue
+        try:
+            proceso.wait(timeout=max(0.0, limite - time.time()))
+        except subprocess.TimeoutExpired:
+            print(f"[SERVICIOS][ERROR] pid={proceso.pid} no terminó a tiempo; se mata", flush=True)
+            proceso.kill()
+            proceso.wait()
+
+    # Caída de gunicorn: código distinto de 0 aunque saliera limpio, para que se reinicie
+    sys.exit(0 if parando else (web.returncode or 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+from flask import request, Response
+
+
+def no_modificado(etag):
+    # El cliente ya tiene esta versión (If-None-Match)
+    return bool(etag) and request.if_none_match.contains_weak(etag)
+
+
+def con_etag(respuesta, etag):
+    """
+    Añade el ETag (débil: el JSON puede serializarse distinto con el mismo
+    contenido) y obliga a revalidar siempre: el navegador guarda la respuesta,
+    manda If-None-Match y reutiliza su copia si la API contesta 304.
+    """
+    if etag:
+        respuesta.set_etag(etag, weak=True)
+        respuesta.headers["Cache-Control"] = "private, no-cache"
+        respuesta.vary.add("Authorization")
+    return respuesta
+
+
+def respuesta_no_modificada(etag):
+    return con_etag(Response(status=304), etag)